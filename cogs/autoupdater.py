@@ -7,20 +7,23 @@
 # Error/No: ❌
 
 import asyncio
+import collections
 import datetime
-from typing import Optional, List, Union, Callable, Dict, Any
+import functools
+from typing import Optional, List, Union, Callable
 
 import discord
-from discord.ext import tasks, commands
+from discord.ext import commands
 
-import utils.api as covid19api
 import utils.embeds as embeds
 from utils import autoupdater
+from utils.caching import TTLCache
 from utils.cog_class import Cog
-from utils.ctx_class import MyContext
+from utils.ctx_class import MyContext, UpdaterContext
 from utils.custom_updaters import InvalidKeyError, CustomUpdater
 from utils.human_time import ShortTime, human_timedelta, FutureTime
 from utils.models import get_from_db, DiscordChannel, AutoupdaterData, DiscordGuild, AutoupdateTypes
+from utils.updater_scheduler import UpdaterScheduler, RETRY_DELAY
 
 utc_zero = datetime.datetime.utcfromtimestamp(-1)
 
@@ -31,10 +34,47 @@ class AutoUpdaterCog(Cog):
     def __init__(self, bot, *args, **kwargs):
         super().__init__(bot, *args, **kwargs)
         self.index = 0
-        self.push_auto_updates.start()
+        self.scheduler = UpdaterScheduler(self.run_update)
+        self.render_cache = autoupdater.RenderCache()
+        self.guild_languages = TTLCache(autoupdater.RENDER_TTL)
+        self.delivery: collections.Counter = collections.Counter()
+        self.load_task = self.bot.loop.create_task(self.load_updaters())
 
     def cog_unload(self):
-        self.push_auto_updates.cancel()
+        self.load_task.cancel()
+        self.scheduler.stop()
+
+    async def load_updaters(self):
+        """
+        Loads every enabled updater into the scheduler, and starts it. From then on, the commands keep the scheduler in
+        sync with the database, so the whole table is never scanned again.
+        """
+        await self.bot.wait_until_ready()
+        for updater in await AutoupdaterData.filter(already_set=True):
+            self.schedule_updater(updater)
+        self.bot.logger.info(f"Scheduled {len(self.scheduler)} autoupdaters.")
+        self.scheduler.start(self.bot.loop)
+
+    def schedule_updater(self, updater: AutoupdaterData):
+        self.scheduler.schedule(updater.id, next_update_at(updater), updater)
+
+    async def get_language(self, guild: discord.Guild) -> str:
+        language = self.guild_languages.get(guild.id)
+        if language is None:
+            language = self.guild_languages[guild.id] = (await get_from_db(guild)).language
+        return language
+
+    def stats(self) -> dict:
+        updates = self.delivery["updates"]
+        return {"scheduler": self.scheduler.stats(),
+                "rendering": self.render_cache.stats(),
+                "delivery": {"updates": updates,
+                             "api_calls": self.delivery["api_calls"],
+                             "api_calls_per_update": self.delivery["api_calls"] / updates if updates else None,
+                             # building a MyContext took a channel.history request and a get_context (with its
+                             # prefix query) for every update, plus a message sent and deleted in empty channels
+                             "history_requests_avoided": updates,
+                             "get_context_calls_avoided": updates}}
 
     async def do_initial_checks(self, ctx: MyContext, db_guild: DiscordGuild, db_channel: DiscordChannel,
                                 delta_seconds: int, _: Callable, *, requires_vote: bool = False,
@@ -204,6 +244,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting stats for {0} in this channel every {1}.", "OT", human_update_time))
 
@@ -246,6 +287,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting stats for {0} in this channel every {1}.",
                           friendly_country_name, human_update_time))
@@ -273,9 +315,8 @@ class AutoUpdaterCog(Cog):
             await ctx.reply(_("❌ Failed to get a ISO2 code for the country! `/list` will show you a list of countries "
                               "and their IDs."))
         elif info[0] == "country":
-            country_list = await self.bot.worldometers_api.get_all_iso_codes()
-            iso2_code = covid19api.get_iso2_code(country, country_list)
-            friendly_country_name = covid19api.get_country_name(country, country_list)
+            record = self.bot.country_registry.lookup(info[1])
+            iso2_code, friendly_country_name = record.iso2, record.country
         else:
             cmd_usage = "{0}autoupdate {1} {2}".format(ctx.prefix, info[0], '' if info[0] != 'world' else country)
             await ctx.reply(_("I found a {0} instead of a country! You can try `{1}` instead.", info[0], cmd_usage))
@@ -289,6 +330,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting stats for {0} in this channel every {1}.",
                           friendly_country_name, human_update_time))
@@ -325,6 +367,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting stats for {0} in this channel every {1}.",
                           friendly_country_name, human_update_time))
@@ -368,6 +411,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting stats for {0} in this channel every {1}.",
                           friendly_country_name, human_update_time))
@@ -407,6 +451,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting a map for {0} in this channel every {1}.",
                           map_type.replace("_", " ").title(), human_update_time))
@@ -451,6 +496,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting a {0} graph for {1} in this channel every {2}.",
                           _("logarithmic") if logarithmic else _("linear"), "world", human_update_time))
@@ -481,8 +527,7 @@ class AutoUpdaterCog(Cog):
                               "and their IDs."))
             return
         elif info[0] == "country":
-            country_list = await self.bot.worldometers_api.get_all_iso_codes()
-            friendly_country_name = covid19api.get_country_name(country, country_list)
+            friendly_country_name = self.bot.country_registry.get_country_name(info[1])
         else:
             cmd_usage = f"{ctx.prefix}autoupdate graphs {info[0]} {'' if info[0] != 'world' else country}"
             await ctx.reply(_("I found a {0} instead of a country! You can try `{1}` instead.", info[0], cmd_usage))
@@ -499,6 +544,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting a {0} graph for {1} in this channel every {2}.",
                           _("logarithmic") if logarithmic else _("linear"), friendly_country_name, human_update_time))
@@ -545,6 +591,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting a {0} graph for {1} in this channel every {2}.",
                           _("logarithmic") if logarithmic else _("linear"), friendly_country_name, human_update_time))
@@ -592,6 +639,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting a {0} graph for {1} in this channel every {2}.",
                           _("logarithmic") if logarithmic else _("linear"), friendly_country_name, human_update_time))
@@ -654,6 +702,7 @@ class AutoUpdaterCog(Cog):
         await db_guild.save()
         await db_channel.autoupdater.add(ad_data)
         await db_channel.save()
+        self.schedule_updater(ad_data)
 
         await ctx.reply(_("✅ Posting a custom updater in this channel every {0}.", human_update_time))
 
@@ -681,6 +730,7 @@ class AutoUpdaterCog(Cog):
         if _id == "all":
             await db_channel.autoupdater.clear()
             async for ad in AutoupdaterData().filter(discord_id=ctx.channel.id):
+                self.scheduler.cancel(ad.id)
                 await ad.delete()
             db_channel.guild.used_updaters -= total_updaters
             await db_channel.guild.save()
@@ -688,6 +738,7 @@ class AutoUpdaterCog(Cog):
             await ctx.reply(_("✅ Deleted all autoupdaters in this channel."))
         else:
             async for ad in AutoupdaterData().filter(discord_id=ctx.channel.id, id=_id):
+                self.scheduler.cancel(ad.id)
                 await ad.delete()
                 break
             else:
@@ -729,8 +780,9 @@ class AutoUpdaterCog(Cog):
             await ctx.reply(_("❌ You don't have a autoupdater set here or the ID you sent is invalid!"))
             return
         updater.force_update = True
-        await updater.save()
+        await updater.save(update_fields=["force_update"])
         await db_channel.save()
+        self.schedule_updater(updater)
         await ctx.reply(_("✅ Forcing a update sometime in the next minute."))
 
     @autoupdate.command(name="update_at")
@@ -749,104 +801,130 @@ class AutoUpdaterCog(Cog):
             await self.update_at.reset_cooldown(ctx)
             return
         updater.do_update_at = time_to_update_at
+        await updater.save(update_fields=["do_update_at"])
         await db_channel.save()
+        self.schedule_updater(updater)
         await ctx.reply(_("✅ Next update: {0}", human_timedelta(time_to_update_at)))
 
-    @tasks.loop(minutes=1.0)
-    async def push_auto_updates(self):
-        self.bot.logger.info("Starting autoupdater...")
-        db_channels = await AutoupdaterData.filter(already_set=True)
-        channels_to_parse = []
-        for db_channel in db_channels:
-            channel: discord.TextChannel = self.bot.get_channel(db_channel.discord_id)
-            if channel is None:
-                continue
-            db_data = await get_from_db(channel)
-            channels_to_parse.append([db_channel, channel, db_data])
-        self.bot.logger.info(f"Updating in {len(channels_to_parse)} channels.")
-        sized_list = split_seq(channels_to_parse, 100)  # split into chunks of 100: as of this writing there's
-        # only 137 heh
-        # next part seems weird, but it seems to give me a 10 to 1,000 times speedup (over three minutes cut down to
-        # less than 1 second)
-        loop = asyncio.get_event_loop()
-        futures = []
-        for sublist in sized_list:
-            futures.append(loop.create_task(self.run_updates_in_channels(sublist)))
-        for future in futures:
-            await future
-        self.bot.logger.info("Done autoupdater!")
-
-    @push_auto_updates.before_loop
-    async def before_updates_pushed(self):
-        await self.bot.wait_until_ready()
+    @autoupdate.command(name="edit_in_place", aliases=["edit"])
+    async def edit_in_place(self, ctx: MyContext, _id: int, enabled: bool):
+        """
+        Makes a autoupdater edit its last message instead of posting a new one every time.
+        Pass a autoupdater ID, and on or off.
+        """
+        _ = await ctx.get_translate_function()
+        updater = await get_updater(str(_id), ctx)
+        if not updater:
+            await ctx.reply(_("❌ You don't have a autoupdater set here or the ID you sent is invalid!"))
+            return
+        updater.edit_in_place = enabled
+        updater.message_id = None
+        updater.payload_hash = None
+        await updater.save(update_fields=["edit_in_place", "message_id", "payload_hash"])
+        self.schedule_updater(updater)
+        if enabled:
+            await ctx.reply(_("✅ Autoupdater {0} will now edit its last message instead of posting a new one.", _id))
+        else:
+            await ctx.reply(_("✅ Autoupdater {0} will now post a new message every time.", _id))
 
-    async def run_updates_in_channels(self, channels: List[list]):
-        for channel_data in channels:
-            updater: AutoupdaterData = channel_data[0]
-            channel: discord.TextChannel = channel_data[1]
-            db_channel: DiscordChannel = channel_data[2]
-            now = datetime.datetime.utcnow()
-            if updater.force_update:
-                updater.force_update = False
-            elif updater.do_update_at != utc_zero:
-                delta: datetime.timedelta = now - updater.do_update_at
-                if delta.total_seconds() > 60:
-                    continue
-                updater.do_update_at = utc_zero
-                updater.last_updated = now
-            else:
-                delta: datetime.timedelta = now - updater.last_updated
-                if not delta.total_seconds() >= updater.delay:
-                    continue
-                updater.last_updated = now
-            country = updater.country_name
-            msg_to_send: Optional[Dict[str, Any]] = None
-            self.bot.logger.debug(f"Updater {updater.id} in {updater.discord_id} is updating for {country}, and firing "
-                                  f"every {updater.last_updated} seconds, and type is {updater.type}")
+    async def run_update(self, updater: AutoupdaterData) -> Optional[datetime.datetime]:
+        """
+        Posts an updater that is due. Called by the scheduler.
+
+        :return: When the updater is next due, or None if it's been disabled.
+        """
+        channel: discord.TextChannel = self.bot.get_channel(updater.discord_id)
+        if channel is None:  # not cached (or deleted), try again at the next regular update
+            return datetime.datetime.utcnow() + datetime.timedelta(seconds=max(updater.delay, RETRY_DELAY))
+        country = updater.country_name
+        self.bot.logger.debug(f"Updater {updater.id} in {updater.discord_id} is updating for {country}, and firing "
+                              f"every {updater.delay} seconds, and type is {updater.type}")
+        language = await self.get_language(channel.guild)
+        ctx = UpdaterContext(self.bot, channel, language)
+        last_message = (updater.message_id, updater.payload_hash)
+        try:
+            # every updater showing the same thing in the same language shares one render
+            key = (updater.type, country, language, autoupdater.data_version(self.bot, updater.type))
+            rendered = await self.render_cache.get(key, functools.partial(autoupdater.render, ctx, updater.type,
+                                                                          country))
+            if rendered is None:
+                raise ValueError(f"Nothing to send for {country} ({updater.type})")
+            await self.deliver(ctx, updater, rendered)
+        except discord.Forbidden:
+            # how da hell did that happen? should've been caught earlier
+            self.bot.logger.info("No permissions to send messages here!",
+                                 channel=channel, guild=channel.guild)
+            updater.already_set = False  # no perms? heh: have fun
+            await updater.save(update_fields=["already_set"])
+            return None
+        except Exception as e:
+            self.bot.logger.exception("Exception in autoupdater!", guild=channel.guild, channel=channel,
+                                      exc_info=e)
+            # Since it failed this time, don't save it and try again soon.
+            return datetime.datetime.utcnow() + datetime.timedelta(seconds=RETRY_DELAY)
+        finally:
+            self.delivery["updates"] += 1
+            self.delivery["api_calls"] += ctx.api_calls
+        now = datetime.datetime.utcnow()
+        if updater.force_update:
+            updater.force_update = False
+        elif updater.do_update_at != utc_zero:
+            updater.do_update_at = utc_zero
+            updater.last_updated = now
+        else:
+            updater.last_updated = now
+        await updater.save(update_fields=["last_updated", "force_update", "do_update_at"])
+        if updater.edit_in_place and (updater.message_id, updater.payload_hash) != last_message:
+            # only if edit_in_place wasn't toggled while this was running (that resets message_id)
+            filters = {"message_id": last_message[0]} if last_message[0] is not None else {"message_id__isnull": True}
+            await AutoupdaterData.filter(id=updater.id, edit_in_place=True, **filters) \
+                .update(message_id=updater.message_id, payload_hash=updater.payload_hash)
+        return next_update_at(updater)
+
+    async def deliver(self, ctx: UpdaterContext, updater: AutoupdaterData, rendered: autoupdater.Rendered):
+        """
+        Posts a rendered update, or with edit_in_place, edits the message posted last time (if there's one and it
+        still exists). Edits are skipped when the message already shows the same thing.
+        """
+        channel = ctx.channel
+        queue = self.bot.delivery_queue
+        if updater.edit_in_place and updater.message_id is not None:
+            if rendered.digest == updater.payload_hash:
+                self.delivery["edits_skipped"] += 1
+                return
+            message = channel.get_partial_message(updater.message_id)
             try:
-                async for msg in channel.history(limit=1):
-                    ctx = await self.bot.get_context(msg, cls=MyContext)
-                    msg1 = None
-                    break
-                else:
-                    self.bot.logger.debug(f"Updater {updater.id} has no messages in channel, sending one")
-                    # discord DOES accept empty strings... until you load it up in your IDE
-                    msg1 = await channel.send("​")
-                    ctx = await self.bot.get_context(msg1, cls=MyContext)
-                if updater.type == AutoupdateTypes.world:
-                    msg_to_send = await autoupdater.world(ctx)
-                elif updater.type == AutoupdateTypes.continent:
-                    msg_to_send = await autoupdater.continent(ctx, country)
-                elif updater.type == AutoupdateTypes.country:
-                    msg_to_send = await autoupdater.country(ctx, country)
-                elif updater.type == AutoupdateTypes.state:
-                    msg_to_send = await autoupdater.state(ctx, country)
-                elif updater.type == AutoupdateTypes.province:
-                    msg_to_send = await autoupdater.province(ctx, country)
-                elif updater.type == AutoupdateTypes.graph:
-                    msg_to_send = await autoupdater.graph(ctx, country)
-                elif updater.type == AutoupdateTypes.map:
-                    msg_to_send = await autoupdater.maps(ctx, country)
-                elif updater.type == AutoupdateTypes.custom:
-                    msg_to_send = await autoupdater.custom(ctx, country)
-                await channel.send(**msg_to_send)
-                if msg1:
-                    await msg1.delete()
-            except Exception as e:
-                if isinstance(e, discord.Forbidden):
-                    # how da hell did that happen? should've been caught earlier
-                    self.bot.logger.info("No permissions to send messages here!",
-                                         channel=channel, guild=channel.guild)
-                    updater.already_set = False  # no perms? heh: have fun
-                    await updater.save()
-                    await db_channel.save()
-                else:
-                    self.bot.logger.exception("Exception in autoupdater!", guild=channel.guild, channel=channel,
-                                              exc_info=e)
-                # Since it failed this time, don't save it and force a update at next loop.
-                continue
-            await updater.save()
-            await db_channel.save()
+                if not rendered.attachments:
+                    ctx.api_calls += 1
+                    await queue.submit(channel.id, functools.partial(message.edit, content=rendered.content,
+                                                                     embed=rendered.embed), idempotent=True)
+                    updater.payload_hash = rendered.digest
+                    self.delivery["edits"] += 1
+                    return
+                # edits can't replace attachments: post the new one and remove the old one
+                ctx.api_calls += 1
+                await queue.submit(channel.id, message.delete, idempotent=True)
+            except discord.NotFound:  # deleted by someone, post a new one
+                self.delivery["edit_fallbacks"] += 1
+        ctx.api_calls += 1
+        # send_kwargs makes new files every time, so the queue can retry it
+        message = await queue.submit(channel.id, lambda: channel.send(**rendered.send_kwargs()))
+        self.delivery["posts"] += 1
+        if updater.edit_in_place:
+            updater.message_id = message.id
+            updater.payload_hash = rendered.digest
+
+
+def next_update_at(updater: AutoupdaterData) -> datetime.datetime:
+    """
+    Returns when an updater is next due: right away if it's being forced, at the time set with update_at if there's one,
+    or else delay seconds after its last update.
+    """
+    if updater.force_update:
+        return datetime.datetime.utcnow()
+    if updater.do_update_at != utc_zero:
+        return updater.do_update_at
+    return updater.last_updated + datetime.timedelta(seconds=updater.delay)
 
 
 async def get_updater(_id: Union[str, int], ctx: MyContext, *, allow_all: bool = False) -> \
@@ -870,12 +948,4 @@ async def get_updater(_id: Union[str, int], ctx: MyContext, *, allow_all: bool =
             return ad
 
 
-def split_seq(seq, size):
-    new_seq = []
-    split_size = 1.0 / size * len(seq)
-    for i in range(size):
-        new_seq.append(seq[int(round(i * split_size)):int(round((i + 1) * split_size))])
-    return new_seq
-
-
 setup = AutoUpdaterCog.setup
@@ -1,7 +1,4 @@
 # coding=utf-8
-from discord.ext import tasks
-
-from utils.async_helpers import wrap_in_async
 from utils.bot_class import MyBot
 from utils.cog_class import Cog
 from cogs.error_handling import submit_error_message
@@ -9,54 +6,24 @@ from cogs.error_handling import submit_error_message
 
 class BackgroundUpdates(Cog):
     def __init__(self, bot: MyBot, *args, **kwargs):
+        """
+        Keeps the stats up to date in the background. The sources, their periods and dependencies are set up in
+        MyBot._add_refresh_sources: this only runs bot.refresh_scheduler while the cog is loaded.
+        """
         super().__init__(bot, *args, **kwargs)
-        self.index = 0
-        self.updaters = [
-            self.update_worldometers_stats,
-            self.update_jhucsse_stats,
-            self.update_vaccine_stats,
-            self.update_owid_stats,
-            self.update_maps
-        ]
-        for updater in self.updaters:
-            updater: tasks.Loop
-            updater.start()
-            updater.error(self.handle_error)
-
-    def cog_unload(self):
-        for updater in self.updaters:
-            updater: tasks.Loop
-            updater.clear_exception_types()  # just in case it throws a exception, we don't want it to keep trying.
-            updater.stop()
+        self.bot.refresh_scheduler.on_error = self.handle_error
+        self.bot.loop.create_task(self.start_scheduler())
 
-    @tasks.loop(minutes=5)
-    async def update_worldometers_stats(self):
+    async def start_scheduler(self):
         await self.bot.wait_until_ready()
-        await self.bot.worldometers_api.update_covid_19_virus_stats()
+        self.bot.refresh_scheduler.start(self.bot.loop)
 
-    @tasks.loop(minutes=15)
-    async def update_jhucsse_stats(self):
-        await self.bot.wait_until_ready()
-        await self.bot.jhucsse_api.update_covid_19_virus_stats()
-
-    @tasks.loop(hours=12)
-    async def update_vaccine_stats(self):
-        await self.bot.wait_until_ready()
-        await self.bot.vaccine_api.update_covid_19_vaccine_stats()
-
-    @tasks.loop(hours=12)
-    async def update_owid_stats(self):
-        await self.bot.wait_until_ready()
-        await self.bot.owid_api.update_covid_19_owid_data()
-
-    @tasks.loop(hours=24)
-    async def update_maps(self):
-        await self.bot.wait_until_ready()
-        # selenium hates being run in another process
-        await wrap_in_async(self.bot.maps_api.download_maps, thread_pool=True)
+    def cog_unload(self):
+        self.bot.refresh_scheduler.stop()
+        self.bot.refresh_scheduler.on_error = None
 
-    async def handle_error(self, error: BaseException):
-        await submit_error_message(error, "updating stats", self.bot)
+    async def handle_error(self, source: str, error: BaseException):
+        await submit_error_message(error, f"updating {source} stats", self.bot)
 
 
 setup = BackgroundUpdates.setup
@@ -5,6 +5,7 @@ from discord.ext import commands, tasks
 
 from utils import api as covid19api
 from utils import embeds
+from utils.ai_system import format_suggestions
 from utils.cog_class import Cog
 from utils.ctx_class import MyContext
 
@@ -52,7 +53,11 @@ class CovidCog(Cog):
         real_name = await self.bot.worldometers_api.try_to_get_name(continent_name)
         if real_name is None or real_name[0] != "continent":
             _ = await ctx.get_translate_function()
-            await ctx.reply(_("Didn't find any continents with that name!"))
+            msg = _("Didn't find any continents with that name!")
+            suggestions = await self.bot.worldometers_api.suggest_names(continent_name, "continent")
+            if suggestions:
+                msg += " " + _("Did you mean {0}?", format_suggestions(suggestions))
+            await ctx.reply(msg)
         else:
             emb = await embeds.advanced_stats_embed(real_name, ctx=ctx)
             await ctx.reply(embed=emb)
@@ -83,6 +88,9 @@ class CovidCog(Cog):
                     msg = _(
                         "Didn't find a country with that name, or the country has no cases! Try searching for the name "
                         "with `{0}list country`.", ctx.prefix)
+                suggestions = await self.bot.worldometers_api.suggest_names(country, "country")
+                if suggestions:
+                    msg += "\n" + _("Did you mean {0}?", format_suggestions(suggestions))
                 await ctx.reply(msg)
             elif country_test[0] != "country":
                 await ctx.reply(_("You've used a incorrect command: try `{0}covid {1}`", ctx.prefix, country_test[0]))
@@ -103,6 +111,9 @@ class CovidCog(Cog):
                     msg = _(
                         "Didn't find a country with that name, or the country has no cases! Try searching for the name "
                         "with `{0}list country`.", ctx.prefix)
+                suggestions = await self.bot.worldometers_api.suggest_names(country_name, "country")
+                if suggestions:
+                    msg += "\n" + _("Did you mean {0}?", format_suggestions(suggestions))
                 await ctx.reply(msg)
                 return
             for e1 in e:
@@ -115,9 +126,14 @@ class CovidCog(Cog):
         If the province name has spaces, it does NOT need to be wrapped in quotes.
         """
         _ = await ctx.get_translate_function()
+        province_name = province
         province = await self.bot.jhucsse_api.try_to_get_name(province)
         if province is None:
-            await ctx.reply(_("Didn't find any provinces with that name!"))
+            msg = _("Didn't find any provinces with that name!")
+            suggestions = await self.bot.jhucsse_api.suggest_names(province_name, "province")
+            if suggestions:
+                msg += " " + _("Did you mean {0}?", format_suggestions(suggestions))
+            await ctx.reply(msg)
             return
         elif province[0] != "province":
             cmd_usage = f"`{ctx.prefix}covid {province[0]}`"
@@ -152,7 +168,11 @@ class CovidCog(Cog):
         _ = await ctx.get_translate_function()
         state_test = await self.bot.worldometers_api.try_to_get_name(state)
         if state_test is None:
-            await ctx.reply(_("Didn't find a state with that name! For a list, run `{0}list states`.", ctx.prefix))
+            msg = _("Didn't find a state with that name! For a list, run `{0}list states`.", ctx.prefix)
+            suggestions = await self.bot.worldometers_api.suggest_names(state, "state")
+            if suggestions:
+                msg += " " + _("Did you mean {0}?", format_suggestions(suggestions))
+            await ctx.reply(msg)
         elif state_test[0] != "state":
             await ctx.reply(_("That isn't a state! Try the `{0}covid {1}` command.", ctx.prefix, state_test[0]))
         else:
@@ -167,19 +187,14 @@ class CovidCog(Cog):
             await self.bot.worldometers_api.logger.exception("Fatal error while updating stats!")
         # Well that was simple :P
 
-    # ignore it here, as it may not be in the correct state
-    # noinspection PyProtectedMember
     @commands.command(name="force_stats_update", hidden=True)
     async def stats_update(self, ctx: MyContext):
         await ctx.send("Loading...")
-        try:
-            await self.bot._worldometers_api.update_covid_19_virus_stats()
-            await self.bot._jhucsse_api.update_covid_19_virus_stats()
-            await self.bot._vaccine_api.update_covid_19_vaccine_stats()
-            await self.bot._owid_api.update_covid_19_owid_data()
-        except Exception:
-            await ctx.send("Encountered error while updating. This error has been logged.")
-            raise
+        scheduler = self.bot.refresh_scheduler
+        failed = [name for name in ("worldometers", "jhucsse", "vaccine", "owid")
+                  if not await scheduler.run_now(name)]
+        if failed:
+            await ctx.send(f"Encountered error while updating {', '.join(failed)}. This error has been logged.")
         else:
             await ctx.send("Updated successfully!")
 
@@ -10,6 +10,8 @@ import discord
 from discord.ext import commands
 
 from utils import graphs
+from utils.ai_system import format_suggestions
+from utils.api import BaseAPIException
 from utils.async_helpers import wrap_in_async
 from utils.caching import TTLCache
 from utils.cog_class import Cog
@@ -97,12 +99,17 @@ class GraphsCog(Cog):
         logarithmic graph. If the 2nd argument is False, it will instead generate a linear graph.
         """
         _ = await ctx.get_translate_function()
-        name = await self.bot.jhucsse_api.try_to_get_name(name)
-        if name is None:
+        name_test = await self.bot.jhucsse_api.try_to_get_name(name)
+        if name_test is None:
             cmd_usage = f"`{ctx.prefix}list`"
-            await ctx.reply(_("That isn't a valid name! Check out {0} for a list of all names I can get data for!",
-                              cmd_usage))
-        elif name[0] != "country":
+            msg = _("That isn't a valid name! Check out {0} for a list of all names I can get data for!", cmd_usage)
+            suggestions = await self.bot.jhucsse_api.suggest_names(name, "country")
+            if suggestions:
+                msg += " " + _("Did you mean {0}?", format_suggestions(suggestions))
+            await ctx.reply(msg)
+            return
+        name = name_test
+        if name[0] != "country":
             await ctx.reply(_("I found a {0} instead of a country!", name[0]))
         else:
             data = await self.bot.jhucsse_api.get_country_stats(name[1])
@@ -117,12 +124,17 @@ class GraphsCog(Cog):
         logarithmic graph. If the 2nd argument is False, it will instead generate a linear graph.
         """
         _ = await ctx.get_translate_function()
-        name = await self.bot.jhucsse_api.try_to_get_name(name)
-        if name is None:
+        name_test = await self.bot.jhucsse_api.try_to_get_name(name)
+        if name_test is None:
             cmd_usage = f"`{ctx.prefix}list`"
-            await ctx.reply(_("That isn't a valid name! Check out {0} for a list of all names I can get data for!",
-                              cmd_usage))
-        elif name[0] != "province":
+            msg = _("That isn't a valid name! Check out {0} for a list of all names I can get data for!", cmd_usage)
+            suggestions = await self.bot.jhucsse_api.suggest_names(name, "province")
+            if suggestions:
+                msg += " " + _("Did you mean {0}?", format_suggestions(suggestions))
+            await ctx.reply(msg)
+            return
+        name = name_test
+        if name[0] != "province":
             cmd_usage = f"`{ctx.prefix}graphs {name[0]}`"
             await ctx.reply(_("I found a {0} instead of a province! Try {1} instead.", name[0], cmd_usage))
         else:
@@ -138,18 +150,58 @@ class GraphsCog(Cog):
         logarithmic graph. If the 2nd argument is False, it will instead generate a linear graph.
         """
         _ = await ctx.get_translate_function()
-        name = await self.bot.jhucsse_api.try_to_get_name(name)
-        if name is None:
+        name_test = await self.bot.jhucsse_api.try_to_get_name(name)
+        if name_test is None:
             cmd_usage = f"`{ctx.prefix}list`"
-            await ctx.reply(_("That isn't a valid name! Check out {0} for a list of all names I can get data for!",
-                              cmd_usage))
-        elif name[0] != "state":
+            msg = _("That isn't a valid name! Check out {0} for a list of all names I can get data for!", cmd_usage)
+            suggestions = await self.bot.jhucsse_api.suggest_names(name, "state")
+            if suggestions:
+                msg += " " + _("Did you mean {0}?", format_suggestions(suggestions))
+            await ctx.reply(msg)
+            return
+        name = name_test
+        if name[0] != "state":
             cmd_usage = f"`{ctx.prefix}graphs {name[0]}`"
             await ctx.reply(_("I found a {0} instead of a state! Try {1} instead.", name[0], cmd_usage))
         else:
             data = await self.bot.jhucsse_api.get_state_stats(name[1])
             await self.process_graphs(ctx, name, data["timeline"], _, log)
 
+    @graphs.command()
+    async def daily(self, ctx: MyContext, *, name: str = "world"):
+        """
+        Graph of the new cases and deaths of every day, with their 7 day averages, for the world or any given country,
+        province or US state.
+        """
+        _ = await ctx.get_translate_function()
+        name_test = await self.bot.jhucsse_api.try_to_get_name(name)
+        if name_test is None:
+            cmd_usage = f"`{ctx.prefix}list`"
+            msg = _("That isn't a valid name! Check out {0} for a list of all names I can get data for!", cmd_usage)
+            suggestions = await self.bot.jhucsse_api.suggest_names(name, "country", "province", "state")
+            if suggestions:
+                msg += " " + _("Did you mean {0}?", format_suggestions(suggestions))
+            await ctx.reply(msg)
+            return
+        name = name_test
+        try:
+            data = await self.bot.jhucsse_api.get_derived_stats(*name)
+        except BaseAPIException:
+            await ctx.reply(_("I don't have any daily data for {0}!", name[1].title() if name[1] else "world"))
+            return
+        buffer_name = f"{name[1].title() if name[1] else 'world'}_daily"
+        graph_buffer = graph_cache.get(buffer_name)
+        if not graph_buffer:
+            graph_buffer = await wrap_in_async(graphs.generate_daily_plot, data,
+                                               name[1].title() if name[1] else "world", thread_pool=True)
+            graph_cache[buffer_name] = deepcopy(graph_buffer)
+        else:
+            graph_buffer = copy(graph_buffer)
+        f = discord.File(graph_buffer, filename="image.png")
+        e = discord.Embed(title=_("Daily graph for {0}", name[1].title() if name[1] else 'world'))
+        e.set_image(url="attachment://image.png")
+        await ctx.send(file=f, embed=e)
+
     @graphs.command()
     async def continent(self, ctx: MyContext):
         """
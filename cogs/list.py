@@ -20,22 +20,22 @@ async def list_file(ctx: MyContext, letter: str) -> Optional[str]:
     countries = []
     letter = str(letter).lower()
     for field in iso_codes:
-        country_name = field["country"].lower()
+        country_name = field.country.lower()
         if country_name.startswith(letter):
             countries.append(field)
     longest_name = 0
     if len(countries) != 0:
         for country in countries:
-            if len(country["country"]) > longest_name:
-                longest_name = len(country["country"])
+            if len(country.country) > longest_name:
+                longest_name = len(country.country)
 
         msg_str = "{0:<{1}} | ISO2 Code | ISO3 Code".format(country_name, longest_name)
         msgs = [msg_str, "-" * len(msg_str)]
         for country in countries:
-            msgs.append("{0:<{1}} | {2}        | {3}      ".format(country["country"],
+            msgs.append("{0:<{1}} | {2}        | {3}      ".format(country.country,
                                                                    longest_name,
-                                                                   country["iso2"],
-                                                                   country["iso3"]))
+                                                                   country.iso2,
+                                                                   country.iso3))
         return "\n".join(msgs)
     return None
 
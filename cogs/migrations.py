@@ -62,6 +62,9 @@ class Template(Cog):
             await autoupdater_data.save()
             await db_channel.autoupdater.add(autoupdater_data)
             await db_channel.save()
+            autoupdater_cog = self.bot.get_cog("AutoUpdaterCog")
+            if autoupdater_cog is not None:
+                autoupdater_cog.schedule_updater(autoupdater_data)
             try:
                 await ctx.send("Done channel with Discord ID {0}.".format(channel["discord_id"]))
             except discord.DiscordException:
@@ -284,7 +284,7 @@ class FutureSimulations(Cog):
         stats = self.bot.worldometers_api.get_country_stats(country)
         db_user = await get_from_db(ctx.author, as_user=True)  # TODO: add country setter
         db_user.future_simulation.is_set_up = True
-        db_user.future_simulation.population_size = stats['population']
+        db_user.future_simulation.population_size = stats.population
 
     @commands.Cog.listener()
     async def on_roles_update(self):
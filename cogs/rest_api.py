@@ -5,7 +5,7 @@ All credit to Eyesofcreeper#0001, i just changed it up a little
 import asyncio
 import datetime
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Dict, List, Union
 
 import aiohttp_cors
@@ -15,7 +15,9 @@ from aiohttp import web
 from aiohttp.web_exceptions import HTTPNotFound, HTTPForbidden, HTTPBadRequest, HTTPInternalServerError
 from discord.ext import tasks
 
+from utils.api import BaseAPIException
 from utils.cog_class import Cog
+from utils.derived_metrics import series_to_json
 from utils.models import get_from_db, DiscordUser
 
 
@@ -213,6 +215,12 @@ class RestAPI(Cog):
             await db_channel.save(force_update=True)
         except tortoise.exceptions.IntegrityError:
             raise HTTPInternalServerError(reason="Database integrity error")
+        autoupdater_cog = self.bot.get_cog("AutoUpdaterCog")
+        if autoupdater_cog is not None:  # the scheduler doesn't reread the database, tell it what changed
+            if db_channel.autoupdater.already_set:
+                autoupdater_cog.schedule_updater(db_channel.autoupdater)
+            else:
+                autoupdater_cog.scheduler.cancel(db_channel.autoupdater.id)
         return web.json_response({"result": "ok"})
 
     async def bot_is_in_server(self, request):
@@ -366,6 +374,45 @@ class RestAPI(Cog):
 
         return web.json_response(result)
 
+    async def metrics(self, request):
+        """
+        /protected/metrics
+        Returns runtime metrics about the bot (HTTP connection pool, data sources...).
+        Requires global API key.
+        """
+        await self.authenticate_request(request)
+        return web.json_response(self.bot.collect_metrics())
+
+    async def derived_metrics(self, request):
+        """
+        /protected/derived_metrics/<location type>/<name>
+        Returns the metrics derived from the JHU CSSE data (new cases and deaths, 7 and 14 day averages, growth rate,
+        doubling time, per capita rates) of the world, a country, a province or a US state, as of the latest day. Pass
+        ?days=N to also get the last N days of every metric. Undefined values are null.
+        Requires global API key.
+        """
+        await self.authenticate_request(request)
+        location_type = request.match_info["location_type"]
+        name = request.match_info["name"]
+        if location_type not in ("world", "country", "province", "state"):
+            raise HTTPBadRequest(reason="Location type must be world, country, province or state")
+        try:
+            days = int(request.query.get("days", 0))
+        except ValueError:
+            raise HTTPBadRequest(reason="Days is not numeric")
+        try:
+            jhucsse_api = self.bot.jhucsse_api
+            result = {"latest": await jhucsse_api.get_latest_derived_stats(location_type, name)}
+            if days > 0:
+                series = await jhucsse_api.get_derived_stats(location_type, name)
+                result["history"] = series_to_json(series.slice(series.dates[-1] - timedelta(days=days - 1)))
+        except RuntimeError:
+            raise HTTPInternalServerError(reason="Stats aren't loaded yet")
+        except BaseAPIException:
+            raise HTTPNotFound(reason="Location not found")
+        result["last_updated"] = jhucsse_api.last_updated_utc.isoformat()
+        return web.json_response(result)
+
     async def run(self):
         await self.bot.wait_until_ready()
         listen_ip = self.config()['listen_ip']
@@ -383,6 +430,8 @@ class RestAPI(Cog):
             ('GET', f'{route_prefix}/protected/guild_info/{{guild_id:\\d+}}/{{user_id:\\d+}}', self.get_guild_details),
             ('GET', f'{route_prefix}/protected/user_perms/{{guild_id:\\d+}}/{{channel_id:\\d+}}/{{user_id:\\d+}}',
              self.check_channel_perms),
+            ('GET', f'{route_prefix}/protected/metrics', self.metrics),
+            ('GET', f'{route_prefix}/protected/derived_metrics/{{location_type}}/{{name}}', self.derived_metrics),
         ]
         for route_method, route_path, route_coro in routes:
             resource = self.cors.add(self.app.router.add_resource(route_path))
@@ -5,6 +5,7 @@ import discord
 from discord.ext import commands
 from cogs.error_handling import submit_error_message
 from utils import embeds, api
+from utils.ai_system import format_suggestions
 from utils.cog_class import Cog
 from utils.ctx_class import MyContext
 
@@ -97,6 +98,16 @@ class SlashCommands(Cog):
         await self.bot.create_slash_command(slash_commands["covid"])
         await ctx.reply("Submitted commands.")
 
+    async def not_found_message(self, message: str, name: str, location_type: str, *, stats_api=None) -> str:
+        """
+        Adds "did you mean" suggestions to a message about a name that wasn't found.
+        """
+        stats_api = stats_api or self.bot.worldometers_api
+        suggestions = await stats_api.suggest_names(name, location_type)
+        if suggestions:
+            message += f" Did you mean {format_suggestions(suggestions)}?"
+        return message
+
     # noinspection PyTypeChecker
     @commands.Cog.listener()
     async def on_interaction(self, data: discord.Interaction):
@@ -123,7 +134,8 @@ class SlashCommands(Cog):
                                                                           bot=self.bot)],
                                 type=discord.InteractionResponseType.channel_message_with_source)
                         except TypeError:
-                            await data.send("Not a valid continent name!",
+                            await data.send(await self.not_found_message("Not a valid continent name!",
+                                                                         continent_name.value, "continent"),
                                             type=discord.InteractionResponseType.channel_message_with_source)
                     elif option.name == "country":
                         country_name = [i for i in option.options if i.name == "country_name"][0]
@@ -132,13 +144,16 @@ class SlashCommands(Cog):
                                                                                       bot=self.bot)],
                                             type=discord.InteractionResponseType.channel_message_with_source)
                         except TypeError:
-                            await data.send("Not a valid country name!",
+                            await data.send(await self.not_found_message("Not a valid country name!",
+                                                                         country_name.value, "country"),
                                             type=discord.InteractionResponseType.channel_message_with_source)
                     elif option.name == "province":
                         country_name = [i for i in option.options if i.name == "province_name"][0]
                         province = await self.bot.jhucsse_api.try_to_get_name(country_name.value)
                         if province is None:
-                            await data.send("Didn't find any provinces with that name!",
+                            await data.send(await self.not_found_message("Didn't find any provinces with that name!",
+                                                                         country_name.value, "province",
+                                                                         stats_api=self.bot.jhucsse_api),
                                             type=discord.InteractionResponseType.channel_message_with_source)
                             return
                         elif province[0] != "province":
@@ -173,7 +188,8 @@ class SlashCommands(Cog):
                                                                                       bot=self.bot)],
                                             type=discord.InteractionResponseType.channel_message_with_source)
                         except TypeError:
-                            await data.send("Not a valid country name!",
+                            await data.send(await self.not_found_message("Not a valid state name!",
+                                                                         state_name.value, "state"),
                                             type=discord.InteractionResponseType.channel_message_with_source)
         except Exception as e:
             if isinstance(e, RuntimeError) and e.args[0] == \
@@ -11,12 +11,16 @@ import utils.api as covid19api
 from utils.cog_class import Cog
 from utils.ctx_class import MyContext
 
+# Discord embeds can't have more fields than this
+TOP_LIST_LENGTH = 25
+
 
 def incorrect_sort(_: Callable) -> discord.Embed:
     not_correct_type_embed = discord.Embed(title=_("Incorrect Top List Type"),
                                            description=_("Try sorting with one of the following:"))
-    for _type in ["cases", "recovered", "deaths", "critical", "tests"]:
-        not_correct_type_embed.add_field(name="\u200b", value=_type)
+    for _type in covid19api.RANKING_TYPES:
+        if _type != "population":
+            not_correct_type_embed.add_field(name="\u200b", value=_type)
     return not_correct_type_embed
 
 
@@ -25,12 +29,12 @@ class TopCommands(Cog):
     async def top(self, ctx: MyContext, _type: str):
         """
         Get top statistics for one of _type! Pie charts can be found in /graphs (soon™).
-        <_type> can be one of "cases", "recovered", "deaths", "critical" or "tests"
+        <_type> can be one of "cases", "recovered", "deaths", "critical" or "tests", optionally followed by
+        "_per_million" (like "deaths_per_million") to rank by value per million inhabitants.
         """
         _ = await ctx.get_translate_function()
-        print(_type)
         try:
-            _list = await self.bot.worldometers_api.get_sorted_list(_type.lower())
+            _list = await self.bot.worldometers_api.get_ranking(_type.lower(), limit=TOP_LIST_LENGTH)
         except covid19api.IncorrectSortType:
             await ctx.send(embed=incorrect_sort(_))
             return
@@ -39,9 +43,9 @@ class TopCommands(Cog):
             return
         top_embed = discord.Embed(title=_("Top List"),
                                   description=_("Run `{0}help top` for a list of all possible sorts!", ctx.prefix))
-        for country, i in zip(_list, range(1, len(_list))):
-            top_embed.add_field(name=_("{0}: {1}", i, country["country"]),
-                                value=format(int(country[_type.lower()]), ","))
+        for i, (country, value) in enumerate(_list, 1):
+            top_embed.add_field(name=_("{0}: {1}", i, country.name),
+                                value=format(round(value), ","))
         await ctx.send(embed=top_embed)
 
 
@@ -1,13 +1,13 @@
 # coding=utf-8
 import io
-from math import ceil
-from typing import Optional
+from typing import List, Optional
 
 import discord
 from discord.ext import commands
 
 from utils.cog_class import Cog
 from utils.ctx_class import MyContext
+from utils.vaccine_catalog import VaccineCandidate
 
 
 class VaccineCog(Cog):
@@ -40,18 +40,16 @@ class VaccineCog(Cog):
                                       description=_("To get more details on a vaccine candidate, run "
                                                     "`{0}vaccine details <id>`\n"
                                                     "The ID of any given candidate is under the name.", ctx.prefix))
-        max_pages = ceil(len(self.bot.vaccine_api.candidates) / 24)
-        ids = {}
-        for data, i in zip(self.bot.vaccine_api.candidates, range(len(self.bot.vaccine_api.candidates))):
-            ids[data['details']] = i
-        if not 0 < page <= max_pages:
+        catalog = self.bot.vaccine_api.catalog
+        max_pages = catalog.page_count
+        sect = catalog.page(page)
+        if sect is None:
             await ctx.send(_("The page number you have selected is not between 1 and "
                              "{0}. Please try again.", max_pages))
             return
-        sect = self.bot.vaccine_api.candidates[(page - 1) * 24: page * 24]
         for candidate in sect:
-            vaccine_embed.add_field(name=candidate['candidate'], value=ids[candidate['details']])
-        if len(sect) == 24:
+            vaccine_embed.add_field(name=candidate.candidate, value=candidate.id)
+        if page < max_pages:
             vaccine_embed.add_field(name=_("Page {0} of {1}", page, max_pages),
                                     value=_("To go to the next page, run "
                                             "`{0}{1} {2} {3}`",
@@ -68,28 +66,27 @@ class VaccineCog(Cog):
         Get details on a specific vaccine candidate from vaccine list
         """
         _ = await ctx.get_translate_function()
-        try:
-            vaccine = self.bot.vaccine_api.candidates[_id]
-        except IndexError:
+        vaccine = self.bot.vaccine_api.catalog.get(_id)
+        if vaccine is None:
             await ctx.send(_("That isn't a valid vaccine ID! View all the IDs in "
                              "{0}!", "`{0}vaccine list_all_candidates`".format(ctx.prefix)))
             return
-        if len(vaccine["details"]) <= 2048:
-            desc = vaccine["details"]
+        if len(vaccine.details) <= 2048:
+            desc = vaccine.details
             file = None
         else:
             desc = _("Description is too long! Download the attachment to see it!")
-            file = discord.File(io.BytesIO(bytes(vaccine["details"], encoding="utf-8")), filename="description.txt")
-        vaccine_embed = discord.Embed(title=vaccine['candidate'],
+            file = discord.File(io.BytesIO(bytes(vaccine.details, encoding="utf-8")), filename="description.txt")
+        vaccine_embed = discord.Embed(title=vaccine.candidate,
                                       description=desc)
-        vaccine_embed.add_field(name=_("Mechanism"), value=vaccine["mechanism"])
+        vaccine_embed.add_field(name=_("Mechanism"), value=vaccine.mechanism)
         sponsor_str = ""
-        for sponsor, i in zip(vaccine["sponsors"], range(1, len(vaccine["sponsors"])+1)):
+        for sponsor, i in zip(vaccine.sponsors, range(1, len(vaccine.sponsors)+1)):
             sponsor_str += f"#{i}: {sponsor}\n"
         vaccine_embed.add_field(name=_("Sponsors"), value=sponsor_str)
-        vaccine_embed.add_field(name=_("Phase"), value=vaccine["trialPhase"])
+        vaccine_embed.add_field(name=_("Phase"), value=vaccine.trial_phase)
         institutions_str = ""
-        for institution, i in zip(vaccine["institutions"], range(1, len(vaccine["institutions"])+1)):
+        for institution, i in zip(vaccine.institutions, range(1, len(vaccine.institutions)+1)):
             institutions_str += f"#{i}: {institution}\n"
         vaccine_embed.add_field(name=_("Institutions"), value=institutions_str)
         vaccine_embed.set_footer(text=_("Last updated at"))
@@ -99,5 +96,42 @@ class VaccineCog(Cog):
         else:
             await ctx.send(embed=vaccine_embed)
 
+    async def _send_matches(self, ctx: MyContext, title: str, matches: List[VaccineCandidate]):
+        _ = await ctx.get_translate_function()
+        if not matches:
+            await ctx.send(_("No vaccine candidate matches that. View all of them in "
+                             "{0}!", "`{0}vaccine list_all_candidates`".format(ctx.prefix)))
+            return
+        vaccine_embed = discord.Embed(title=title,
+                                      description=_("To get more details on a vaccine candidate, run "
+                                                    "`{0}vaccine details <id>`\n"
+                                                    "The ID of any given candidate is under the name.", ctx.prefix))
+        for candidate in matches[:24]:
+            vaccine_embed.add_field(name=candidate.candidate, value=candidate.id)
+        if len(matches) > 24:
+            vaccine_embed.add_field(name=_("{0} more candidates", len(matches) - 24),
+                                    value=_("Try a more specific search."))
+        vaccine_embed.set_footer(text=_("Last updated at"))
+        vaccine_embed.timestamp = self.bot.vaccine_api.last_updated_utc
+        await ctx.send(embed=vaccine_embed)
+
+    @vaccine.command()
+    async def search(self, ctx: MyContext, *, query: str):
+        """
+        Search vaccine candidates by name or sponsor (for example: vaccine search pfizer)
+        """
+        _ = await ctx.get_translate_function()
+        await self._send_matches(ctx, _("Vaccine Candidates matching {0}", query),
+                                 self.bot.vaccine_api.catalog.search(query))
+
+    @vaccine.command()
+    async def phase(self, ctx: MyContext, *, phase: str):
+        """
+        List the vaccine candidates in a trial phase (for example: vaccine phase phase 3)
+        """
+        _ = await ctx.get_translate_function()
+        await self._send_matches(ctx, _("Vaccine Candidates in {0}", phase),
+                                 self.bot.vaccine_api.catalog.by_phase(phase))
+
 
 setup = VaccineCog.setup
@@ -0,0 +1,94 @@
+# coding=utf-8
+"""
+Tests for utils.api.OWIDCountryData, on a synthetic location covering every kind of column OWID has: numeric ones
+(with gaps), strings, and metrics that are never reported.
+"""
+import datetime
+import unittest
+
+import numpy
+
+from utils.api import OWIDCountryData
+
+
+def make_location() -> dict:
+    return {"continent": "Europe", "location": "Testland", "population": 1000.0,
+            "data": [{"date": "2021-01-05", "total_cases": 10.0, "new_cases": 10.0, "tests_units": "tests performed",
+                      "icu_patients": None},
+                     {"date": "2021-01-06", "total_cases": 15.0, "new_cases": 5.0, "total_vaccinations": 3.0,
+                      "icu_patients": None},
+                     {"date": "2021-01-07", "new_cases": 2.0, "tests_units": "people tested", "icu_patients": None}]}
+
+
+class TestOWIDCountryData(unittest.TestCase):
+    def setUp(self):
+        self.data = OWIDCountryData.from_json(make_location())
+
+    def test_from_json_splits_info_and_rows(self):
+        self.assertEqual(self.data["location"], "Testland")
+        self.assertEqual(self.data.get("population"), 1000.0)
+        self.assertNotIn("data", self.data.info)
+        self.assertEqual(self.data.dates, ["2021-01-05", "2021-01-06", "2021-01-07"])
+        self.assertEqual(len(self.data), 3)
+
+    def test_from_json_numeric_column(self):
+        column = self.data.columns["total_cases"]
+        self.assertIsInstance(column, numpy.ndarray)
+        self.assertEqual(column.dtype, numpy.float64)
+        self.assertEqual(column[:2].tolist(), [10.0, 15.0])
+        self.assertTrue(numpy.isnan(column[2]))
+        # a metric missing from the first row still gets a value for every row
+        self.assertTrue(numpy.isnan(self.data.columns["total_vaccinations"][0]))
+
+    def test_from_json_string_column(self):
+        self.assertEqual(self.data.columns["tests_units"], ("tests performed", None, "people tested"))
+
+    def test_from_json_all_null_column(self):
+        column = self.data.columns["icu_patients"]
+        self.assertIsInstance(column, numpy.ndarray)
+        self.assertTrue(numpy.isnan(column).all())
+
+    def test_position(self):
+        self.assertEqual(self.data.position("2021-01-05"), 0)
+        self.assertEqual(self.data.position("2021-01-07"), 2)
+        # single-digit months and days have to be zero-padded the way OWID writes them
+        self.assertEqual(self.data.position(datetime.date(2021, 1, 5)), 0)
+        self.assertEqual(self.data.position(datetime.date(2021, 1, 6)), 1)
+        self.assertIsNone(self.data.position("2021-1-5"))
+        self.assertIsNone(self.data.position(datetime.date(2021, 1, 8)))
+
+    def test_row(self):
+        self.assertEqual(self.data.row(0), {"date": "2021-01-05", "total_cases": 10.0, "new_cases": 10.0,
+                                            "tests_units": "tests performed"})
+        self.assertEqual(self.data.row(-1), {"date": "2021-01-07", "new_cases": 2.0, "tests_units": "people tested"})
+        self.assertIsInstance(self.data.row(1)["total_cases"], float)
+
+    def test_latest(self):
+        self.assertEqual(self.data.latest("total_cases"), 15.0)
+        self.assertEqual(self.data.latest("new_cases"), 2.0)
+        self.assertEqual(self.data.latest("total_vaccinations"), 3.0)
+        self.assertEqual(self.data.latest("tests_units"), "people tested")
+        self.assertIsNone(self.data.latest("icu_patients"))
+        self.assertIsNone(self.data.latest("not_a_metric"))
+
+    def test_latest_row(self):
+        self.assertEqual(self.data.latest_row(), {"date": "2021-01-06", "total_cases": 15.0, "new_cases": 2.0,
+                                                  "total_vaccinations": 3.0, "tests_units": "people tested"})
+
+    def test_latest_row_without_total_cases(self):
+        location = make_location()
+        for row in location["data"]:
+            row.pop("total_cases", None)
+        data = OWIDCountryData.from_json(location)
+        self.assertNotIn("total_cases", data.latest_row())
+        self.assertEqual(data.latest_row()["date"], "2021-01-07")
+
+    def test_no_rows(self):
+        data = OWIDCountryData.from_json({"location": "Nowhere"})
+        self.assertEqual(len(data), 0)
+        self.assertEqual(data.latest_row(), {})
+        self.assertIsNone(data.position("2021-01-05"))
+
+
+if __name__ == '__main__':
+    unittest.main()
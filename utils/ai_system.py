@@ -1,14 +1,186 @@
 # coding=utf-8
-import discord
-import itertools
-
-
-# noinspection PyUnreachableCode
-async def find_nearest_match(msg: str, country_list: list):
-    return NotImplemented
-    nearest_matches = []
-    itertools.permutations("STRING", 1)
-    for letter, i in zip(msg, range(0, len(msg))):
-        for country in country_list:
-            if country["country"][i] == letter:
-                pass
+"""
+"Did you mean ...?" suggestions for location names that don't match anything.
+
+Every alias of a NameIndex is split into character trigrams, and an inverted index maps each trigram to the aliases
+containing it. A query only looks at aliases sharing trigrams with it, keeps the most similar ones and ranks those by
+edit distance, giving up on a candidate as soon as it's further away than the query could plausibly be misspelt.
+"""
+import collections
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils.name_index import NameIndex, normalize_name
+
+# aliases shorter than this (ISO codes, mostly) are only worth matching exactly
+MIN_ALIAS_LENGTH = 4
+# how many aliases (sharing the most trigrams with the query) get their edit distance computed
+CANDIDATE_POOL_SIZE = 16
+
+
+def trigrams(name: str) -> List[str]:
+    """
+    Returns the distinct trigrams of a normalized name, padded so the start and end of words count more.
+    """
+    padded = f"  {name} "
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(len(padded) - 2)))
+
+
+def bounded_edit_distance(a: str, b: str, bound: int) -> Optional[int]:
+    """
+    Levenshtein distance between two strings, or None as soon as it's known to be more than bound.
+    """
+    if abs(len(a) - len(b)) > bound:
+        return None
+    if len(a) > len(b):
+        a, b = b, a
+    # only the cells within bound of the diagonal can stay within bound, everything else is treated as too far
+    too_far = bound + 1
+    previous = [j if j <= bound else too_far for j in range(len(b) + 1)]
+    for i, char_a in enumerate(a, 1):
+        current = [too_far] * (len(b) + 1)
+        if i <= bound:
+            current[0] = i
+        lowest = current[0]
+        for j in range(max(1, i - bound), min(len(b), i + bound) + 1):
+            value = previous[j - 1] + (char_a != b[j - 1])
+            if previous[j] < value:
+                value = previous[j] + 1
+            if current[j - 1] < value:
+                value = current[j - 1] + 1
+            if value < lowest:
+                lowest = value
+            current[j] = value if value <= bound else too_far
+        if lowest > bound:
+            return None
+        previous = current
+    return previous[-1] if previous[-1] <= bound else None
+
+
+def max_distance(query: str) -> int:
+    """
+    How many typos a query of this length may contain and still get suggestions.
+    """
+    return max(1, min(4, len(query) // 3))
+
+
+class NameMatcher:
+    def __init__(self, index: NameIndex):
+        """
+        Trigram index over the aliases of a NameIndex. Build one per NameIndex (they're rebuilt once per data refresh).
+
+        :param index: The names to suggest from.
+        """
+        self.version: int = index.version
+        self.aliases: Tuple[str, ...] = tuple(alias for alias in index.names if len(alias) >= MIN_ALIAS_LENGTH)
+        self.locations: Tuple[Tuple[str, Optional[str]], ...] = tuple(index.names[alias] for alias in self.aliases)
+        self.trigram_counts: Tuple[int, ...] = tuple(len(trigrams(alias)) for alias in self.aliases)
+        postings: Dict[str, List[int]] = collections.defaultdict(list)
+        for i, alias in enumerate(self.aliases):
+            for trigram in trigrams(alias):
+                postings[trigram].append(i)
+        self.postings: Dict[str, Tuple[int, ...]] = {trigram: tuple(ids) for trigram, ids in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.aliases)
+
+    def _distance(self, query: str, alias: str, bound: int) -> Optional[int]:
+        distance = bounded_edit_distance(query, alias, bound)
+        if len(alias) > len(query) >= MIN_ALIAS_LENGTH:  # also match the start of a longer name ("bosnia")
+            prefix_distance = bounded_edit_distance(query, alias[:len(query)], bound - 1)
+            if prefix_distance is not None and (distance is None or prefix_distance + 1 < distance):
+                distance = prefix_distance + 1
+        return distance
+
+    def suggest(self, name: str, *, location_types: Sequence[str] = (), limit: int = 3) \
+            -> List[Tuple[str, Optional[str]]]:
+        """
+        Finds the locations whose names are closest to a (probably misspelt) name.
+
+        :param name: What the user typed.
+        :param location_types: Only suggest these types of location (e.g. "country"). Every type if empty.
+        :param limit: Maximum number of suggestions.
+        :return: List of (location type, name) tuples, as returned by NameIndex.lookup, best match first.
+        """
+        query = normalize_name(name)
+        if not query:
+            return []
+        query_trigrams = trigrams(query)
+        shared = collections.Counter()
+        for trigram in query_trigrams:
+            shared.update(self.postings.get(trigram, ()))
+        bound = max_distance(query)
+        # each typo can only destroy 3 trigrams, so anything sharing fewer than that is too far away already (one more
+        # is allowed for the prefix match, which loses the trigram marking the end of the name)
+        minimum_shared = len(query_trigrams) - 3 * bound - 1
+        # rank candidates by Dice coefficient, so long aliases don't win just by having more trigrams
+        candidates = sorted((i for i, count in shared.items() if count >= minimum_shared),
+                            key=lambda i: -2 * shared[i] / (len(query_trigrams) + self.trigram_counts[i]))
+        scored = []
+        considered = 0
+        for i in candidates:
+            if location_types and self.locations[i][0] not in location_types:
+                continue
+            considered += 1
+            if considered > CANDIDATE_POOL_SIZE:
+                break
+            distance = self._distance(query, self.aliases[i], bound)
+            if distance is not None:
+                scored.append((distance, considered, self.locations[i]))
+                if len(scored) >= limit:  # only closer candidates can still make it into the suggestions
+                    scored.sort()
+                    bound = scored[limit - 1][0]
+        suggestions = []
+        for _, _, location in sorted(scored):
+            if location not in suggestions:
+                suggestions.append(location)
+            if len(suggestions) == limit:
+                break
+        return suggestions
+
+
+def format_suggestions(suggestions: List[Tuple[str, Optional[str]]]) -> str:
+    """
+    Formats suggestions for a message, as a list of names to copy.
+    """
+    return ", ".join(f"`{name}`" for _, name in suggestions)
+
+
+async def find_nearest_match(msg: str, matcher: NameMatcher, **kwargs) -> List[Tuple[str, Optional[str]]]:
+    return matcher.suggest(msg, **kwargs)
+
+
+if __name__ == '__main__':
+    import random
+    import sys
+    import time
+
+    from utils import api
+    from utils.snapshot_store import SnapshotStore
+
+    # python -m utils.ai_system [snapshot directory]: times building and querying the matcher over every alias
+    store = SnapshotStore(sys.argv[1] if len(sys.argv) > 1 else "temp_data/snapshots")
+    jhucsse, worldometers = store.load(api.Covid19JHUCSSEStats.SNAPSHOT_NAME), \
+        store.load(api.Covid19StatsWorldometers.SNAPSHOT_NAME)
+    if jhucsse is None or worldometers is None:
+        sys.exit("Run the bot once first, this needs its snapshots.")
+    name_index = NameIndex.build(worldometers.country_records, version=0, province=jhucsse.provinces,
+                                 continent=worldometers.continents, state=worldometers.american_states)
+    start = time.perf_counter()
+    matcher = NameMatcher(name_index)
+    print(f"Indexed {len(matcher)} aliases ({len(matcher.postings)} trigrams) in "
+          f"{(time.perf_counter() - start) * 1000:.2f}ms")
+
+    random.seed(0)
+    queries = []
+    for alias, location in zip(matcher.aliases, matcher.locations):
+        typo = list(alias)
+        position = random.randrange(len(typo))
+        typo[position] = random.choice("abcdefghijklmnopqrstuvwxyz")
+        queries.append(("".join(typo), location))
+    found = 0
+    start = time.perf_counter()
+    for query, expected in queries:
+        found += expected in matcher.suggest(query)
+    elapsed = time.perf_counter() - start
+    print(f"{len(queries)} misspelt queries: {elapsed / len(queries) * 1e6:.1f}us per query, "
+          f"expected location in the suggestions {found / len(queries):.1%} of the time")
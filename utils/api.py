@@ -3,14 +3,54 @@
 # licence: https://creativecommons.org/licenses/by-nc-sa/4.0/
 
 import asyncio
+import collections
+import json
 import time
 import logging
 import aiohttp
+import numpy
 import datetime
-from typing import Optional, List, AnyStr, Dict, Tuple
+import functools
+import os
+import tempfile
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Optional, List, AnyStr, Dict, Tuple, Hashable, Union, NamedTuple, Mapping, Iterable, BinaryIO
+
+from utils.http_client import PooledHTTPClient, StagedValidators, ValidatorCache
+from utils.ai_system import NameMatcher
+from utils.async_helpers import wrap_in_async
+from utils.country_registry import CountryRecord, CountryRegistry
+from utils.grouping import group_by_country
+from utils.ingest_worker import IngestWorker
+from utils.json_stream import JSONObjectSplitter
+from utils.location_stats import LocationStats
+from utils.name_index import NameIndex
+from utils.derived_metrics import WORLD, DerivedMetrics
+from utils.rankings import CountryRankings, per_capita_type
+from utils.snapshot_store import SnapshotStore, register_type
+from utils.timeseries import TimeSeries, parse_date
+from utils.vaccine_catalog import VaccineCandidate, VaccineCatalog
 
 MAX_UPDATE_TRIES = 5
+# Where the data comes from. Every class takes a base_url to use instead, for example a utils.replay server.
+DISEASE_SH_URL = "https://disease.sh"
+OWID_URL = "https://covid.ourworldindata.org"
+# Fan-out fetch settings: how many requests can be in flight at once, how long a single request may take (seconds),
+# and how many times (plus the backoff base, in seconds) a failed request is retried before giving up.
+MAX_CONCURRENT_REQUESTS = 16
+REQUEST_TIMEOUT = 60
+REQUEST_RETRIES = 3
+RETRY_BACKOFF = 0.5
+# Size in bytes of the chunks big responses are downloaded and parsed in.
+STREAM_CHUNK_SIZE = 2 ** 16
+# After a full load, JHU timelines are kept up to date by only fetching this many of the latest days.
+INCREMENTAL_DAYS = 7
+# How often (in seconds) the whole JHU history is fetched again anyway, to pick up revisions of older days.
+FULL_REFRESH_INTERVAL = 6 * 60 * 60
 SORT_TYPES = ("cases", "recovered", "deaths", "critical", "tests", "population")
+PER_CAPITA_SORT_TYPES = ("cases", "recovered", "deaths", "critical", "tests")
+RANKING_TYPES = SORT_TYPES + tuple(per_capita_type(sort_type) for sort_type in PER_CAPITA_SORT_TYPES)
 
 
 class BaseAPIException(Exception):
@@ -26,6 +66,22 @@ class NetworkException(BaseAPIException):
         super().__init__(*args)
         self.exc = exc
 
+    @property
+    def status(self) -> Optional[int]:
+        """
+        HTTP status code of the failed request, or None if the request never got a response (timeouts, DNS errors...)
+        """
+        return getattr(self.exc, "status", None)
+
+
+class DataNotModified(BaseAPIException):
+    """
+    Raised by get_data when skip_if_unchanged is set and the upstream data is the same as last time.
+    """
+    def __init__(self, url: str, *args):
+        super().__init__(*args)
+        self.url = url
+
 
 class NoCountryDataFields(BaseAPIException):
     pass
@@ -43,86 +99,225 @@ class ProvinceNotFound(BaseAPIException):
     pass
 
 
-def get_iso2_code(_input: str, _list: list) -> [str, None]:
+# Given a URL, this will return the JSON of that page
+async def get_data(session: aiohttp.ClientSession,
+                   url: str, *,
+                   formatted_as_json: bool = True,
+                   timeout: Optional[float] = None,
+                   validators: Optional[Union[ValidatorCache, StagedValidators]] = None,
+                   skip_if_unchanged: bool = False,
+                   raw: bool = False):
     """
-    Returns a ISO2 code, given any of the 3 types of codes.
-    :param _input: The name to convert to a ISO2 code.
-    :param _list: Country list to get the ISO2 code from.
-    :return: ISO2 code if found, otherwise None.
+    Returns JSON/text of a URL
+
+    :param session: aiohttp.ClientSession object to use: must already be open.
+    :param url: URL to grab data from
+    :param formatted_as_json: Try to parse as JSON? If true, returns parsed JSON. If false, returns text directly
+                              without parsing
+    :param timeout: Optional: total time in seconds the request may take. Defaults to the session's timeout.
+    :param validators: Optional: ValidatorCache (or StagedValidators) to record the response's ETag/Last-Modified/body
+                       hash in.
+    :param skip_if_unchanged: If true (and validators is passed), send a conditional GET and raise DataNotModified
+                              instead of parsing the body if the server says it is unchanged or the body is
+                              byte-identical to last time.
+    :param raw: If true, return the body as bytes, without decoding it (to parse it in an IngestWorker, for example).
+    :return: Text or JSON-formatted data, depending on formatted_as_json, or bytes if raw is true
+    :raises NetworkException: if a aiohttp.ClientError is raised or the request times out. The original exception is
+                              avalible via e.exc.
+    :raises DataNotModified: if skip_if_unchanged is set and the data didn't change.
     """
-    _input = str(_input).lower().strip()
+    kwargs = {} if timeout is None else {"timeout": aiohttp.ClientTimeout(total=timeout)}
+    skip_if_unchanged = skip_if_unchanged and validators is not None
+    if skip_if_unchanged:
+        kwargs["headers"] = validators.request_headers(url)
     try:
-        for country in _list:
-            country_codes = (str(country['country']).lower(),
-                             str(country['iso2']).lower(),
-                             str(country['iso3']).lower())
-            if _input in country_codes:
-                return country['iso2']
-    except IndexError:
-        raise NoCountryDataFields()
-
-
-# Same as getISO2Code(), returns a ISO3 code
-def get_iso3_code(_input: str, _list: list) -> [str, None]:
-    """
-    Returns a ISO3 code, given a ISO2 code.
-    :param _input: The ISO2 code. This is converted automatically to a code if it isn't one.
-    :param _list: Country list to get the ISO3 code from.
-    :return: ISO3 code if found, otherwise None.
-    """
-    _input = get_iso2_code(_input, _list)
-    if not _input:
-        return
-    try:
-        for country in _list:
-            if _input.lower() == str(country["iso2"]).lower():
-                return country["iso3"]
-    except IndexError:
-        raise NoCountryDataFields()
+        async with session.get(url, **kwargs) as response:
+            if skip_if_unchanged and response.status == 304:
+                validators.record_not_modified(url)
+                raise DataNotModified(url)
+            response.raise_for_status()
+            body = await response.read()
+            if validators is not None and not validators.update(url, response.headers, body) and skip_if_unchanged:
+                raise DataNotModified(url)
+            if raw:
+                return body
+            elif formatted_as_json:
+                return json.loads(body)
+            else:
+                return body.decode(response.get_encoding())
+    except (aiohttp.ClientError, aiohttp.ClientConnectorError, asyncio.TimeoutError) as e:
+        raise NetworkException(e)
 
 
-# Same as getISO2Code(), only returns a country name
-def get_country_name(_input, _list) -> [str, None]:
+def _conditional_get(cls) -> dict:
     """
-    Returns a country name, given a ISO2 code.
-    :param _input: The ISO2 code. This is converted automatically to a code if it isn't one.
-    :param _list: Country list to get the ISO2 code from.
-    :return: ISO2 code if found, otherwise None.
+    Keyword arguments for get_data/fetch_many that make a class skip re-parsing data that hasn't changed, as long as it
+    already has valid data to fall back on. The validators are staged in cls._validators, and only stored once the
+    update published its data (see _publish_snapshot).
     """
-    _input = get_iso2_code(_input, _list)
-    if not _input:
-        return
-    try:
-        for country in _list:
-            if _input == str(country["iso2"]):
-                return country["country"]
-    except IndexError:
-        raise NoCountryDataFields()
+    return {"validators": cls._validators, "skip_if_unchanged": cls.data_is_valid}
 
 
-# Given a URL, this will return the JSON of that page
-async def get_data(session: aiohttp.ClientSession,
-                   url: str, *,
-                   formatted_as_json: bool = True):
+async def download_to_file(session: aiohttp.ClientSession,
+                           url: str,
+                           f: BinaryIO, *,
+                           timeout: Optional[float] = None,
+                           validators: Optional[Union[ValidatorCache, StagedValidators]] = None,
+                           skip_if_unchanged: bool = False,
+                           chunk_size: int = STREAM_CHUNK_SIZE) -> int:
     """
-    Returns JSON/text of a URL
+    Like get_data, but for big files: writes the body to a file as it comes off the socket, instead of holding all of
+    it in memory.
 
     :param session: aiohttp.ClientSession object to use: must already be open.
     :param url: URL to grab data from
-    :param formatted_as_json: Try to parse as JSON? If true, returns parsed JSON. If false, returns text directly
-                              without parsing
-    :return: Text or JSON-formatted data, depending on formatted_as_json
-    :raises NetworkException: if a aiohttp.ClientError is raised. The original exception is avalible via e.exc.
+    :param f: Binary file object to write the body to.
+    :param timeout: Optional: total time in seconds the request may take. Defaults to the session's timeout.
+    :param validators: Optional: ValidatorCache (or StagedValidators) to record the response's ETag/Last-Modified/body
+                       hash in.
+    :param skip_if_unchanged: If true (and validators is passed), send a conditional GET and raise DataNotModified if
+                              the server says the data is unchanged, or once downloaded if the body is byte-identical
+                              to last time.
+    :return: Number of bytes written.
+    :raises NetworkException: if a aiohttp.ClientError is raised or the request times out. The original exception is
+                              avalible via e.exc.
+    :raises DataNotModified: if skip_if_unchanged is set and the data didn't change.
     """
+    kwargs = {} if timeout is None else {"timeout": aiohttp.ClientTimeout(total=timeout)}
+    skip_if_unchanged = skip_if_unchanged and validators is not None
+    if skip_if_unchanged:
+        kwargs["headers"] = validators.request_headers(url)
+    digest = ValidatorCache.digest()
+    size = 0
     try:
-        async with session.get(url) as response:
+        async with session.get(url, **kwargs) as response:
+            if skip_if_unchanged and response.status == 304:
+                validators.record_not_modified(url)
+                raise DataNotModified(url)
             response.raise_for_status()
-            if formatted_as_json:
-                return await response.json()
-            else:
-                return await response.text()
-    except (aiohttp.ClientError, aiohttp.ClientConnectorError) as e:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                digest.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+            headers = response.headers
+    except (aiohttp.ClientError, aiohttp.ClientConnectorError, asyncio.TimeoutError) as e:
         raise NetworkException(e)
+    if validators is not None and not validators.update_digest(url, headers, digest) and skip_if_unchanged:
+        raise DataNotModified(url)
+    return size
+
+
+async def fetch_many(session: aiohttp.ClientSession,
+                     urls: Dict[Hashable, str], *,
+                     max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                     timeout: float = REQUEST_TIMEOUT,
+                     retries: int = REQUEST_RETRIES,
+                     backoff: float = RETRY_BACKOFF,
+                     validators: Optional[Union[ValidatorCache, StagedValidators]] = None,
+                     skip_if_unchanged: bool = False,
+                     raw: bool = False) \
+        -> Dict[Hashable, Union[dict, list, bytes, NetworkException, DataNotModified]]:
+    """
+    Fetches many URLs at once over a single session, with at most max_concurrency requests in flight at any time.
+
+    Failed requests are retried with exponential backoff (backoff, 2 * backoff, 4 * backoff...) unless the server
+    answered with a 4xx status other than 429, since retrying those won't change anything.
+
+    :param session: aiohttp.ClientSession object to use: must already be open.
+    :param urls: Dictionary of key -> URL. The keys are used to index the returned dictionary.
+    :param max_concurrency: Maximum number of requests in flight at once.
+    :param timeout: Total time in seconds a single request may take.
+    :param retries: How many times a failed request is retried.
+    :param backoff: Base delay in seconds between retries.
+    :param validators: Optional: passed on to get_data.
+    :param skip_if_unchanged: Passed on to get_data.
+    :param raw: Passed on to get_data.
+    :return: Dictionary of key -> parsed JSON (or bytes, if raw is true). If a request failed for good, the value is
+             the NetworkException that was raised by the last try instead. If the data didn't change, the value is a
+             DataNotModified exception.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_one(key: Hashable, url: str):
+        for attempt in range(retries + 1):
+            async with semaphore:
+                try:
+                    return key, await get_data(session, url, timeout=timeout, validators=validators,
+                                               skip_if_unchanged=skip_if_unchanged, raw=raw)
+                except DataNotModified as e:
+                    return key, e
+                except NetworkException as e:
+                    exception = e
+            status = exception.status
+            if status is not None and 400 <= status < 500 and status != 429:
+                break
+            if attempt < retries:
+                await asyncio.sleep(backoff * 2 ** attempt)  # sleep outside the semaphore so others can go ahead
+        return key, exception
+
+    results = await asyncio.gather(*(fetch_one(key, url) for key, url in urls.items()))
+    return dict(results)
+
+
+_data_version = 0
+
+
+def next_data_version() -> int:
+    """
+    Returns a new data version. Versions are shared by every source and only ever go up, so anything made out of a
+    snapshot (caches, rendered messages...) can be tagged with the version of the data it came from.
+    """
+    global _data_version
+    _data_version += 1
+    return _data_version
+
+
+async def _publish_snapshot(cls, snapshot):
+    """
+    Swaps in a new snapshot, stores the validators of the responses it was made from, and, if the class has a snapshot
+    store, saves it to disk (in a thread).
+    """
+    cls.snapshot = snapshot
+    cls._validators.commit()
+    if cls.snapshot_store is not None:
+        try:
+            await wrap_in_async(cls.snapshot_store.save, cls.SNAPSHOT_NAME, snapshot, thread_pool=True)
+        except (OSError, TypeError, ValueError) as e:
+            cls.logger.exception(f"Failed to save the {cls.SNAPSHOT_NAME} snapshot!", exc_info=e)
+
+
+def _load_snapshot(cls) -> bool:
+    """
+    Loads the snapshot saved by the last run, if there is one, and serves it until the next update.
+
+    :return: True if a snapshot was loaded.
+    """
+    global _data_version
+    if cls.snapshot_store is None:
+        return False
+    snapshot = cls.snapshot_store.load(cls.SNAPSHOT_NAME)
+    if not isinstance(snapshot, type(cls.snapshot)):
+        return False
+    _data_version = max(_data_version, snapshot.version)  # keep versions going up across restarts
+    cls.snapshot = snapshot
+    if hasattr(snapshot, "country_records") and not len(cls.country_registry):
+        cls.country_registry.publish(snapshot.country_records, version=snapshot.version)
+    if hasattr(cls, "_flag"):
+        cls._flag.set()
+    cls._has_been_updated = True
+    cls.data_is_valid = True
+    return True
+
+
+def _build_rankings(country_stats: Mapping[str, dict]) -> CountryRankings:
+    return CountryRankings.build(country_stats, SORT_TYPES, PER_CAPITA_SORT_TYPES)
+
+
+def _frozen(mapping: Mapping) -> Mapping:
+    """
+    Returns a read-only view of a mapping, for snapshots.
+    """
+    return mapping if isinstance(mapping, MappingProxyType) else MappingProxyType(mapping)
 
 
 def from_time_to_date(in_time: time.struct_time) -> datetime.date:
@@ -143,7 +338,9 @@ async def _check_stats_are_valid(cls):
 
 
 async def _handle_client_exceptions(cls, e):
-    cls.logger.exception(f"ClientException while getting data in class {cls.__class__.__name__}!", e.exc)
+    cls.logger.exception(f"ClientException while getting data in class {cls.__class__.__name__}!", exc_info=e.exc)
+    if cls.retries_are_managed:
+        raise e  # let whoever scheduled the update retry it, with backoff
     if cls._has_been_updated:
         return
     elif cls._update_tries <= MAX_UPDATE_TRIES:
@@ -153,42 +350,186 @@ async def _handle_client_exceptions(cls, e):
         cls._update_tries = 0
 
 
-class ISOCodeHelper:
-    def __init__(self, *, logging_level=logging.INFO):
-        self.logger: logging.Logger = logging.Logger("ISO Code Helper", level=logging_level)
-        self.logger.setLevel(logging_level)
-        self.iso_codes = []
-        self.logger = logging.Logger(self.__class__.__name__)
-        self._has_been_updated = False
-        self._update_tries = 0
+def _publish_countries(registry: CountryRegistry, records: Iterable[CountryRecord]) -> bool:
+    """
+    Publishes a new country list to a registry, unless it's the same as the current one (so that whatever was built
+    out of the registry isn't rebuilt for nothing).
 
-    # noinspection PyTypeChecker
-    async def update_data(self, *, session: Optional[aiohttp.ClientSession] = None):
-        session = session or aiohttp.ClientSession()
-        async with session as session:
-            self.logger.info("Getting new country data...")
-            try:
-                data = await get_data(session, "https://disease.sh/v3/covid-19/countries?allowNull=true")
-            except NetworkException as e:
-                await _handle_client_exceptions(self, e)
-                return
-            self.logger.info("Got ISO codes! Parsing data and loading it into memory...")
-            for country in filter(lambda x: x["countryInfo"]["iso2"] is not None, data):
-                iso_code = dict(country=country["country"], iso2=country["countryInfo"]["iso2"],
-                                iso3=country["countryInfo"]["iso3"])
-                self.iso_codes.append(iso_code)
+    :return: True if the list changed.
+    """
+    records = tuple(records)
+    if records == registry.records:
+        return False
+    registry.publish(records, version=next_data_version())
+    return True
 
-    async def _do_update(self):
-        await self.update_data()
+
+async def _update_country_registry(cls, session: aiohttp.ClientSession, base_url: str = DISEASE_SH_URL):
+    """
+    Downloads the country list into cls.country_registry. Only used by classes that weren't given a shared registry:
+    the bot's is fed by Covid19StatsWorldometers, which downloads the list anyway.
+
+    :raises NetworkException: if the download fails.
+    """
+    cls.logger.info("Getting the country list...")
+    data = await get_data(session, f"{base_url}/v3/covid-19/countries?allowNull=true")
+    _publish_countries(cls.country_registry, filter(None, map(CountryRecord.from_json, data)))
+
+
+@register_type
+class JHUSnapshot(NamedTuple):
+    """
+    Everything Covid19JHUCSSEStats serves, as of one update. Never modified once published: updates build a new one
+    and swap it in.
+    """
+    version: int = 0
+    last_updated_utc: datetime.datetime = datetime.datetime.utcfromtimestamp(-1)
+    global_historical_stats: TimeSeries = TimeSeries.from_timeline({})
+    countries: Mapping[str, dict] = MappingProxyType({})
+    provinces: Mapping[str, dict] = MappingProxyType({})
+    historical_stats: Mapping[str, dict] = MappingProxyType({})
+    american_states: Tuple[str, ...] = ()
+    american_state_stats: Mapping[str, dict] = MappingProxyType({})
+    derived_metrics: Optional[DerivedMetrics] = None
+
+
+class JHUBodies(NamedTuple):
+    """
+    The raw bodies downloaded by one JHU update, for parse_jhu_update. Stages that didn't change are None or missing.
+    """
+    global_stats: Optional[bytes] = None
+    countries: Dict[str, bytes] = {}
+    provinces: Optional[bytes] = None
+    states: Dict[str, bytes] = {}
+
+
+def merge_timeline(previous: Optional[TimeSeries], timeline: dict, full: bool,
+                   merge_stats: collections.Counter) -> Optional[TimeSeries]:
+    """
+    Turns a downloaded timeline into a TimeSeries. During incremental updates, the timeline only has the latest days
+    and is merged into the previous series.
+
+    :param merge_stats: Counter to add the merges that failed ("failed_merges") and the already known days upstream
+                        changed ("revised_days") to. Either means a full update is needed.
+    :return: The new series, the previous one if the timeline couldn't be merged into it, or None if there was no
+             previous one to merge into.
+    """
+    series = TimeSeries.from_timeline(timeline)
+    if full:
+        return series
+    merged = previous.merge_tail(series) if previous is not None else None
+    if merged is None:
+        merge_stats["failed_merges"] += 1
+        return previous
+    merged, mismatches = merged
+    if mismatches:
+        merge_stats["revised_days"] += mismatches
+    return merged
+
+
+def _is_county(row: Optional[dict]) -> bool:
+    if row is None or row["county"] is None:
+        return False
+    return not row["county"].startswith("out of") or row["county"] == "unassigned"
+
+
+def build_derived_metrics(snapshot: JHUSnapshot, populations: Mapping[str, int],
+                          iso2_codes: Iterable[str]) -> DerivedMetrics:
+    """
+    Computes the derived metrics of every location of a snapshot.
+
+    :param populations: Dictionary of ISO2 code -> population, for the countries. The world gets the sum of theirs.
+    :param iso2_codes: The ISO2 codes of the countries. snapshot.countries also has every country under its name (for
+                       lookups by name), those copies are left out.
+    """
+    locations = {WORLD: {WORLD: snapshot.global_historical_stats},
+                 "country": {iso2: snapshot.countries[iso2]["timeline"] for iso2 in iso2_codes
+                             if iso2 in snapshot.countries},
+                 "province": {name: data["timeline"] for name, data in snapshot.provinces.items()},
+                 "state": {state: data["all"]["timeline"] for state, data in snapshot.american_state_stats.items()
+                           if "all" in data}}
+    return DerivedMetrics.build(locations, {WORLD: {WORLD: sum(populations.values())}, "country": populations})
+
+
+def parse_jhu_update(previous: JHUSnapshot, bodies: JHUBodies, country_list: Tuple[CountryRecord, ...],
+                     american_states: Tuple[str, ...], full: bool, populations: Mapping[str, int]) \
+        -> Tuple[JHUSnapshot, collections.Counter]:
+    """
+    Decodes the bodies downloaded by a JHU update and builds the new snapshot out of them and the previous one. This
+    is the CPU-heavy part of an update: it runs in an IngestWorker.
+
+    :param previous: The current snapshot. Its derived metrics aren't needed (they're computed again).
+    :param bodies: What was downloaded.
+    :param country_list: Every country to keep the provinces of.
+    :param american_states: The US states.
+    :param full: Whether the bodies have the whole history, or only the latest days to merge in.
+    :param populations: Passed on to build_derived_metrics.
+    :return: (new snapshot, with the version and update time of the previous one, merge stats (see merge_timeline))
+    """
+    merge_stats = collections.Counter()
+    global_historical_stats = previous.global_historical_stats
+    if bodies.global_stats is not None:
+        global_historical_stats = merge_timeline(global_historical_stats, json.loads(bodies.global_stats), full,
+                                                 merge_stats) or global_historical_stats
+    countries = dict(previous.countries)
+    for iso2, body in bodies.countries.items():
+        data = json.loads(body)
+        data["timeline"] = merge_timeline((previous.countries.get(iso2) or {}).get("timeline"), data["timeline"],
+                                          full, merge_stats)
+        if data["timeline"] is not None:
+            countries[iso2] = data
+    provinces = previous.provinces
+    historical_stats = previous.historical_stats
+    if bodies.provinces is not None:
+        data = json.loads(bodies.provinces)
+        previous_timelines = {(i["country"], i["province"]): i["timeline"]
+                              for cty_data in previous.historical_stats.values() for i in cty_data.values()}
+        for i in data:
+            i["timeline"] = merge_timeline(previous_timelines.get((i["country"], i["province"])), i["timeline"], full,
+                                           merge_stats)
+        historical_stats, provinces, country_rows = group_by_country(
+            (i for i in data if i["timeline"] is not None), country_list)
+        countries.update(country_rows)
+    american_state_stats = dict(previous.american_state_stats)
+    for state, body in bodies.states.items():
+        sd = {}
+        previous_counties = previous.american_state_stats.get(state, {})
+        for county in filter(_is_county, json.loads(body)):
+            county["timeline"] = merge_timeline((previous_counties.get(county["county"]) or {}).get("timeline"),
+                                                county["timeline"], full, merge_stats)
+            if county["timeline"] is not None:
+                sd[county["county"]] = county
+        sd["all"] = {"timeline": TimeSeries.sum([county["timeline"] for county in sd.values()])}
+        american_state_stats[state] = sd
+    snapshot = previous._replace(global_historical_stats=global_historical_stats,
+                                 countries=_frozen(countries),
+                                 provinces=_frozen(provinces),
+                                 historical_stats=_frozen(historical_stats),
+                                 american_states=american_states,
+                                 american_state_stats=_frozen(american_state_stats))
+    return snapshot._replace(derived_metrics=build_derived_metrics(snapshot, populations,
+                                                                   [country.iso2 for country in country_list])), \
+        merge_stats
 
 
 class Covid19JHUCSSEStats:
     """
     Class for stats on COVID-19 via the https://disease.sh API's JHUCSSE section.
     """
+    SNAPSHOT_NAME = "jhucsse"
 
     def __init__(self, add_ids: bool = False, *, update_stats: bool = False,
-                 logging_level=logging.INFO):
+                 logging_level=logging.INFO,
+                 max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+                 request_timeout: float = REQUEST_TIMEOUT,
+                 request_retries: int = REQUEST_RETRIES,
+                 incremental_days: Optional[int] = INCREMENTAL_DAYS,
+                 full_refresh_interval: float = FULL_REFRESH_INTERVAL,
+                 http_pool: Optional[PooledHTTPClient] = None,
+                 snapshot_store: Optional[SnapshotStore] = None,
+                 country_registry: Optional[CountryRegistry] = None,
+                 base_url: str = DISEASE_SH_URL,
+                 ingest_worker: Optional[IngestWorker] = None):
         """
         Class to get data + historical data about COVID-19 for every country (data from JHUCSSE).
 
@@ -196,28 +537,109 @@ class Covid19JHUCSSEStats:
         :param update_stats: Whether to update stats on class initalization or wait for a explicit call to do so.
                              Doing it in the __init__ makes the init time a lot longer, and it's synchronous: for this
                              reason, it defaults to being disabled.
+        :param max_concurrency: How many per-country/per-state requests can be in flight at once.
+        :param request_timeout: How long a single request may take, in seconds.
+        :param request_retries: How many times a failed per-country/per-state request is retried.
+        :param incremental_days: Once the whole history has been loaded, only fetch this many of the latest days and
+                                 merge them in. None or 0 to always fetch the whole history.
+        :param full_refresh_interval: How often to fetch the whole history anyway, in seconds.
+        :param http_pool: Optional: shared PooledHTTPClient to make requests with. Defaults to making a new one.
+        :param snapshot_store: Optional: SnapshotStore to save every new snapshot to, and to load the last one from.
+        :param country_registry: Optional: shared CountryRegistry, kept up to date by its owner. Defaults to making
+                                 a new one, updated along with the stats.
+        :param base_url: Optional: URL of the disease.sh API (or of something serving the same paths) to use.
+        :param ingest_worker: Optional: IngestWorker to parse the downloaded data in. Defaults to parsing it right away,
+                              in the event loop.
         """
         self.logger: logging.Logger = logging.Logger("COVID-19 Stats JHUCSSE", level=logging_level)
         self.logger.setLevel(logging_level)
+        self.max_concurrency: int = max_concurrency
+        self.request_timeout: float = request_timeout
+        self.request_retries: int = request_retries
+        self.incremental_days: Optional[int] = incremental_days
+        self.full_refresh_interval: float = full_refresh_interval
+        self._last_full_refresh: Optional[float] = None
+        self._reconcile_requested: bool = False
+        self.refresh_stats: collections.Counter = collections.Counter()
+        self.phase_timings: Dict[str, float] = {}
+        self.skipped_stages: collections.Counter = collections.Counter()
         self._has_been_updated: bool = False
         self._update_tries: int = 0
         self.data_is_valid: bool = False
         self.add_ids: bool = add_ids
-        self.last_updated_utc: datetime.datetime = datetime.datetime.utcfromtimestamp(-1)
-        self.global_historical_stats: dict = {}
-        self.historical_stats: dict = {}
-        self.american_states: list = []
-        self.american_state_stats: dict = {}
-        self.iso_codes = ISOCodeHelper()
-        self.provinces: dict = {}
-        self.countries: dict = {}
+        self.snapshot: JHUSnapshot = JHUSnapshot()
+        self.snapshot_store: Optional[SnapshotStore] = snapshot_store
+        self._name_index: NameIndex = NameIndex(version=-1)
+        self._name_matcher: NameMatcher = NameMatcher(self._name_index)
+        self.http_pool: PooledHTTPClient = http_pool or PooledHTTPClient()
+        self._validators: StagedValidators = self.http_pool.validators.stage()
+        self.country_registry: CountryRegistry = CountryRegistry() if country_registry is None else country_registry
+        self._owns_country_registry: bool = country_registry is None
+        self.base_url: str = base_url
+        self.ingest_worker: IngestWorker = ingest_worker or IngestWorker(processes=0)
+        self.retries_are_managed: bool = False
         if update_stats:
             self.update_covid_19_virus_stats()
-            self.iso_codes.update_data()
 
     async def _do_update(self):
         await self.update_covid_19_virus_stats()
 
+    def load_snapshot(self) -> bool:
+        return _load_snapshot(self)
+
+    @property
+    def data_version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def last_updated_utc(self) -> datetime.datetime:
+        return self.snapshot.last_updated_utc
+
+    @property
+    def global_historical_stats(self) -> TimeSeries:
+        return self.snapshot.global_historical_stats
+
+    @property
+    def countries(self) -> Mapping[str, dict]:
+        return self.snapshot.countries
+
+    @property
+    def provinces(self) -> Mapping[str, dict]:
+        return self.snapshot.provinces
+
+    @property
+    def historical_stats(self) -> Mapping[str, dict]:
+        return self.snapshot.historical_stats
+
+    @property
+    def american_states(self) -> Tuple[str, ...]:
+        return self.snapshot.american_states
+
+    @property
+    def american_state_stats(self) -> Mapping[str, dict]:
+        return self.snapshot.american_state_stats
+
+    @property
+    def name_index(self) -> NameIndex:
+        """
+        Index of every name try_to_get_name knows, rebuilt whenever the data or the country registry changes.
+        """
+        snapshot = self.snapshot
+        version = max(snapshot.version, self.country_registry.version)  # versions are shared, and only go up
+        if self._name_index.version != version:
+            self._name_index = NameIndex.build(self.country_registry, version=version,
+                                               province=snapshot.provinces, state=snapshot.american_states)
+        return self._name_index
+
+    @property
+    def derived_metrics(self) -> DerivedMetrics:
+        snapshot = self.snapshot
+        if snapshot.derived_metrics is None:  # snapshot saved before derived metrics existed
+            derived_metrics = build_derived_metrics(snapshot, self.country_registry.populations(),
+                                                    self.country_registry.iso2_codes)
+            snapshot = self.snapshot = snapshot._replace(derived_metrics=derived_metrics)
+        return snapshot.derived_metrics
+
     async def _check_stats_are_valid(self):
         """
         Checks that all stats are valid.
@@ -228,100 +650,179 @@ class Covid19JHUCSSEStats:
         if not self._has_been_updated:
             raise NoDataAvailable()
 
+    @contextmanager
+    def _time_phase(self, phase: str):
+        """
+        Times a stage of the update, storing the result (in seconds) in self.phase_timings.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_timings[phase] = time.perf_counter() - start_time
+            self.logger.info(f"Phase {phase} took {self.phase_timings[phase]:.2f} seconds.")
+
+    def _needs_full_refresh(self, snapshot: JHUSnapshot) -> bool:
+        if not self.incremental_days or not len(snapshot.global_historical_stats) or self._reconcile_requested:
+            return True
+        # history loaded from a snapshot may be missing more days than an incremental update fetches
+        if self._last_full_refresh is None:
+            return True
+        return time.monotonic() - self._last_full_refresh >= self.full_refresh_interval
+
+    async def _fetch_many(self, session: aiohttp.ClientSession, urls: Dict[Hashable, str]) -> dict:
+        return await fetch_many(session, urls,
+                                max_concurrency=self.max_concurrency,
+                                timeout=self.request_timeout,
+                                retries=self.request_retries,
+                                raw=True,
+                                **_conditional_get(self))
+
     async def update_covid_19_virus_stats(self, *, session: aiohttp.ClientSession = None):
         """
         Updates the stats, parses them, and loads it into memory.
 
-        :param session: Optional: aiohttp.ClientSession to use. Defaults to making a new session.
+        Per-country and per-state data is fetched concurrently (see fetch_many), so a update takes about as long as
+        the slowest request instead of the sum of all of them. How long each phase took is stored in
+        self.phase_timings.
+
+        Once the whole history has been loaded, updates only fetch the latest self.incremental_days days and merge
+        them in. The whole history is fetched again every self.full_refresh_interval seconds, and on the next update
+        whenever the latest days couldn't be merged or upstream changed days that were already loaded.
+
+        The new data is put together in a new JHUSnapshot (starting from the current one, for anything that didn't
+        change) which is only published once complete, so readers never see a half-done update. Only the downloads
+        happen in the event loop: the bodies are parsed by parse_jhu_update, in self.ingest_worker.
+
+        :param session: Optional: aiohttp.ClientSession to use. Defaults to the shared pooled session.
         :return: None
         :raises NetworkException: if a AIOHttp error is raised, this error is raised. You can get the original
                                   exception via e.exc.
         """
         self._update_tries += 1
-        self.logger.info('Opening new AIOHttp session...')
-        session = session or aiohttp.ClientSession()
-        async with session as session:
-            self.logger.info("Getting ISO codes...")
-            await self.iso_codes.update_data()
-            self.logger.info("Done!")
+        session = session or self.http_pool.session
+        self._validators = self.http_pool.validators.stage()
+        previous = self.snapshot
+        bodies = JHUBodies(countries={}, states={})
+        full = self._needs_full_refresh(previous)
+        lastdays = "all" if full else self.incremental_days
+        self.logger.info(f"Starting a {'full' if full else 'incremental'} update.")
+        with self._time_phase("iso_codes"):
+            if self._owns_country_registry:
+                try:
+                    await _update_country_registry(self, session, self.base_url)
+                except NetworkException as e:
+                    await _handle_client_exceptions(self, e)
+                    return
+            country_list = self.country_registry.records
+        with self._time_phase("global"):
             self.logger.info("Getting new global data...")
             try:
-                data: dict = await get_data(session,
-                                            "https://disease.sh/v3/covid-19/historical/all?lastdays=all&allowNull=1")
+                bodies = bodies._replace(global_stats=await get_data(
+                    session, f"{self.base_url}/v3/covid-19/historical/all?lastdays={lastdays}&allowNull=1", raw=True,
+                    **_conditional_get(self)))
+            except DataNotModified:
+                self.skipped_stages["global"] += 1
             except NetworkException as e:
                 await _handle_client_exceptions(self, e)
                 return
-            self.global_historical_stats = data
+        with self._time_phase("countries"):
             self.logger.info("Getting country stats...")
-            for code in self.iso_codes.iso_codes:
-                try:
-                    data: dict = await get_data(session,
-                                                f"https://disease.sh/v3/covid-19/historical/{code['iso2']}"
-                                                f"?lastdays=all&allowNull=1")
-                except NetworkException as e:
-                    if e.exc.code == 404:
-                        continue
-                self.countries[code["iso2"]] = data
+            results = await self._fetch_many(session, {
+                country.iso2: f"{self.base_url}/v3/covid-19/historical/{country.iso2}?lastdays={lastdays}"
+                              f"&allowNull=1"
+                for country in country_list
+            })
+            for iso2, data in results.items():
+                if isinstance(data, DataNotModified):
+                    self.skipped_stages["countries"] += 1
+                elif isinstance(data, NetworkException):
+                    if data.status != 404:
+                        self.logger.warning(f"Failed to get historical data for {iso2}: {data.exc!r}")
+                else:
+                    bodies.countries[iso2] = data
+        with self._time_phase("provinces"):
             self.logger.info("Getting provincial stats...")
-            data: list = await get_data(session, "https://disease.sh/v3/covid-19/historical?lastdays=all")
-            for country in self.iso_codes.iso_codes:
-                cty_data = {}
-                for i in filter(lambda x: x["country"] == country["country"], data):
-                    if i["province"] is None:
-                        cty_data["all"] = i
-                        self.countries[i["country"]] = i
-                    else:
-                        cty_data[i["province"]] = i
-                        self.provinces[i["province"].lower()] = i
-                self.historical_stats[country["iso2"]] = cty_data
+            try:
+                bodies = bodies._replace(provinces=await get_data(
+                    session, f"{self.base_url}/v3/covid-19/historical?lastdays={lastdays}", raw=True,
+                    **_conditional_get(self)))
+            except DataNotModified:
+                self.skipped_stages["provinces"] += 1
+            except NetworkException as e:
+                await _handle_client_exceptions(self, e)
+                return
+        with self._time_phase("states"):
             self.logger.info("Getting US states...")
-            data: list = await get_data(session, "https://disease.sh/v3/covid-19/historical/usacounties?lastdays=all")
-            self.american_states = data
-            for state in data:
-                state_data = await get_data(session, f"https://disease.sh/v3/covid-19/historical/usacounties/{state}?"
-                                                     f"lastdays=all")
-                sd = {"all": {"timeline": {"cases": {}, "deaths": {}}}}
-
-                def check(y):
-                    if y is None or y["county"] is None:
-                        return False
-                    return not y["county"].startswith("out of") or y["county"] == "unassigned"
-
-                for county, i in zip(filter(check, state_data), range(len(state_data))):
-                    if i == 0:
-                        for j in ["cases", "deaths"]:
-                            tc = {}
-                            for k in county["timeline"][j]:
-                                tc[k] = 0
-                            sd["all"]["timeline"][j] = tc
-
-                    for j in ["cases", "deaths"]:
-                        tc = sd["all"]["timeline"][j]
-                        for k in county["timeline"][j]:
-                            tc[k] += county["timeline"][j][k]
-                        sd["all"]["timeline"][j] = tc
-
-                    sd[county["county"]] = county
-                self.american_state_stats[state] = sd
-        self.last_updated_utc = datetime.datetime.utcnow()
+            try:
+                data: list = await get_data(session,
+                                            f"{self.base_url}/v3/covid-19/historical/usacounties?lastdays=all")
+            except NetworkException as e:
+                await _handle_client_exceptions(self, e)
+                return
+            american_states = tuple(data)
+            results = await self._fetch_many(session, {
+                state: f"{self.base_url}/v3/covid-19/historical/usacounties/{state}?lastdays={lastdays}"
+                for state in data
+            })
+            for state, state_data in results.items():
+                if isinstance(state_data, DataNotModified):
+                    self.skipped_stages["states"] += 1
+                elif isinstance(state_data, NetworkException):
+                    self.logger.warning(f"Failed to get county data for {state}: {state_data.exc!r}")
+                else:
+                    bodies.states[state] = state_data
+        changed = bodies.global_stats is not None or bodies.countries or bodies.provinces is not None or \
+            bodies.states or american_states != previous.american_states
+        if not changed:
+            self.logger.info("Nothing changed upstream, keeping the current snapshot.")
+            self.snapshot = previous._replace(last_updated_utc=datetime.datetime.utcnow())
+            self._validators.commit()
+        else:
+            with self._time_phase("parse"):
+                snapshot, merge_stats = await self.ingest_worker.run(
+                    parse_jhu_update, previous._replace(derived_metrics=None), bodies, country_list, american_states,
+                    full, self.country_registry.populations())
+            self.refresh_stats.update(merge_stats)
+            if merge_stats["failed_merges"] or merge_stats["revised_days"]:
+                self._reconcile_requested = True
+            await _publish_snapshot(self, snapshot._replace(version=next_data_version(),
+                                                            last_updated_utc=datetime.datetime.utcnow()))
         self._has_been_updated = True
         self.data_is_valid = True
-        self.logger.info("Done!")
+        if full:
+            self._last_full_refresh = time.monotonic()
+            self._reconcile_requested = False
+            self.refresh_stats["full"] += 1
+        else:
+            self.refresh_stats["incremental"] += 1
+            if self._reconcile_requested:
+                self.logger.info("Some of the latest days didn't match what was loaded, next update will be full.")
+        self.logger.info(f"Done! Total time: {sum(self.phase_timings.values()):.2f} seconds.")
 
     async def try_to_get_name(self, name: str) -> Optional[Tuple[str, Optional[str]]]:
-        name = name.lower()
-        if name in ("global", "world", "ot"):
-            return "world", None
-        possible_country_names = (get_country_name(name, self.iso_codes.iso_codes),
-                                  get_iso2_code(name, self.iso_codes.iso_codes),
-                                  get_iso3_code(name, self.iso_codes.iso_codes))
-        if name in (x.lower() for x in possible_country_names if x is not None):
-            return "country", name
-        elif name in self.provinces:
-            return "province", name
-        elif name in self.american_states:
-            return "state", name
-        return None
+        """
+        Works out what a name refers to.
+
+        :param name: Country name/ISO2/ISO3 code/common alias, province or US state. Case and accents don't matter.
+        :return: ("world", None), ("country", country name), ("province", province) or ("state", state), with the names
+                 lowercased. None if nothing matches.
+        """
+        return self.name_index.lookup(name)
+
+    async def suggest_names(self, name: str, *location_types: str, limit: int = 3) -> List[Tuple[str, Optional[str]]]:
+        """
+        Finds the names closest to one try_to_get_name didn't know, for "did you mean" messages.
+
+        :param name: The unknown name.
+        :param location_types: Only suggest these types of location. Every type if none are given.
+        :param limit: Maximum number of suggestions.
+        :return: List of (location type, name) tuples, as returned by try_to_get_name, best match first.
+        """
+        index = self.name_index
+        if self._name_matcher.version != index.version:
+            self._name_matcher = NameMatcher(index)
+        return self._name_matcher.suggest(name, location_types=location_types, limit=limit)
 
     @staticmethod
     async def _parse_datetime_strings(data_dict: dict):
@@ -331,24 +832,18 @@ class Covid19JHUCSSEStats:
         :param data_dict: Dictionary of data that will be parsed.
         :return: Same data dict, but with date objects instead of strings.
         """
-        out_dict = {}
-        for key in data_dict:
-            if isinstance(key, str):
-                continue
-            dt = from_time_to_date(time.strptime(key, "%m/%d/%y"))
-            out_dict[dt] = data_dict[key]
-        return out_dict
+        return {parse_date(key) if isinstance(key, str) else key: value for key, value in data_dict.items()}
 
     async def get_country_stats(self, country: str):
         """
         Return historical stats for any given country.
 
-        :param country: ISO-3166 2-digit country code, or anything accepted by get_iso2_code.
+        :param country: ISO-3166 2-digit country code, or any other name of the country try_to_get_name knows.
         :return: The stats for the country if found. Provinces are included in the data. If not found, returns None.
         """
         await self._check_stats_are_valid()
         if country not in self.countries:
-            iso2_code = get_iso2_code(country.lower(), self.iso_codes.iso_codes)
+            iso2_code = self.name_index.get_iso2_code(country)
             if iso2_code not in self.countries:
                 raise CountryNotFound()
         else:
@@ -371,28 +866,52 @@ class Covid19JHUCSSEStats:
             return self.american_state_stats[state]["all"]
         raise ProvinceNotFound()
 
+    def _derived_metrics_key(self, location_type: str, name: Optional[str]) -> Tuple[str, Optional[str]]:
+        if location_type == "country" and name not in self.countries:
+            iso2_code = self.name_index.get_iso2_code(name)
+            if iso2_code not in self.countries:
+                raise CountryNotFound()
+            return location_type, iso2_code
+        elif location_type in ("province", "state"):
+            return location_type, name.lower()
+        return location_type, name
+
+    async def get_derived_stats(self, location_type: str, name: Optional[str] = None) -> TimeSeries:
+        """
+        Returns the metrics derived from the historical stats of a location: new cases and deaths, their 7 and 14 day
+        averages, growth rate, doubling time and per capita rates (see utils.derived_metrics).
+
+        :param location_type: "world", "country", "province" or "state", as returned by try_to_get_name.
+        :param name: Name of the location, as returned by try_to_get_name. Countries can also be given by ISO2 code.
+        :return: TimeSeries with one float64 column per metric. Undefined values are NaN.
+        :raises CountryNotFound: if the country isn't known.
+        :raises ProvinceNotFound: if the province or state isn't known.
+        """
+        await self._check_stats_are_valid()
+        series = self.derived_metrics.get(*self._derived_metrics_key(location_type, name))
+        if series is None:
+            raise CountryNotFound() if location_type in (WORLD, "country") else ProvinceNotFound()
+        return series
+
+    async def get_latest_derived_stats(self, location_type: str, name: Optional[str] = None) \
+            -> Dict[str, Optional[float]]:
+        """
+        Like get_derived_stats, but only returns the value of every metric on the latest day, with None for undefined
+        values.
+        """
+        await self._check_stats_are_valid()
+        latest = self.derived_metrics.get_latest(*self._derived_metrics_key(location_type, name))
+        if latest is None:
+            raise CountryNotFound() if location_type in (WORLD, "country") else ProvinceNotFound()
+        return latest
+
     @staticmethod
-    async def _get_stats_for_day(stats: dict, date: datetime.date):
-        if date in stats["timeline"]["cases"]:
-            return {"cases": stats["timeline"]["cases"][date],
-                    "recovered": stats["timeline"]["recovered"][date],
-                    "deaths": stats["timeline"]["deaths"][date]}
-        date_str = f"{date.month}/{date.day}/{str(date.year)[2:4]}"
-        if date_str in stats["timeline"]["cases"]:
-            return {"cases": stats["timeline"]["cases"][date_str],
-                    "recovered": stats["timeline"]["recovered"][date_str],
-                    "deaths": stats["timeline"]["deaths"][date_str]}
-        return None
+    async def _get_stats_for_day(stats: dict, date: datetime.date) -> Optional[Dict[str, int]]:
+        return stats["timeline"].at(date)
 
     @staticmethod
-    async def _get_stats_for_dates(stats: dict, dates: List[datetime.date]):
-        final_data = {"cases": {},
-                      "recovered": {},
-                      "deaths": {}}
-        for key in ["cases", "recovered", "deaths"]:
-            for date in filter(lambda x: x in dates, stats["timeline"][key]):
-                final_data[key][date] = stats["timeline"][key][date]
-        return final_data
+    async def _get_stats_for_dates(stats: dict, dates: List[datetime.date]) -> Dict[str, Dict[datetime.date, int]]:
+        return stats["timeline"].select(dates)
 
     async def get_country_stats_for_day(self, country: str, date: datetime.date):
         """"""
@@ -415,13 +934,33 @@ class Covid19JHUCSSEStats:
         return await self._get_stats_for_dates(cty_stats, dates)
 
 
+@register_type
+class WorldometersSnapshot(NamedTuple):
+    """
+    Everything Covid19StatsWorldometers serves, as of one update. Never modified once published.
+    """
+    version: int = 0
+    last_updated_utc: datetime.datetime = datetime.datetime.utcfromtimestamp(-1)
+    global_stats: Optional[LocationStats] = None
+    country_stats: Mapping[str, LocationStats] = MappingProxyType({})
+    continent_stats: Tuple[LocationStats, ...] = ()
+    continents: Tuple[str, ...] = ()
+    american_states: Tuple[str, ...] = ()
+    american_state_stats: Mapping[str, LocationStats] = MappingProxyType({})
+    country_records: Tuple[CountryRecord, ...] = ()
+    rankings: Optional[CountryRankings] = None
+
+
 class Covid19StatsWorldometers:
     """
     Class for stats on COVID-19 via the https://disease.sh API's Worldometers section.
     """
+    SNAPSHOT_NAME = "worldometers_v2"  # v1 snapshots held the raw JSON instead of LocationStats
 
     def __init__(self, add_ids: bool = False, *, update_stats: bool = False,
-                 logging_level=logging.INFO):
+                 logging_level=logging.INFO, http_pool: Optional[PooledHTTPClient] = None,
+                 snapshot_store: Optional[SnapshotStore] = None,
+                 country_registry: Optional[CountryRegistry] = None, base_url: str = DISEASE_SH_URL):
         """
         Class to get data about COVID-19 for every country (data from Worldometers).
 
@@ -429,6 +968,11 @@ class Covid19StatsWorldometers:
         :param update_stats: Whether to update stats on class initalization or wait for a explicit call to do so.
                              Doing it in the __init__ makes the init time a lot longer, and it's synchronous: for this
                              reason, it defaults to being disabled.
+        :param http_pool: Optional: shared PooledHTTPClient to make requests with. Defaults to making a new one.
+        :param snapshot_store: Optional: SnapshotStore to save every new snapshot to, and to load the last one from.
+        :param country_registry: Optional: CountryRegistry to keep up to date with the country list, which is part of
+                                 the country stats anyway. Defaults to making a new one.
+        :param base_url: Optional: URL of the disease.sh API (or of something serving the same paths) to use.
         """
         self.logger: logging.Logger = logging.Logger("COVID-19 Stats Worldometers", level=logging_level)
         self.logger.setLevel(logging_level)
@@ -437,88 +981,202 @@ class Covid19StatsWorldometers:
         self._update_tries: int = 0
         self.data_is_valid: bool = False
         self.add_ids: bool = add_ids
-        self.last_updated_utc: datetime.datetime = datetime.datetime.utcfromtimestamp(-1)
-        self.global_stats: dict = {}
-        self.country_stats: Dict[dict] = {}
-        self.continent_stats: list = []
-        self.continents: list = []
-        self.american_states: list = []
-        self.american_state_stats: Dict[dict] = {}
-        self.iso_codes: List[dict] = []
+        self.snapshot: WorldometersSnapshot = WorldometersSnapshot()
+        self.snapshot_store: Optional[SnapshotStore] = snapshot_store
+        self._name_index: NameIndex = NameIndex(version=-1)
+        self._name_matcher: NameMatcher = NameMatcher(self._name_index)
+        self.http_pool: PooledHTTPClient = http_pool or PooledHTTPClient()
+        self._validators: StagedValidators = self.http_pool.validators.stage()
+        self.country_registry: CountryRegistry = CountryRegistry() if country_registry is None else country_registry
+        self.base_url: str = base_url
+        self.skipped_stages: collections.Counter = collections.Counter()
+        self.retries_are_managed: bool = False
         if update_stats:
             self.update_covid_19_virus_stats()
 
     async def _do_update(self):
         await self.update_covid_19_virus_stats()
 
+    def load_snapshot(self) -> bool:
+        return _load_snapshot(self)
+
+    @property
+    def data_version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def last_updated_utc(self) -> datetime.datetime:
+        return self.snapshot.last_updated_utc
+
+    @property
+    def global_stats(self) -> Optional[LocationStats]:
+        return self.snapshot.global_stats
+
+    @property
+    def country_stats(self) -> Mapping[str, LocationStats]:
+        return self.snapshot.country_stats
+
+    @property
+    def continent_stats(self) -> Tuple[LocationStats, ...]:
+        return self.snapshot.continent_stats
+
+    @property
+    def continents(self) -> Tuple[str, ...]:
+        return self.snapshot.continents
+
+    @property
+    def american_states(self) -> Tuple[str, ...]:
+        return self.snapshot.american_states
+
+    @property
+    def american_state_stats(self) -> Mapping[str, LocationStats]:
+        return self.snapshot.american_state_stats
+
+    @property
+    def iso_codes(self) -> Tuple[CountryRecord, ...]:
+        return self.country_registry.records
+
+    @property
+    def name_index(self) -> NameIndex:
+        """
+        Index of every name try_to_get_name knows, rebuilt whenever the data or the country registry changes.
+        """
+        snapshot = self.snapshot
+        version = max(snapshot.version, self.country_registry.version)  # versions are shared, and only go up
+        if self._name_index.version != version:
+            self._name_index = NameIndex.build(self.country_registry, version=version,
+                                               continent=snapshot.continents, state=snapshot.american_states)
+        return self._name_index
+
+    @property
+    def rankings(self) -> CountryRankings:
+        snapshot = self.snapshot
+        if snapshot.rankings is None:  # snapshot saved before rankings existed
+            snapshot = self.snapshot = snapshot._replace(rankings=_build_rankings(snapshot.country_stats))
+        return snapshot.rankings
+
     # noinspection PyTypeChecker
     async def update_covid_19_virus_stats(self, *, session: aiohttp.ClientSession = None):
         """
-        Updates the stats, parses them, and loads it into memory.
+        Updates the stats, parses them, and loads it into memory. Everything is put together in a new
+        WorldometersSnapshot that replaces the current one in a single step once complete. The country list is
+        published to the country registry at the same time.
 
-        :param session: Optional: aiohttp.ClientSession to use. Defaults to making a new session.
+        :param session: Optional: aiohttp.ClientSession to use. Defaults to the shared pooled session.
         :return: None
         :raises NetworkException: if a AIOHttp error is raised, this error is raised. You can get the original
                                   exception via e.exc.
         """
         self._update_tries += 1
-        self.logger.info('Opening new AIOHttp session...')
-        session = session if session is not None else aiohttp.ClientSession()
-        async with session as session:
-            self.logger.info("Getting new country data...")
-            try:
-                data = await get_data(session, "https://disease.sh/v3/covid-19/countries?allowNull=true")
-            except NetworkException as e:
-                await _handle_client_exceptions(self, e)
-                return
+        session = session or self.http_pool.session
+        self._validators = self.http_pool.validators.stage()
+        previous = self.snapshot
+        country_stats = previous.country_stats
+        country_records = previous.country_records
+        global_stats = previous.global_stats
+        continent_stats = previous.continent_stats
+        continents = previous.continents
+        american_states = previous.american_states
+        american_state_stats = previous.american_state_stats
+        rankings = previous.rankings
+        changed = False
+        self.logger.info("Getting new country data...")
+        try:
+            data = await get_data(session, f"{self.base_url}/v3/covid-19/countries?allowNull=true",
+                                  **_conditional_get(self))
+        except DataNotModified:
+            self.logger.info("Country data hasn't changed, keeping what is loaded.")
+            self.skipped_stages["countries"] += 1
+        except NetworkException as e:
+            await _handle_client_exceptions(self, e)
+            return
+        else:
             self.logger.info("Got country data! Parsing data and loading it into memory...")
-            self.iso_codes = []  # uh nice typo
+            changed = True
+            country_stats = {}
+            country_records = []
             for country in data:
-                if country['countryInfo']['iso2'] is not None:
-                    try:
-                        country["activeCaseChange"] = int(country["todayCases"]) - (country["todayDeaths"] +
-                                                                                    country["todayRecovered"])
-                    except TypeError:
-                        country["activeCaseChange"] = None
-                    self.country_stats[country['countryInfo']['iso2']] = country
-                    iso_code = dict(country=country["country"], iso2=country["countryInfo"]["iso2"],
-                                    iso3=country["countryInfo"]["iso3"])
-                    self.iso_codes.append(iso_code)
-            self.logger.info("Getting world stats...")
-            self.global_stats = await get_data(session, "https://disease.sh/v3/covid-19/all?allowNull=true")
-            self.logger.info("Got world stats.")
-            self.logger.info("Getting continent stats...")
-            self.continent_stats = await get_data(session, "https://disease.sh/v3/covid-19/continents?allowNull=true")
-            for continent in self.continent_stats:
-                self.continents.append(continent["continent"])
-            self.logger.info("Got continent stats.")
-            self.logger.info("Getting American state stats...")
-            us_state_stats = await get_data(session, "https://disease.sh/v3/covid-19/states?allowNull=true")
-            for state in us_state_stats:
-                self.american_states.append(state["state"].lower())
-                self.american_state_stats[state["state"].lower()] = state
-        self.last_updated_utc = datetime.datetime.utcnow()
+                record = CountryRecord.from_json(country)
+                if record is not None:
+                    country_stats[record.iso2] = LocationStats.from_json(country, record.country)
+                    country_records.append(record)
+            country_records = tuple(country_records)
+            rankings = _build_rankings(country_stats)
+        self.logger.info("Getting world stats...")
+        try:
+            data = await get_data(session, f"{self.base_url}/v3/covid-19/all?allowNull=true", **_conditional_get(self))
+        except DataNotModified:
+            self.skipped_stages["world"] += 1
+        else:
+            global_stats = LocationStats.from_json(data, "World")
+            changed = True
+        self.logger.info("Got world stats.")
+        self.logger.info("Getting continent stats...")
+        try:
+            data = await get_data(session, f"{self.base_url}/v3/covid-19/continents?allowNull=true",
+                                  **_conditional_get(self))
+        except DataNotModified:
+            self.skipped_stages["continents"] += 1
+        else:
+            continent_stats = tuple(LocationStats.from_json(continent, continent["continent"]) for continent in data)
+            continents = tuple(continent.name for continent in continent_stats)
+            changed = True
+        self.logger.info("Got continent stats.")
+        self.logger.info("Getting American state stats...")
+        try:
+            us_state_stats = await get_data(session, f"{self.base_url}/v3/covid-19/states?allowNull=true",
+                                            **_conditional_get(self))
+        except DataNotModified:
+            self.skipped_stages["states"] += 1
+        else:
+            american_state_stats = {state["state"].lower(): LocationStats.from_json(state, state["state"])
+                                    for state in us_state_stats}
+            american_states = tuple(american_state_stats)
+            changed = True
+        if not changed:
+            self.snapshot = previous._replace(last_updated_utc=datetime.datetime.utcnow())
+            self._validators.commit()
+        else:
+            _publish_countries(self.country_registry, country_records)
+            await _publish_snapshot(self, WorldometersSnapshot(version=next_data_version(),
+                                                               last_updated_utc=datetime.datetime.utcnow(),
+                                                               global_stats=global_stats,
+                                                               country_stats=_frozen(country_stats),
+                                                               continent_stats=continent_stats,
+                                                               continents=continents,
+                                                               american_states=american_states,
+                                                               american_state_stats=_frozen(american_state_stats),
+                                                               country_records=country_records,
+                                                               rankings=rankings))
         self._has_been_updated = True
         self.data_is_valid = True
         self._flag.set()
         self.logger.info("Done!")
 
     async def try_to_get_name(self, test_name: str) -> Optional[Tuple[str, Optional[str]]]:
-        test_name = test_name.lower()
-        if test_name in ("global", "world", "ot"):
-            return "world", None
-        possible_country_names = (get_country_name(test_name, self.iso_codes),
-                                  get_iso2_code(test_name, self.iso_codes),
-                                  get_iso3_code(test_name, self.iso_codes))
-        if test_name in (x.lower() for x in possible_country_names if x is not None):
-            return "country", test_name
-        for name in self.continents:
-            if test_name == name.lower():
-                return "continent", test_name
-        for name in self.american_states:
-            if test_name == name.lower():
-                return "state", test_name
-        return None
+        """
+        Works out what a name refers to.
+
+        :param test_name: Country name/ISO2/ISO3 code/common alias, continent or US state. Case and accents don't
+                          matter.
+        :return: ("world", None), ("country", country name), ("continent", continent) or ("state", state), with the
+                 names lowercased. None if nothing matches.
+        """
+        return self.name_index.lookup(test_name)
+
+    async def suggest_names(self, name: str, *location_types: str, limit: int = 3) -> List[Tuple[str, Optional[str]]]:
+        """
+        Finds the names closest to one try_to_get_name didn't know, for "did you mean" messages.
+
+        :param name: The unknown name.
+        :param location_types: Only suggest these types of location. Every type if none are given.
+        :param limit: Maximum number of suggestions.
+        :return: List of (location type, name) tuples, as returned by try_to_get_name, best match first.
+        """
+        index = self.name_index
+        if self._name_matcher.version != index.version:
+            self._name_matcher = NameMatcher(index)
+        return self._name_matcher.suggest(name, location_types=location_types, limit=limit)
 
     async def _check_stats_are_valid(self):
         """
@@ -532,39 +1190,38 @@ class Covid19StatsWorldometers:
         elif not self._flag.is_set():
             raise NoDataAvailable()
 
-    async def get_all_iso_codes(self) -> list:
+    async def get_all_iso_codes(self) -> Tuple[CountryRecord, ...]:
         """
         Returns a global ISO code/country name list for all countries.
 
-        :return: List of all ISO2/ISO3/country name mappings.
+        :return: The record (name, ISO2 and ISO3 codes) of every country.
         """
         await self._check_stats_are_valid()
         return self.iso_codes  # waaaaaaay too simple lol
 
-    async def get_global_stats(self) -> dict:
+    async def get_global_stats(self) -> LocationStats:
         """
         Returns stats for the world.
 
-        :return: Dictionary of data about the world stats.
+        :return: The world stats.
         """
         await self._check_stats_are_valid()
         return self.global_stats
 
     # noinspection PyTypeChecker
-    async def get_country_stats(self, iso2_code: str) -> Optional[dict]:
+    async def get_country_stats(self, iso2_code: str) -> Optional[LocationStats]:
         """
         Returns stats on a single country.
 
         :param iso2_code: ISO2 code for the country to return data for. Does not need to be a ISO2 code, will be
                           converted automatically.
 
-        :return: Dictionary of data about the country (formatted the same as in get_global_stats). If a country is not
-                 found, returns None.
+        :return: The stats of the country. If a country is not found, returns None.
         """
         await self._check_stats_are_valid()
         iso2_code = iso2_code.upper()
         if len(iso2_code) != 2 or iso2_code not in self.country_stats:
-            iso2_code = get_iso2_code(iso2_code, self.iso_codes)
+            iso2_code = self.name_index.get_iso2_code(iso2_code)
         if iso2_code not in self.country_stats:
             return None
         return self.country_stats[iso2_code]
@@ -585,28 +1242,32 @@ class Covid19StatsWorldometers:
         else:
             return self.country_stats
 
-    async def get_sorted_list(self, sort_id: str, *,
-                              reverse: bool = False) -> list:
+    async def get_sorted_list(self, sort_id: str, *, reverse: bool = False, limit: Optional[int] = None) -> list:
         """
-        Returns a list of data, sorted by the value passed in.
+        Returns a list of data, sorted by the value passed in. Countries the value is unknown for are left out.
 
-        :param sort_id: The key to sort by. Must be one of ("cases", "recovered", "deaths", "critical", "tests",
-                        "population")
+        :param sort_id: The key to sort by. Must be one of RANKING_TYPES: one of ("cases", "recovered", "deaths",
+                        "critical", "tests", "population"), or any of them but population followed by
+                        "_per_million" to rank by value per million inhabitants.
         :param reverse: If true, sort by least first.
+        :param limit: Optional: maximum number of countries to return.
         :return: List of data, sorted by the key passed in.
         :raises IncorrectSortType: when the sort type is incorrect.
         """
+        return [stats for stats, _ in await self.get_ranking(sort_id, reverse=reverse, limit=limit)]
+
+    async def get_ranking(self, sort_id: str, *, reverse: bool = False,
+                          limit: Optional[int] = None) -> List[Tuple[LocationStats, float]]:
+        """
+        Like get_sorted_list, but returns the value each country is ranked by alongside it, as (country data, value)
+        tuples. Use this for the per capita rankings, which aren't in the country data.
+        """
         await self._check_stats_are_valid()
         sort_id = str(sort_id).lower()
-        if sort_id not in SORT_TYPES:
+        if sort_id not in RANKING_TYPES:
             raise IncorrectSortType("Need to sort by a valid sort type!")
-        country_list = await self.get_all_country_stats(use_list=True)
-        try:
-            self.logger.info(f"Country list: {country_list}")
-            self.logger.info(f"Sort ID: {sort_id}")
-            return sorted(country_list, key=lambda k: k[sort_id], reverse=not reverse)
-        except TypeError:
-            raise IncorrectSortType()
+        return [(self.country_stats[iso2], value)
+                for iso2, value in self.rankings.top(sort_id, limit, reverse=reverse)]
 
     async def get_single_data(self, data: str):
         """
@@ -621,7 +1282,7 @@ class Covid19StatsWorldometers:
         country_list = await self.get_all_country_stats(use_list=True)
         final_data = {}
         for country in country_list:
-            final_data[country['countryInfo']['iso2']] = country[data]
+            final_data[country.iso2] = getattr(country, data)
         return final_data
 
     async def get_continent_stats(self, continent_name: str):
@@ -630,7 +1291,7 @@ class Covid19StatsWorldometers:
             return None
         else:
             for continent in self.continent_stats:
-                if continent_name.lower() == continent["continent"].lower():
+                if continent_name.lower() == continent.name.lower():
                     return continent
 
     async def get_state_stats(self, state_name: str):
@@ -641,13 +1302,28 @@ class Covid19StatsWorldometers:
             return self.american_state_stats[state_name.lower()]
 
 
+@register_type
+class VaccineSnapshot(NamedTuple):
+    """
+    Everything VaccineStats serves, as of one update. Never modified once published.
+    """
+    version: int = 0
+    last_updated_utc: datetime.datetime = datetime.datetime.utcfromtimestamp(-1)
+    source: AnyStr = ""
+    total_candidates: int = 0
+    phases: Union[list, dict] = ()
+    catalog: VaccineCatalog = VaccineCatalog.build(())
+
+
 class VaccineStats:
     """
     Class for stats on COVID-19 via the https://disease.sh API's vaccine section.
     """
+    SNAPSHOT_NAME = "vaccine_v2"  # v1 snapshots held the raw candidates instead of a VaccineCatalog
 
     def __init__(self, add_ids: bool = False, *, update_stats: bool = False,
-                 logging_level=logging.INFO):
+                 logging_level=logging.INFO, http_pool: Optional[PooledHTTPClient] = None,
+                 snapshot_store: Optional[SnapshotStore] = None, base_url: str = DISEASE_SH_URL):
         """
         Class to get data about the COVID-19 vaccine trials.
 
@@ -655,57 +1331,263 @@ class VaccineStats:
         :param update_stats: Whether to update stats on class initalization or wait for a explicit call to do so.
                              Doing it in the __init__ makes the init time a lot longer, and it's synchronous: for this
                              reason, it defaults to being disabled.
+        :param http_pool: Optional: shared PooledHTTPClient to make requests with. Defaults to making a new one.
+        :param snapshot_store: Optional: SnapshotStore to save every new snapshot to, and to load the last one from.
+        :param base_url: Optional: URL of the disease.sh API (or of something serving the same paths) to use.
         """
         self.logger: logging.Logger = logging.Logger("COVID-19 Stats for Vaccine", level=logging_level)
         self.logger.setLevel(logging_level)
-        self.has_been_updated: bool = False
-        self.update_tries: int = 0
+        self._has_been_updated: bool = False
+        self._update_tries: int = 0
         self.data_is_valid: bool = False
         self.add_ids: bool = add_ids
-        self.last_updated_utc: datetime.datetime = datetime.datetime.utcfromtimestamp(-1)
-        self.source: AnyStr = ""
-        self.total_candidates: int = 0
-        self.phases: dict = {}
-        self.candidates: List[dict] = []
+        self.snapshot: VaccineSnapshot = VaccineSnapshot()
+        self.snapshot_store: Optional[SnapshotStore] = snapshot_store
+        self.http_pool: PooledHTTPClient = http_pool or PooledHTTPClient()
+        self._validators: StagedValidators = self.http_pool.validators.stage()
+        self.base_url: str = base_url
+        self.skipped_stages: collections.Counter = collections.Counter()
+        self.retries_are_managed: bool = False
         if update_stats:
             self.update_covid_19_vaccine_stats()
 
     async def _do_update(self):
         await self.update_covid_19_vaccine_stats()
 
+    def load_snapshot(self) -> bool:
+        return _load_snapshot(self)
+
+    @property
+    def data_version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def last_updated_utc(self) -> datetime.datetime:
+        return self.snapshot.last_updated_utc
+
+    @property
+    def source(self) -> AnyStr:
+        return self.snapshot.source
+
+    @property
+    def total_candidates(self) -> int:
+        return self.snapshot.total_candidates
+
+    @property
+    def phases(self) -> Union[list, dict]:
+        return self.snapshot.phases
+
+    @property
+    def catalog(self) -> VaccineCatalog:
+        return self.snapshot.catalog
+
+    @property
+    def candidates(self) -> Tuple[VaccineCandidate, ...]:
+        return self.snapshot.catalog.candidates
+
     # noinspection PyTypeChecker
     # PyCharm ain't smart here
     async def update_covid_19_vaccine_stats(self, *, session: Optional[aiohttp.ClientSession] = None):
-        self.update_tries += 1
-        self.logger.info('Opening new AIOHttp session...')
-        session = session or aiohttp.ClientSession()
-        async with session as session:
-            self.logger.info("Getting new vaccine data...")
-            try:
-                data = await get_data(session, "https://disease.sh/v3/covid-19/vaccine")
-            except NetworkException as e:
-                await _handle_client_exceptions(self, e)
-                return
-            self.logger.debug(f"Vaccine data: {data}")
-            self.logger.info("Got vaccine data! Parsing and loading it into memory...")
-            self.total_candidates = int(data['totalCandidates'])
-            self.source = data['source']
-            self.phases = data['phases']
-            self.candidates = data['data']
-            self.last_updated_utc = datetime.datetime.utcnow()
-            if not len(self.candidates) == self.total_candidates:
-                self.logger.fatal(f"Total number of vaccine candidates ({len(self.candidates)}) doesn't match the "
-                                  f"amount returned by the API ({self.total_candidates})! Leaving data in place to "
-                                  f"avoid more exceptions later.")
-                self.data_is_valid = False
-                return
-            self.data_is_valid = True
-            self.logger.info("Parsed and loaded vaccine data into memory sucessfully!")
+        self._update_tries += 1
+        session = session or self.http_pool.session
+        self._validators = self.http_pool.validators.stage()
+        self.logger.info("Getting new vaccine data...")
+        try:
+            data = await get_data(session, f"{self.base_url}/v3/covid-19/vaccine", **_conditional_get(self))
+        except DataNotModified:
+            self.logger.info("Vaccine data hasn't changed, skipping parsing.")
+            self.skipped_stages["vaccines"] += 1
+            self.snapshot = self.snapshot._replace(last_updated_utc=datetime.datetime.utcnow())
+            self._validators.commit()
+            return
+        except NetworkException as e:
+            await _handle_client_exceptions(self, e)
+            return
+        self.logger.debug(f"Vaccine data: {data}")
+        self.logger.info("Got vaccine data! Parsing and loading it into memory...")
+        await _publish_snapshot(self, VaccineSnapshot(version=next_data_version(),
+                                                      last_updated_utc=datetime.datetime.utcnow(),
+                                                      source=data['source'],
+                                                      total_candidates=int(data['totalCandidates']),
+                                                      phases=data['phases'],
+                                                      catalog=VaccineCatalog.build(data['data'],
+                                                                                   previous=self.catalog)))
+        if not len(self.candidates) == self.total_candidates:
+            self.logger.fatal(f"Total number of vaccine candidates ({len(self.candidates)}) doesn't match the "
+                              f"amount returned by the API ({self.total_candidates})! Leaving data in place to "
+                              f"avoid more exceptions later.")
+            self.data_is_valid = False
+            return
+        self._has_been_updated = True
+        self.data_is_valid = True
+        self.logger.info("Parsed and loaded vaccine data into memory sucessfully!")
+
+
+@register_type
+class OWIDCountryData:
+    def __init__(self, info: dict, dates: List[str], columns: Dict[str, Union[numpy.ndarray, tuple]]):
+        """
+        Compact, column-oriented copy of the OWID data for one location. Instead of a dictionary per day, every metric
+        is a single float64 array (NaN where OWID has no value) indexed the same way as dates. The few metrics that
+        aren't numbers are kept as tuples.
+
+        The position of every date and of the latest known value of every metric are worked out when the data is
+        loaded (and saved along with it in snapshots), so looking up a day or the latest stats doesn't scan any rows.
+
+        :param info: The location's static data (population, median age...), without the "data" key.
+        :param dates: The dates (as YYYY-MM-DD strings) of every row, oldest first.
+        :param columns: Dictionary of metric name -> values for every row.
+        """
+        self.info: dict = info
+        self.dates: List[str] = dates
+        self.columns: Dict[str, Union[numpy.ndarray, tuple]] = columns
+
+    @classmethod
+    def from_json(cls, location: dict) -> "OWIDCountryData":
+        """
+        Builds the columns out of a location as found in the raw OWID JSON. The dictionary passed in is consumed.
+        """
+        rows = location.pop("data", [])
+        dates = [row.pop("date") for row in rows]
+        columns = {}
+        for key in dict.fromkeys(key for row in rows for key in row):
+            values = [row.get(key) for row in rows]
+            if any(isinstance(value, str) for value in values):
+                columns[key] = tuple(values)
+            else:
+                columns[key] = numpy.array([numpy.nan if value is None else value for value in values],
+                                           dtype=numpy.float64)
+        data = cls(location, dates, columns)
+        data.positions, data.latest_positions  # index while ingesting, not on the first request
+        return data
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, key: str):
+        return self.info[key]
+
+    def get(self, key: str, default=None):
+        return self.info.get(key, default)
+
+    @functools.cached_property
+    def positions(self) -> Dict[str, int]:
+        """
+        Dictionary of date (YYYY-MM-DD) -> index of its row.
+        """
+        return {date: i for i, date in enumerate(self.dates)}
+
+    @functools.cached_property
+    def latest_positions(self) -> Dict[str, int]:
+        """
+        Dictionary of metric name -> index of the latest row that has a value for it. Metrics that never have a value
+        are left out.
+        """
+        latest_positions = {}
+        for key, column in self.columns.items():
+            if isinstance(column, numpy.ndarray):
+                known = numpy.flatnonzero(~numpy.isnan(column))
+                if len(known):
+                    latest_positions[key] = int(known[-1])
+            else:
+                for i in range(len(column) - 1, -1, -1):
+                    if column[i] is not None:
+                        latest_positions[key] = i
+                        break
+        return latest_positions
+
+    @staticmethod
+    def _value(column: Union[numpy.ndarray, tuple], index: int):
+        value = column[index]
+        if isinstance(column, numpy.ndarray):
+            return None if numpy.isnan(value) else float(value)
+        return value
+
+    def position(self, date: Union[str, datetime.date]) -> Optional[int]:
+        """
+        Returns the index of the row for a day, or None if there isn't one.
+
+        :param date: The day, as a date or a YYYY-MM-DD string.
+        """
+        if isinstance(date, datetime.date):
+            date = date.isoformat()
+        return self.positions.get(date)
+
+    def row(self, index: int) -> dict:
+        """
+        Returns a single day, formatted like the rows of the raw OWID data: the date plus every metric that has a value
+        on that day.
+
+        :param index: Index of the day in dates. Negative indexes count from the latest day.
+        """
+        row = {"date": self.dates[index]}
+        for key, column in self.columns.items():
+            value = self._value(column, index)
+            if value is not None:
+                row[key] = value
+        return row
+
+    def latest(self, key: str):
+        """
+        Returns the latest known value of a metric, or None if it never had one.
+        """
+        index = self.latest_positions.get(key)
+        return None if index is None else self._value(self.columns[key], index)
+
+    def latest_row(self) -> dict:
+        """
+        Returns the latest known value of every metric, formatted like a row. The date is the one of the latest row
+        with a total case count (the last day with a complete report), or of the latest row if none have one.
+        """
+        row = {key: self._value(self.columns[key], index) for key, index in self.latest_positions.items()}
+        if self.dates:
+            row["date"] = self.dates[self.latest_positions.get("total_cases", -1)]
+        return row
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values() if isinstance(column, numpy.ndarray))
+
+
+def parse_owid_file(path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Dict[str, OWIDCountryData]:
+    """
+    Parses the OWID JSON file one location at a time, turning every location into an OWIDCountryData straight away.
+    This is the CPU-heavy part of an OWID update: it runs in an IngestWorker.
+
+    :param path: Path of the downloaded file.
+    :return: Dictionary of ISO3 code -> data.
+    :raises ValueError: if the file isn't a complete JSON object.
+    """
+    splitter = JSONObjectSplitter()
+    data = {}
+    with open(path, "rb") as f:
+        for chunk in iter(functools.partial(f.read, chunk_size), b""):
+            for iso_code, location in splitter.feed(chunk):
+                data[iso_code] = OWIDCountryData.from_json(location)
+    for iso_code, location in splitter.close():
+        data[iso_code] = OWIDCountryData.from_json(location)
+    return data
+
+
+@register_type
+class OWIDSnapshot(NamedTuple):
+    """
+    Everything OWIDData serves, as of one update. Never modified once published.
+    """
+    version: int = 0
+    last_updated_utc: datetime.datetime = datetime.datetime.utcfromtimestamp(-1)
+    data: Mapping[str, OWIDCountryData] = MappingProxyType({})
 
 
 class OWIDData:
+    SNAPSHOT_NAME = "owid"
+
     def __init__(self, add_ids: bool = False, *, update_stats: bool = False,
-                 logging_level=logging.INFO):
+                 logging_level=logging.INFO, http_pool: Optional[PooledHTTPClient] = None,
+                 snapshot_store: Optional[SnapshotStore] = None,
+                 country_registry: Optional[CountryRegistry] = None,
+                 base_url: str = OWID_URL, country_list_base_url: str = DISEASE_SH_URL,
+                 ingest_worker: Optional[IngestWorker] = None):
         """
         Class to get data about COVID-19 from OWID
 
@@ -713,6 +1595,15 @@ class OWIDData:
         :param update_stats: Whether to update stats on class initalization or wait for a explicit call to do so.
                              Doing it in the __init__ makes the init time a lot longer, and it's synchronous: for this
                              reason, it defaults to being disabled.
+        :param http_pool: Optional: shared PooledHTTPClient to make requests with. Defaults to making a new one.
+        :param snapshot_store: Optional: SnapshotStore to save every new snapshot to, and to load the last one from.
+        :param country_registry: Optional: shared CountryRegistry, kept up to date by its owner. Defaults to making
+                                 a new one, updated along with the data.
+        :param base_url: Optional: URL of OWID's data server (or of something serving the same paths) to use.
+        :param country_list_base_url: Optional: URL of the disease.sh API to get the country list from, when there's
+                                      no shared country registry.
+        :param ingest_worker: Optional: IngestWorker to parse the downloaded data in. Defaults to parsing it right away,
+                              in the event loop.
         """
         self.logger: logging.Logger = logging.Logger("COVID-19 OWID Data", level=logging_level)
         self.logger.setLevel(logging_level)
@@ -720,35 +1611,88 @@ class OWIDData:
         self._update_tries: int = 0
         self.data_is_valid: bool = False
         self.add_ids: bool = add_ids
-        self.iso_codes: ISOCodeHelper = ISOCodeHelper()
-        self.last_updated_utc: datetime.datetime = datetime.datetime.utcfromtimestamp(-1)
-        self.data: dict = {}
+        self.http_pool: PooledHTTPClient = http_pool or PooledHTTPClient()
+        self._validators: StagedValidators = self.http_pool.validators.stage()
+        self.country_registry: CountryRegistry = CountryRegistry() if country_registry is None else country_registry
+        self._owns_country_registry: bool = country_registry is None
+        self.base_url: str = base_url
+        self.country_list_base_url: str = country_list_base_url
+        self.ingest_worker: IngestWorker = ingest_worker or IngestWorker(processes=0)
+        self.snapshot: OWIDSnapshot = OWIDSnapshot()
+        self.snapshot_store: Optional[SnapshotStore] = snapshot_store
+        self.skipped_stages: collections.Counter = collections.Counter()
+        self.retries_are_managed: bool = False
         if update_stats:
             self.update_covid_19_owid_data()
 
+    async def _do_update(self):
+        await self.update_covid_19_owid_data()
+
+    def load_snapshot(self) -> bool:
+        return _load_snapshot(self)
+
+    @property
+    def data_version(self) -> int:
+        return self.snapshot.version
+
+    @property
+    def last_updated_utc(self) -> datetime.datetime:
+        return self.snapshot.last_updated_utc
+
+    @property
+    def data(self) -> Mapping[str, OWIDCountryData]:
+        return self.snapshot.data
+
     async def update_covid_19_owid_data(self, *, session: aiohttp.ClientSession = None):
-        session = session or aiohttp.ClientSession()
-        self.logger.info("Updating ISO codes...")
-        await self.iso_codes.update_data()
-        self.logger.info("Done!")
-        self.logger.info("Getting OWID data...")
-        async with session as session:
+        """
+        Updates the data. The (big) JSON file is downloaded to a temporary file, then parsed by parse_owid_file in
+        self.ingest_worker, so neither the raw text nor the full nested dictionary ever has to be held in memory, and
+        the event loop doesn't stall while it's parsed.
+
+        :param session: Optional: aiohttp.ClientSession to use. Defaults to the shared pooled session.
+        :return: None
+        """
+        session = session or self.http_pool.session
+        self._validators = self.http_pool.validators.stage()
+        if self._owns_country_registry:
             try:
-                data = await get_data(session, "https://covid.ourworldindata.org/data/owid-covid-data.json")
+                await _update_country_registry(self, session, self.country_list_base_url)
             except NetworkException as e:
                 self._update_tries += 1
                 await _handle_client_exceptions(self, e)
                 return
-            else:
-                self.data = data
+        self.logger.info("Getting OWID data...")
+        fd, path = tempfile.mkstemp(prefix="owid-", suffix=".json")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                await download_to_file(session, f"{self.base_url}/data/owid-covid-data.json", f,
+                                       **_conditional_get(self))
+            data = await self.ingest_worker.run(parse_owid_file, path)
+        except DataNotModified:
+            self.logger.info("OWID data hasn't changed, skipping parsing.")
+            self.skipped_stages["owid"] += 1
+            self.snapshot = self.snapshot._replace(last_updated_utc=datetime.datetime.utcnow())
+            self._validators.commit()
+            return
+        except (NetworkException, ValueError) as e:
+            self._update_tries += 1
+            await _handle_client_exceptions(self, e if isinstance(e, NetworkException) else NetworkException(e))
+            return
+        finally:
+            os.unlink(path)
+        await _publish_snapshot(self, OWIDSnapshot(version=next_data_version(),
+                                                   last_updated_utc=datetime.datetime.utcnow(),
+                                                   data=MappingProxyType(data)))
+        self._has_been_updated = True
         self.data_is_valid = True
-        self.logger.info("Got OWID data!")  # no parsing needed (or really possible)
+        self.logger.info(f"Got OWID data! {len(data)} locations, "
+                         f"{sum(location.nbytes for location in data.values()) / 2 ** 20:.1f}MiB of columns.")
 
     async def get_country_stats(self, country: str):
         country = country.upper()  # all of OWID's ISO codes are uppercase
         if country not in self.data:
-            iso_code = get_iso3_code(country, self.iso_codes.iso_codes)  # OWID works with ISO3 codes, not ISO2
-            if iso_code not in self.data:  # TODO: special case handling
+            iso_code = self.country_registry.get_iso3_code(country)  # OWID works with ISO3 codes, not ISO2
+            if iso_code not in self.data:
                 return None
         else:
             iso_code = country
@@ -758,22 +1702,20 @@ class OWIDData:
         return self.data["OWID_WRL"]  # it's just there
 
     @staticmethod
-    async def _get_stats_for_day(stats, date: datetime.date):
-        month = f"0{date.month}" if len(str(date.month)) == 1 else date.month
-        day = f"0{date.day}" if len(str(date.month)) == 1 else date.day
-        date_str = f"{date.year}-{month}-{day}"
-        for i in filter(lambda x: x["date"] == date_str, stats["data"]):
-            return i
-        return None
+    async def _get_stats_for_day(stats: OWIDCountryData, date: datetime.date) -> Optional[dict]:
+        position = stats.position(date)
+        if position is None:
+            return None
+        return stats.row(position)
 
     async def get_country_stats_for_day(self, country: str, date: datetime.date):
         stats = await self.get_country_stats(country)
-        if not stats:
+        if stats is None:  # not `not stats`: OWIDCountryData has a length, and a country without rows is falsy
             return None
-        return self._get_stats_for_day(stats, date)
+        return await self._get_stats_for_day(stats, date)
 
     async def get_world_stats_for_day(self, date: datetime.date):
-        return self._get_stats_for_day(await self.get_world_stats(), date)
+        return await self._get_stats_for_day(await self.get_world_stats(), date)
 
 
 if __name__ == '__main__':
@@ -3,70 +3,191 @@
 Utility functions to take care of most of the parsing behind the autoupdater, to make it more logically sound,
 if you will
 """
+import asyncio
+import collections
 import datetime
+import hashlib
+import io
+import json
 import time
-from copy import deepcopy, copy
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, NamedTuple, Optional, Tuple
 
 import discord
 
 from utils import embeds, graphs
 from utils.async_helpers import wrap_in_async
-from utils.ctx_class import MyContext
+from utils.ctx_class import UpdaterContext
 from utils.caching import TTLCache
 from utils.custom_updaters import InvalidKeyError
 from utils.maps import map_identifiers
+from utils.models import AutoupdateTypes
 
 graph_cache = TTLCache(82800)
+# Rendered updates are shared for at most this many seconds, even if their data didn't change.
+RENDER_TTL = 300
+# How many seconds of render counts are kept for the metrics.
+RENDER_HISTORY = 60
 
 
-async def continent(ctx: MyContext, name: str):
+class Rendered(NamedTuple):
+    """
+    An update, ready to be sent to any number of channels. Attachments are kept as bytes, and every send gets its own
+    file object reading them (io.BytesIO doesn't copy bytes it's only read from).
+    """
+    content: Optional[str] = None
+    embed: Optional[discord.Embed] = None
+    attachments: Tuple[Tuple[str, bytes], ...] = ()
+    digest: str = ""
+
+    def compute_digest(self) -> str:
+        """
+        Returns a hash of what the update shows. The embed's timestamp (when the data was last checked) and footer (how
+        long a graph took to render) are left out, so an update showing the same data has the same digest.
+        """
+        embed = self.embed.to_dict() if self.embed is not None else None
+        if embed is not None:
+            embed.pop("timestamp", None)
+            embed.pop("footer", None)
+        digest = hashlib.sha256(json.dumps([self.content, embed], sort_keys=True, default=str).encode())
+        for filename, data in self.attachments:
+            digest.update(filename.encode())
+            digest.update(data)
+        return digest.hexdigest()
+
+    def send_kwargs(self) -> dict:
+        kwargs = {"content": self.content, "embed": self.embed}
+        if self.attachments:
+            kwargs["files"] = [discord.File(io.BytesIO(data), filename=filename) for filename, data in self.attachments]
+        return kwargs
+
+
+class RenderCache:
+    def __init__(self, ttl: float = RENDER_TTL, history: int = RENDER_HISTORY):
+        """
+        Renders every update once per key, and shares the result with every updater using the same key. Updaters due
+        at the same time wait for the same render.
+
+        :param ttl: How long a rendered update is shared for, in seconds.
+        :param history: How many seconds of render counts to keep for the metrics.
+        """
+        self.ttl: float = ttl
+        self.rendered: Dict[Hashable, Tuple[Rendered, float]] = {}
+        self.renders: collections.Counter = collections.Counter()
+        self.shared: collections.Counter = collections.Counter()
+        self.ticks: Deque[List[int]] = collections.deque(maxlen=history)
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._last_sweep: float = time.monotonic()
+
+    def _count(self, rendered: bool):
+        """
+        Counts a render (or a shared one) in the counts of the current second.
+        """
+        second = int(time.time())
+        if not self.ticks or self.ticks[-1][0] != second:
+            self.ticks.append([second, 0, 0])
+        self.ticks[-1][1 if rendered else 2] += 1
+
+    def _sweep(self, now: float):
+        if now - self._last_sweep >= self.ttl:
+            self._last_sweep = now
+            self.rendered = {key: value for key, value in self.rendered.items() if now - value[1] < self.ttl}
+
+    async def get(self, key: Tuple[Hashable, ...], render: Callable[[], Awaitable[Optional[Rendered]]]) -> \
+            Optional[Rendered]:
+        """
+        :param key: What the update depends on: (updater type, location, language, data version).
+        :param render: Coroutine function rendering the update, only called if it isn't rendered (or being rendered)
+                       already.
+        :return: The rendered update (with its digest), or None if render returned None.
+        """
+        now = time.monotonic()
+        cached = self.rendered.get(key)
+        if cached is not None and now - cached[1] < self.ttl:
+            self.shared[key[0]] += 1
+            self._count(False)
+            return cached[0]
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.shared[key[0]] += 1
+            self._count(False)
+            return await asyncio.shield(pending)
+        future = self._pending[key] = asyncio.get_event_loop().create_future()
+        try:
+            result = await render()
+            if result is not None:
+                result = result._replace(digest=result.compute_digest())
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # nobody else might be waiting for it
+            raise
+        else:
+            future.set_result(result)
+            if result is not None:
+                self.rendered[key] = (result, now)
+            return result
+        finally:
+            del self._pending[key]
+            self.renders[key[0]] += 1
+            self._count(True)
+            self._sweep(now)
+
+    def stats(self) -> dict:
+        renders, shared = sum(self.renders.values()), sum(self.shared.values())
+        return {"renders": {getattr(kind, "name", str(kind)): count for kind, count in self.renders.items()},
+                "shared": {getattr(kind, "name", str(kind)): count for kind, count in self.shared.items()},
+                "shared_ratio": shared / (renders + shared) if renders + shared else None,
+                "cached": len(self.rendered),
+                "per_second": [{"at": second, "renders": rendered, "shared": shared}
+                               for second, rendered, shared in self.ticks]}
+
+
+async def continent(ctx: UpdaterContext, name: str):
     embed = await embeds.advanced_stats_embed(await ctx.bot.worldometers_api.try_to_get_name(name),
                                               ctx=ctx)
     if embed is None:
         _ = await ctx.get_translate_function()
-        await ctx.send(_("I'm having a issue with finding the country name here! Here's what I'm showing: {0}",
-                         await ctx.bot.worldometers_api.try_to_get_name(name)))
-        return None
+        return Rendered(content=_("I'm having a issue with finding the country name here! Here's what I'm showing: {0}",
+                                  await ctx.bot.worldometers_api.try_to_get_name(name)))
     else:
-        return {"embed": embed}
+        return Rendered(embed=embed)
 
 
-async def world(ctx: MyContext):
+async def world(ctx: UpdaterContext):
     return await continent(ctx, "world")
 
 
-async def country(ctx: MyContext, name: str):
+async def country(ctx: UpdaterContext, name: str):
     return await continent(ctx, name)
 
 
-async def state(ctx: MyContext, name: str):
+async def state(ctx: UpdaterContext, name: str):
     return await continent(ctx, name)
 
 
-async def province(ctx: MyContext, name: str):
+async def province(ctx: UpdaterContext, name: str):
     n = await ctx.bot.jhucsse_api.try_to_get_name(name)
     today = datetime.date.today()
     today = today - datetime.timedelta(days=1)
-    e = await embeds.basic_stats_embed(n, today)
-    return {"embed": e}
+    e = await embeds.basic_stats_embed(n, today, ctx=ctx)
+    return Rendered(embed=e)
 
 
-async def custom(ctx: MyContext, custom_str: str):
+async def custom(ctx: UpdaterContext, custom_str: str):
     custom_updater = ctx.bot.custom_updater_helper
     try:
         custom_str = custom_updater.parse(custom_str)
     except InvalidKeyError as e:
         _ = await ctx.get_translate_function()
-        return {"content": _("Invalid key ({0}) found in the updater, requires fixing!", str(e))}
+        return Rendered(content=_("Invalid key ({0}) found in the updater, requires fixing!", str(e)))
     except AttributeError:
         await ctx.bot.async_setup()
         _ = await ctx.get_translate_function()
-        return {"content": _("Bot not set up!")}
+        return Rendered(content=_("Bot not set up!"))
     else:
-        return {"content": custom_str}
+        return Rendered(content=custom_str)
 
 
-async def graph(ctx: MyContext, name: str):
+async def graph(ctx: UpdaterContext, name: str):
     _ = await ctx.get_translate_function()
     name, log = name.split("_")
     log = log == "log"
@@ -74,41 +195,70 @@ async def graph(ctx: MyContext, name: str):
     if name[0] == "world":
         data = ctx.bot.jhucsse_api.global_historical_stats
     elif name[0] == "country":
-        data = await ctx.bot.jhucsse_api.get_country_stats(name[1])
+        data = (await ctx.bot.jhucsse_api.get_country_stats(name[1]))["timeline"]
     elif name[0] == "province":
-        data = await ctx.bot.jhucsse_api.get_province_stats(name[1])
+        data = (await ctx.bot.jhucsse_api.get_province_stats(name[1]))["timeline"]
     elif name[0] == "state":
-        data = await ctx.bot.jhucsse_api.get_state_stats(name[1])
+        data = (await ctx.bot.jhucsse_api.get_state_stats(name[1]))["timeline"]
     else:
-        return {"content": "internal bot error"}
+        return Rendered(content="internal bot error")
     buffer_name = f"{name[1].title() if name[1] else 'world'}_{'log' if log else 'lin'}"
     st = time.perf_counter_ns()
-    graph_buffer = graph_cache.get(buffer_name)
-    if not graph_buffer:
+    graph_bytes = graph_cache.get(buffer_name)
+    if not graph_bytes:
         cache_hit = False
         graph_buffer = await wrap_in_async(graphs.generate_line_plot, data, name[1].title() if name[1] else "world",
                                            logarithmic=log, thread_pool=True)
-        graph_cache[buffer_name] = deepcopy(graph_buffer)
+        graph_bytes = graph_cache[buffer_name] = graph_buffer.getvalue()
     else:
-        graph_buffer = copy(graph_buffer)
         cache_hit = True
     et = time.perf_counter_ns()
-    f = discord.File(graph_buffer, filename="image.png")
     tt = et - st
     e = discord.Embed(title=_("Graph for {0}", name[1].title() if name[1] else 'world'))
     e.set_footer(text=_("Took {0} seconds ({1} nanoseconds) to generate • Cache Status: {2}",
                         format(round(tt / 1000000000, 1), ","), format(tt, ","), "HIT" if cache_hit else "MISS"))
     e.set_image(url="attachment://image.png")
-    return {"embed": e, "file": f}
+    return Rendered(embed=e, attachments=(("image.png", graph_bytes),))
 
 
-async def maps(ctx: MyContext, name: str):
+async def maps(ctx: UpdaterContext, name: str):
     _ = await ctx.get_translate_function()
     map_embed = discord.Embed(title=_("Map for {0}", map_identifiers[name][1]))
-    try:
-        map_buffer = await wrap_in_async(ctx.bot.maps_api.get_map, name, thread_pool=True)
-    except KeyError:
-        return {"content": _("Bot still setting up...")}
-    img_file = discord.File(map_buffer, filename="map.png")
+    map_bytes = ctx.bot.maps_api.get_map_bytes(name) if ctx.bot.maps_api else None
+    if map_bytes is None:
+        return Rendered(content=_("Bot still setting up..."))
     map_embed.set_image(url="attachment://map.png")
-    return {"embed": map_embed, "file": img_file}
+    return Rendered(embed=map_embed, attachments=(("map.png", map_bytes),))
+
+
+async def render(ctx: UpdaterContext, updater_type: AutoupdateTypes, name: str) -> Optional[Rendered]:
+    if updater_type == AutoupdateTypes.world:
+        return await world(ctx)
+    elif updater_type == AutoupdateTypes.continent:
+        return await continent(ctx, name)
+    elif updater_type == AutoupdateTypes.country:
+        return await country(ctx, name)
+    elif updater_type == AutoupdateTypes.state:
+        return await state(ctx, name)
+    elif updater_type == AutoupdateTypes.province:
+        return await province(ctx, name)
+    elif updater_type == AutoupdateTypes.graph:
+        return await graph(ctx, name)
+    elif updater_type == AutoupdateTypes.map:
+        return await maps(ctx, name)
+    elif updater_type == AutoupdateTypes.custom:
+        return await custom(ctx, name)
+    return None
+
+
+def data_version(bot, updater_type: AutoupdateTypes) -> Hashable:
+    """
+    Returns the version of the data an updater type shows: it changes whenever what it renders could change.
+    """
+    if updater_type in (AutoupdateTypes.province, AutoupdateTypes.graph):
+        return bot.jhucsse_api.data_version
+    elif updater_type == AutoupdateTypes.map:
+        return bot.maps_api.version if bot.maps_api else None
+    elif updater_type == AutoupdateTypes.custom:
+        return bot.worldometers_api.data_version, bot.jhucsse_api.data_version
+    return bot.worldometers_api.data_version
@@ -2,6 +2,7 @@ import asyncio
 import collections
 import datetime
 import re
+import time
 from multiprocessing.context import Process
 from multiprocessing.queues import Queue
 from typing import Optional, List
@@ -13,9 +14,16 @@ from discord.ext import commands
 import statcord
 from utils import config as config, news
 from utils.ctx_class import MyContext
+from utils.country_registry import CountryRegistry
 from utils.custom_updaters import CustomUpdater
+from utils.delivery_queue import DeliveryQueue
+from utils.http_client import PooledHTTPClient
+from utils.ingest_worker import IngestWorker
 from utils.logger import FakeLogger
+from utils.loop_monitor import LoopLagMonitor
 from utils.models import get_from_db
+from utils.refresh_scheduler import RefreshScheduler
+from utils.snapshot_store import SnapshotStore
 from utils import api as covid19api
 from utils.maps import MapGetter
 from utils.async_helpers import wrap_in_async
@@ -29,6 +37,7 @@ else:
 
 
 _runtime_error = RuntimeError("The bot hasn't been set up yet! Ensure bot.async_setup is called ASAP!")
+DEFAULT_SNAPSHOT_DIRECTORY = "temp_data/snapshots"
 
 
 class BotStats:
@@ -40,6 +49,8 @@ class BotStats:
 
 class MyBot(AutoShardedBot):
     def __init__(self, *args, **kwargs):
+        self._started_at: float = time.perf_counter()
+        self.startup_timings: dict = {}
         self.logger = FakeLogger()
         self.config: dict = {}
         self.reload_config()
@@ -52,13 +63,35 @@ class MyBot(AutoShardedBot):
         self.commands_used = collections.Counter()
         self.uptime = datetime.datetime.utcnow()
         self.shards_ready = set()
-        self._worldometers_api = covid19api.Covid19StatsWorldometers()
-        self._vaccine_api = covid19api.VaccineStats()
-        self._jhucsse_api = covid19api.Covid19JHUCSSEStats()
-        self.news_api = news.NewsAPI(self.config["auth"]["news_api"]["token"])
-        self._owid_api = covid19api.OWIDData()
+        self.http_pool = PooledHTTPClient()  # self.http is already taken by discord.py
+        self.snapshot_store = SnapshotStore(self.config["bot"].get("snapshot_directory", DEFAULT_SNAPSHOT_DIRECTORY))
+        # one country list for every source, kept up to date by the Worldometers API (which downloads it anyway)
+        self.country_registry = CountryRegistry()
+        # the big JHU and OWID downloads are parsed in here, not in the event loop
+        self.ingest_worker = IngestWorker()
+        self.loop_lag_monitor = LoopLagMonitor()
+        # every message the bot sends goes through here, paced to stay under Discord's rate limits
+        self.delivery_queue = DeliveryQueue()
+        disease_sh_url = self.config["bot"].get("disease_sh_url", covid19api.DISEASE_SH_URL)
+        self._worldometers_api = covid19api.Covid19StatsWorldometers(http_pool=self.http_pool,
+                                                                     snapshot_store=self.snapshot_store,
+                                                                     country_registry=self.country_registry,
+                                                                     base_url=disease_sh_url)
+        self._vaccine_api = covid19api.VaccineStats(http_pool=self.http_pool, snapshot_store=self.snapshot_store,
+                                                    base_url=disease_sh_url)
+        self._jhucsse_api = covid19api.Covid19JHUCSSEStats(
+            incremental_days=self.config["bot"].get("jhucsse_incremental_days", covid19api.INCREMENTAL_DAYS),
+            full_refresh_interval=self.config["bot"].get("jhucsse_full_refresh_hours", 6) * 60 * 60,
+            http_pool=self.http_pool, snapshot_store=self.snapshot_store, country_registry=self.country_registry,
+            base_url=disease_sh_url, ingest_worker=self.ingest_worker)
+        self.news_api = news.NewsAPI(self.config["auth"]["news_api"]["token"], http_pool=self.http_pool)
+        self._owid_api = covid19api.OWIDData(http_pool=self.http_pool, snapshot_store=self.snapshot_store,
+                                             country_registry=self.country_registry,
+                                             base_url=self.config["bot"].get("owid_url", covid19api.OWID_URL),
+                                             ingest_worker=self.ingest_worker)
+        self.refresh_scheduler = RefreshScheduler()
+        self._add_refresh_sources()
         self.custom_updater_helper: Optional[CustomUpdater] = None
-        self._client_session: Optional[aiohttp.ClientSession] = None
         self.basic_process_pool = concurrent.futures.ProcessPoolExecutor(2)
         self.premium_process_pool = concurrent.futures.ProcessPoolExecutor(4)
         self.statcord: Optional[statcord.Client] = None
@@ -71,11 +104,8 @@ class MyBot(AutoShardedBot):
         asyncio.ensure_future(self.async_setup())
 
     @property
-    def client_session(self):
-        if self._client_session:
-            return self._client_session
-        else:
-            raise _runtime_error
+    def client_session(self) -> aiohttp.ClientSession:
+        return self.http_pool.session
 
     @property
     def worldometers_api(self):
@@ -108,22 +138,64 @@ class MyBot(AutoShardedBot):
     def reload_config(self):
         self.config = config.load_config()
 
+    def _record_startup_timing(self, name: str):
+        if name not in self.startup_timings:
+            self.startup_timings[name] = time.perf_counter() - self._started_at
+            self.logger.info(f"Startup: {name} after {self.startup_timings[name]:.3f} seconds.")
+
+    def load_snapshots(self) -> bool:
+        """
+        Loads the stats saved by the last run, so commands work before the first download is done.
+
+        :return: True if every source could be loaded.
+        """
+        loaded = [api.load_snapshot() for api in (self._worldometers_api, self._vaccine_api, self._jhucsse_api,
+                                                  self._owid_api)]
+        self._record_startup_timing("snapshots_loaded")
+        return all(loaded)
+
+    def _add_refresh_sources(self):
+        """
+        Tells the refresh scheduler about every data source: how often to refresh it (periods are in seconds), and
+        what has to be refreshed before it. The scheduler handles retries, so the APIs don't retry on their own.
+        """
+        for api in (self._worldometers_api, self._vaccine_api, self._jhucsse_api, self._owid_api):
+            api.retries_are_managed = True
+        scheduler = self.refresh_scheduler
+        scheduler.add_source("worldometers", self._worldometers_api.update_covid_19_virus_stats, period=5 * 60)
+        scheduler.add_source("vaccine", self._vaccine_api.update_covid_19_vaccine_stats, period=12 * 60 * 60)
+        scheduler.add_source("jhucsse", self._jhucsse_api.update_covid_19_virus_stats, period=15 * 60,
+                             depends_on=["worldometers"])  # for the country registry
+        scheduler.add_source("owid", self._owid_api.update_covid_19_owid_data, period=12 * 60 * 60,
+                             depends_on=["worldometers"])
+        scheduler.add_source("maps", self._download_maps, period=24 * 60 * 60)
+
+    async def _download_maps(self):
+        if self.maps_api:
+            # selenium hates being run in another process
+            await wrap_in_async(self.maps_api.download_maps, thread_pool=True)
+
+    async def refresh_all_stats(self):
+        """
+        Refreshes every source once, in dependency order. Failures are retried by the refresh scheduler.
+        """
+        succeeded = [await self.refresh_scheduler.run_now(name)
+                     for name in ("worldometers", "vaccine", "jhucsse", "owid")]
+        if all(succeeded):
+            self._record_startup_timing("first_refresh_done")
+
     async def async_setup(self):
         """
-        This funtcion is run once, and is used to setup the bot async features, like the ClientSession from aiohttp.
+        This funtcion is run once, and is used to setup the bot async features, like the initial data download.
+
+        If the stats saved by the last run could be loaded, they are served right away and the initial download runs
+        in the background instead.
         """
-        if self._client_session is None:
-            self._client_session = aiohttp.ClientSession()  # There is no need to call __aenter__, since that does
-            # nothing in this case
-        try:
-            await self._worldometers_api.update_covid_19_virus_stats()
-            await self._vaccine_api.update_covid_19_vaccine_stats()
-            await self._jhucsse_api.update_covid_19_virus_stats()
-            await self._owid_api.update_covid_19_owid_data()
-        except RuntimeError as e:
-            self.logger.exception("Fatal RuntimeError while running initial update!", exc_info=e)
-        except Exception as e:
-            self.logger.exception("Fatal general error while running initial update!", exc_info=e)
+        self.loop_lag_monitor.start(self.loop)
+        if self.load_snapshots():
+            asyncio.ensure_future(self.refresh_all_stats())
+        else:
+            await self.refresh_all_stats()
         try:
             if not self.maps_api:
                 self.maps_api = MapGetter("/home/pi/covid_bot_beta/maps")
@@ -136,6 +208,39 @@ class MyBot(AutoShardedBot):
         except Exception as e:
             self.logger.exception("Fatal error while initializing the custom updater!", exc_info=e)
 
+    def collect_metrics(self) -> dict:
+        """
+        Gathers runtime metrics from the bot's components, for the REST API and for debugging.
+        """
+        autoupdater_cog = self.get_cog("AutoUpdaterCog")
+        return {"http_pool": self.http_pool.stats(),
+                "conditional_get": self.http_pool.validators.stats(),
+                "skipped_stages": {"worldometers": dict(self._worldometers_api.skipped_stages),
+                                   "jhucsse": dict(self._jhucsse_api.skipped_stages),
+                                   "vaccine": dict(self._vaccine_api.skipped_stages),
+                                   "owid": dict(self._owid_api.skipped_stages)},
+                "jhucsse_refreshes": dict(self._jhucsse_api.refresh_stats),
+                "refresh_scheduler": self.refresh_scheduler.stats(),
+                "startup": self.startup_timings,
+                "snapshot_store": self.snapshot_store.timings,
+                "ingest_worker": self.ingest_worker.stats(),
+                "jhucsse_phases": dict(self._jhucsse_api.phase_timings),
+                "event_loop_lag": self.loop_lag_monitor.stats(),
+                "delivery_queue": self.delivery_queue.stats(),
+                "autoupdater": autoupdater_cog.stats() if autoupdater_cog is not None else None,
+                "data_versions": {"worldometers": self._worldometers_api.data_version,
+                                  "jhucsse": self._jhucsse_api.data_version,
+                                  "vaccine": self._vaccine_api.data_version,
+                                  "owid": self._owid_api.data_version,
+                                  "country_registry": self.country_registry.version}}
+
+    async def close(self):
+        self.loop_lag_monitor.stop()
+        self.delivery_queue.stop()
+        self.ingest_worker.shutdown()
+        await self.http_pool.close()
+        await super().close()
+
     async def on_message(self, message: discord.Message):
         if not self.is_ready():
             return  # Ignoring messages when not ready
@@ -160,6 +265,7 @@ class MyBot(AutoShardedBot):
         if self.blackfire:
             probe.add_marker(f"Command {ctx.command} {ctx.invoked_subcommand}")
         self.commands_used[ctx.command.name] += 1
+        self._record_startup_timing("first_command")
         self.statcord.command_run(ctx)
         ctx.logger.info(f"{ctx.message.clean_content}")
 
@@ -0,0 +1,107 @@
+# coding=utf-8
+"""
+The bot-wide list of countries (name, ISO2 and ISO3 codes), shared by every data source instead of each of them
+downloading and keeping its own copy.
+"""
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from utils.name_index import normalize_name
+from utils.snapshot_store import register_type
+
+# Fields of a CountryRecord a country can be looked up by, in order of priority.
+NAME_FIELDS = ("country", "iso2", "iso3")
+
+
+@register_type
+class CountryRecord(NamedTuple):
+    country: str
+    iso2: str
+    iso3: Optional[str] = None
+    population: Optional[int] = None
+
+    @classmethod
+    def from_json(cls, country: dict) -> Optional["CountryRecord"]:
+        """
+        Makes a record out of a country returned by disease.sh's /countries endpoint.
+
+        :return: The record, or None if the country has no ISO2 code.
+        """
+        info = country["countryInfo"]
+        if info["iso2"] is None:
+            return None
+        return cls(country["country"], info["iso2"], info["iso3"], country.get("population") or None)
+
+
+class CountryRegistry:
+    def __init__(self, records: Iterable[CountryRecord] = (), *, version: int = 0):
+        """
+        Every known country, with O(1) lookup by name, ISO2 or ISO3 code.
+
+        Records are immutable, and the whole list is swapped out in one go by publish, so anything holding on to the
+        records never sees a half-done update. version changes on every publish: anything built out of the records
+        (name indexes, per-country URLs...) should be rebuilt when it does.
+
+        :param records: Initial records.
+        :param version: Data version of the initial records.
+        """
+        self.records: Tuple[CountryRecord, ...] = ()
+        self.version: int = version
+        self._keys: Dict[str, CountryRecord] = {}
+        self._iso2_codes: Dict[str, CountryRecord] = {}
+        self.publish(records, version=version)
+
+    def publish(self, records: Iterable[CountryRecord], *, version: int):
+        """
+        Replaces every record.
+
+        :param records: The new records.
+        :param version: Data version of the new records. Must be higher than the current one (see
+                        api.next_data_version).
+        """
+        records = tuple(records)
+        keys = {}
+        # names win over codes, so a country whose ISO3 code is another one's name can't hide it
+        for field in NAME_FIELDS:
+            for record in records:
+                key = getattr(record, field)
+                if key:
+                    keys.setdefault(normalize_name(key), record)
+        iso2_codes = {record.iso2.upper(): record for record in records}
+        self.records, self._keys, self._iso2_codes, self.version = records, keys, iso2_codes, version
+
+    def lookup(self, name: str) -> Optional[CountryRecord]:
+        """
+        Returns the record of a country, given its name, ISO2 or ISO3 code (case and accents don't matter), or None.
+        """
+        return self._iso2_codes.get(str(name).upper()) or self._keys.get(normalize_name(name))
+
+    def get_iso2_code(self, name: str) -> Optional[str]:
+        record = self.lookup(name)
+        return None if record is None else record.iso2
+
+    def get_iso3_code(self, name: str) -> Optional[str]:
+        record = self.lookup(name)
+        return None if record is None else record.iso3
+
+    def get_country_name(self, name: str) -> Optional[str]:
+        record = self.lookup(name)
+        return None if record is None else record.country
+
+    def populations(self) -> Dict[str, int]:
+        """
+        Returns the population of every country it's known for, by ISO2 code.
+        """
+        return {record.iso2: record.population for record in self.records if record.population}
+
+    @property
+    def iso2_codes(self) -> Tuple[str, ...]:
+        return tuple(record.iso2 for record in self.records)
+
+    def __contains__(self, name: str) -> bool:
+        return self.lookup(name) is not None
+
+    def __iter__(self) -> Iterator[CountryRecord]:
+        return iter(self.records)
+
+    def __len__(self) -> int:
+        return len(self.records)
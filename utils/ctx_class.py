@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import io
 
 import discord
@@ -8,6 +9,7 @@ from discord import Message
 from discord.errors import InvalidArgument
 from discord.ext import commands
 
+from utils.delivery_queue import MAX_RETRIES, PRIORITY_INTERACTIVE
 from utils.models import get_from_db
 from utils.translations import translate
 
@@ -27,9 +29,13 @@ class MyContext(commands.Context):
 
     async def reply(self, *args, **kwargs):
         try:
-            return await super().reply(*args, **kwargs)
+            return await self.bot.delivery_queue.submit(self.channel.id, functools.partial(super().reply, *args,
+                                                                                           **kwargs),
+                                                        priority=PRIORITY_INTERACTIVE, retries=0)
         except discord.HTTPException:
-            return await super().send(*args, **kwargs)
+            return await self.bot.delivery_queue.submit(self.channel.id, functools.partial(super().send, *args,
+                                                                                           **kwargs),
+                                                        priority=PRIORITY_INTERACTIVE, retries=0)
 
     async def send(self, content=None, *, delete_on_invoke_removed=True, file=None, files=None, **kwargs) -> Message:
         # Case for a too-big message
@@ -52,7 +58,12 @@ class MyContext(commands.Context):
             else:
                 file = message_file
 
-        message = await super().send(content, file=file, files=files, **kwargs)
+        # files can't be read twice, so sends with files aren't retried
+        message = await self.bot.delivery_queue.submit(self.channel.id, functools.partial(super().send, content,
+                                                                                          file=file, files=files,
+                                                                                          **kwargs),
+                                                       priority=PRIORITY_INTERACTIVE,
+                                                       retries=0 if file or files else MAX_RETRIES)
 
         # Message deletion if source is deleted
         if delete_on_invoke_removed:
@@ -85,3 +96,39 @@ class MyContext(commands.Context):
 
         return _
 
+
+class UpdaterContext:
+    def __init__(self, bot: 'MyBot', channel: discord.TextChannel, language_code: str):
+        """
+        What the autoupdaters render with instead of a MyContext: the bot, the channel and translations in the given
+        language. Unlike a MyContext, it doesn't need a message to be built from, so it costs no API call or database
+        query.
+
+        :param language_code: Language of the guild, as stored in the database.
+        """
+        self.bot: 'MyBot' = bot
+        self.channel: discord.TextChannel = channel
+        self.guild: discord.Guild = channel.guild
+        self.language_code: str = language_code
+        self.api_calls: int = 0
+        self.logger = LoggerConstant(self.bot.logger, self.guild, self.channel)
+
+    async def send(self, *args, **kwargs) -> Message:
+        self.api_calls += 1
+        return await self.bot.delivery_queue.submit(self.channel.id, functools.partial(self.channel.send, *args,
+                                                                                       **kwargs),
+                                                    retries=0 if "file" in kwargs or "files" in kwargs else MAX_RETRIES)
+
+    async def get_language_code(self):
+        return self.language_code
+
+    async def translate(self, message):
+        return translate(message, self.language_code)
+
+    async def get_translate_function(self):
+        language_code = self.language_code
+
+        def _(message, *args, **kwargs):
+            return translate(message, language_code).format(*args, **kwargs)
+
+        return _
@@ -17,18 +17,27 @@ class InvalidKeyError(CustomParserError):
 
 
 class CustomUpdater:
-    wom_updater_gen = [lambda x: ["cases total",       x["cases"]],
-                       lambda x: ["cases new",         x["todayCases"]],
-                       lambda x: ["cases million",     x["casesPerOneMillion"]],
-                       lambda x: ["deaths total",      x["deaths"]],
-                       lambda x: ["deaths million",    x["deathsPerOneMillion"]],
-                       lambda x: ["active total",      x["active"]],
-                       lambda x: ["active million",    x["activePerOneMillion"]],
-                       lambda x: ["recovered total",   x["recovered"]],
-                       lambda x: ["recovered new",     x["todayRecovered"]],
-                       lambda x: ["recovered million", x["recoveredPerOneMillion"]],
-                       lambda x: ["tests total",       x["tests"]],
-                       lambda x: ["tests million",     x["testsPerOneMillion"]],
+    wom_updater_gen = [lambda x: ["cases total",       x.cases],
+                       lambda x: ["cases new",         x.today_cases],
+                       lambda x: ["cases million",     x.cases_per_million],
+                       lambda x: ["deaths total",      x.deaths],
+                       lambda x: ["deaths million",    x.deaths_per_million],
+                       lambda x: ["active total",      x.active],
+                       lambda x: ["active million",    x.active_per_million],
+                       lambda x: ["recovered total",   x.recovered],
+                       lambda x: ["recovered new",     x.today_recovered],
+                       lambda x: ["recovered million", x.recovered_per_million],
+                       lambda x: ["tests total",       x.tests],
+                       lambda x: ["tests million",     x.tests_per_million],
+                       ]
+    jhu_updater_gen = [lambda x: ["cases average",     x["new_cases_7d"]],
+                       lambda x: ["cases average 14",  x["new_cases_14d"]],
+                       lambda x: ["cases growth",      x["growth_rate"]],
+                       lambda x: ["cases doubling",    x["doubling_time"]],
+                       lambda x: ["cases average million", x["new_cases_7d_per_million"]],
+                       lambda x: ["deaths average",    x["new_deaths_7d"]],
+                       lambda x: ["deaths average 14", x["new_deaths_14d"]],
+                       lambda x: ["deaths average million", x["new_deaths_7d_per_million"]],
                        ]
 
     def __init__(self, bot: "MyBot"):
@@ -43,7 +52,7 @@ class CustomUpdater:
 
     async def setup(self):
         d = self.data_dict
-        for i in ["global"] + [j["iso2"].upper() for j in self.bot.worldometers_api.iso_codes]:
+        for i in ["global"] + [j.iso2.upper() for j in self.bot.worldometers_api.iso_codes]:
             if i == "global":
                 data = await self.bot.worldometers_api.get_global_stats()
             else:
@@ -54,3 +63,12 @@ class CustomUpdater:
                 j = j(data)
                 # noinspection SpellCheckingInspection
                 d[f"covid worldometers {j[0]}"] = str(j[1])
+        derived_metrics = self.bot.jhucsse_api.derived_metrics
+        for i in ["global"] + list(derived_metrics.series.get("country", {})):
+            data = derived_metrics.get_latest("world") if i == "global" else derived_metrics.get_latest("country", i)
+            if data is None:
+                continue
+            for j in self.jhu_updater_gen:
+                j = j(data)
+                # noinspection SpellCheckingInspection
+                d[f"covid jhucsse {i.lower()} {j[0]}"] = str(None if j[1] is None else round(j[1], 2))
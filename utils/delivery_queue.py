@@ -0,0 +1,322 @@
+# coding=utf-8
+"""
+Sends messages through one queue that knows Discord's rate limits, instead of letting every task send as fast as it can
+and waiting out the 429s discord.py gets back.
+
+Sends are paced to stay under the global limit and the per-channel message limit, command replies go before autoupdater
+posts, and sends failing with a transient error (a 429 discord.py gave up on, or for edits and deletions, a 5xx) are
+retried with backoff.
+"""
+import asyncio
+import collections
+import heapq
+import itertools
+import logging
+import math
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import discord
+
+# Discord allows 50 requests per second to a bot, and 5 messages per 5 seconds in a channel. A bit is kept for the
+# requests that don't go through the queue (reactions, edits, deletions...).
+GLOBAL_LIMIT = (45, 1.0)
+CHANNEL_LIMIT = (5, 5.0)
+MAX_IN_FLIGHT = 25
+MAX_RETRIES = 3
+# Failed sends are retried after BACKOFF_BASE seconds, doubling on every retry.
+BACKOFF_BASE = 1.0
+# How many send latencies are kept for the stats.
+LATENCY_HISTORY = 1000
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_UPDATER = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_UPDATER: "updater"}
+
+
+class RateLimitBucket:
+    def __init__(self, limit: int, period: float):
+        """
+        Allows at most limit operations in any period seconds, the way Discord counts them.
+        """
+        self.limit: int = limit
+        self.period: float = period
+        self.recent: Deque[float] = collections.deque(maxlen=limit)
+        self.blocked_until: float = 0.0
+
+    def delay(self, now: float) -> float:
+        """
+        Returns how many seconds until an operation is allowed (0 if it's allowed right away).
+        """
+        wait = self.blocked_until - now
+        if len(self.recent) == self.limit:
+            wait = max(wait, self.recent[0] + self.period - now)
+        return max(wait, 0.0)
+
+    def take(self, now: float):
+        self.recent.append(now)
+
+    def block(self, now: float, seconds: float):
+        """
+        Allows nothing for the given time, like after Discord answered with a 429.
+        """
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        return self.delay(now) == 0 and (not self.recent or self.recent[-1] + self.period <= now)
+
+
+class RateLimitCounter(logging.Handler):
+    def __init__(self):
+        """
+        Counts the 429s discord.py handles by itself (it logs a warning for each, and waits before retrying).
+        """
+        super().__init__(logging.WARNING)
+        self.counts: collections.Counter = collections.Counter()
+
+    def emit(self, record: logging.LogRecord):
+        message = record.getMessage()
+        if message.startswith("We are being rate limited"):
+            self.counts["bucket"] += 1
+        elif message.startswith("Global rate limit has been hit"):
+            self.counts["global"] += 1
+
+
+class DeliveryJob:
+    __slots__ = ("priority", "seq", "channel_id", "send", "retries", "idempotent", "future", "attempts", "queued_at")
+
+    def __init__(self, priority: int, seq: int, channel_id: int, send: Callable[[], Awaitable], retries: int,
+                 idempotent: bool, future: asyncio.Future):
+        self.priority: int = priority
+        self.seq: int = seq
+        self.channel_id: int = channel_id
+        self.send: Callable[[], Awaitable] = send
+        self.retries: int = retries
+        self.idempotent: bool = idempotent
+        self.future: asyncio.Future = future
+        self.attempts: int = 0
+        self.queued_at: float = time.monotonic()
+
+
+class DeliveryQueue:
+    def __init__(self, *, global_limit: Tuple[int, float] = GLOBAL_LIMIT,
+                 channel_limit: Tuple[int, float] = CHANNEL_LIMIT, max_in_flight: int = MAX_IN_FLIGHT,
+                 backoff_base: float = BACKOFF_BASE, logging_level=logging.INFO):
+        """
+        :param global_limit: (requests, seconds) allowed to the whole bot.
+        :param channel_limit: (messages, seconds) allowed in one channel.
+        :param max_in_flight: How many sends may wait for Discord at the same time.
+        :param backoff_base: Delay before the first retry of a failed send, in seconds.
+        """
+        self.logger: logging.Logger = logging.Logger("Delivery Queue", level=logging_level)
+        self.logger.setLevel(logging_level)
+        self.global_bucket: RateLimitBucket = RateLimitBucket(*global_limit)
+        self.channel_limit: Tuple[int, float] = channel_limit
+        self.channel_buckets: Dict[int, RateLimitBucket] = {}
+        self.max_in_flight: int = max_in_flight
+        self.backoff_base: float = backoff_base
+        self.in_flight: int = 0
+        self.counts: collections.Counter = collections.Counter()
+        self.latencies: Dict[int, Deque[float]] = {priority: collections.deque(maxlen=LATENCY_HISTORY)
+                                                   for priority in PRIORITY_NAMES}
+        self.rate_limits: RateLimitCounter = RateLimitCounter()
+        self._ready: List[Tuple[int, int, DeliveryJob]] = []
+        self._delayed: List[Tuple[float, int, int, DeliveryJob]] = []
+        self._counter = itertools.count()
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._last_sweep: float = time.monotonic()
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        if self._task is None or self._task.done():
+            logging.getLogger("discord.http").addHandler(self.rate_limits)
+            self._task = (loop or asyncio.get_event_loop()).create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            logging.getLogger("discord.http").removeHandler(self.rate_limits)
+
+    async def submit(self, channel_id: int, send: Callable[[], Awaitable], *, priority: int = PRIORITY_UPDATER,
+                     retries: int = MAX_RETRIES, idempotent: bool = False) -> Any:
+        """
+        Queues a send, and waits until it's been made.
+
+        :param channel_id: ID of the channel the message goes to.
+        :param send: Coroutine function making the request, like functools.partial(channel.send, content). It's called
+                     again for every retry, so it must build anything single-use (like discord.File) itself.
+        :param priority: PRIORITY_INTERACTIVE for answers to users, PRIORITY_UPDATER for everything else.
+        :param retries: How many times to retry a send failing with a 429 (or a 5xx, if idempotent).
+        :param idempotent: Whether making the request twice does the same as making it once, like an edit or a
+                           deletion. Only those are retried after a 5xx: Discord may have posted a message before
+                           answering with one, so retrying a post could post it twice.
+        :return: What send returned.
+        :raises discord.HTTPException: if the send failed, after its retries for transient errors.
+        """
+        self.start()
+        job = DeliveryJob(priority, next(self._counter), channel_id, send, retries, idempotent,
+                          asyncio.get_event_loop().create_future())
+        heapq.heappush(self._ready, (priority, job.seq, job))
+        self.counts[f"{PRIORITY_NAMES[priority]}_queued"] += 1
+        self._wakeup.set()
+        return await job.future
+
+    def _channel_bucket(self, channel_id: int) -> RateLimitBucket:
+        bucket = self.channel_buckets.get(channel_id)
+        if bucket is None:
+            bucket = self.channel_buckets[channel_id] = RateLimitBucket(*self.channel_limit)
+        return bucket
+
+    def _delay(self, job: DeliveryJob, until: float):
+        heapq.heappush(self._delayed, (until, job.priority, job.seq, job))
+
+    def _sweep(self, now: float):
+        """
+        Forgets the buckets of channels nothing was sent to for a while (they're full again).
+        """
+        if now - self._last_sweep >= self.channel_limit[1] * 12:
+            self._last_sweep = now
+            self.channel_buckets = {channel_id: bucket for channel_id, bucket in self.channel_buckets.items()
+                                    if not bucket.is_idle(now)}
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, priority, seq, job = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (priority, seq, job))
+            timeout = math.inf
+            while self._ready and self.in_flight < self.max_in_flight:
+                wait = self.global_bucket.delay(now)
+                if wait > 0:
+                    timeout = wait
+                    break
+                _, _, job = heapq.heappop(self._ready)
+                if job.future.done():  # whoever submitted it was cancelled meanwhile
+                    self.counts["cancelled"] += 1
+                    continue
+                bucket = self._channel_bucket(job.channel_id)
+                wait = bucket.delay(now)
+                if wait > 0:  # the channel's limit is reached, but other channels can go ahead
+                    self._delay(job, now + wait)
+                    continue
+                self.global_bucket.take(now)
+                bucket.take(now)
+                self.in_flight += 1
+                asyncio.ensure_future(self._send(job))
+            if self._delayed:
+                timeout = min(timeout, self._delayed[0][0] - now)
+            self._sweep(now)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), None if timeout == math.inf else max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, job: DeliveryJob):
+        name = PRIORITY_NAMES[job.priority]
+        try:
+            job.attempts += 1
+            result = await job.send()
+        except discord.HTTPException as e:
+            now = time.monotonic()
+            if e.status == 429:
+                self.counts["429"] += 1
+                # discord.py already waited and retried: back off the channel for a while
+                self._channel_bucket(job.channel_id).block(now, self.backoff_base * 2 ** job.attempts)
+            elif e.status >= 500:
+                self.counts["5xx"] += 1
+            if (e.status == 429 or e.status >= 500 and job.idempotent) and job.attempts <= job.retries:
+                self.counts["retries"] += 1
+                delay = self.backoff_base * 2 ** (job.attempts - 1)
+                self.logger.warning(f"Sending to {job.channel_id} failed with a {e.status}, retrying in {delay}s.")
+                self._delay(job, now + delay)
+            else:
+                self.counts[f"{name}_failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+        except Exception as e:
+            self.counts[f"{name}_failed"] += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.counts[f"{name}_sent"] += 1
+            self.latencies[job.priority].append(time.monotonic() - job.queued_at)
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.in_flight -= 1
+            self._wakeup.set()
+
+    def queue_depth(self) -> Dict[str, int]:
+        depth = collections.Counter(PRIORITY_NAMES[job.priority] for *_, job in self._ready + self._delayed)
+        return {name: depth[name] for name in PRIORITY_NAMES.values()}
+
+    def stats(self) -> dict:
+        latencies = {}
+        for priority, values in self.latencies.items():
+            values = sorted(values)
+            latencies[PRIORITY_NAMES[priority]] = {
+                "p50": values[len(values) // 2] if values else None,
+                "p99": values[min(len(values) - 1, int(len(values) * 0.99))] if values else None,
+                "max": values[-1] if values else None}
+        return {"queue_depth": self.queue_depth(),
+                "in_flight": self.in_flight,
+                "latency": latencies,
+                "counts": dict(self.counts),
+                "handled_429s": dict(self.rate_limits.counts),
+                "channel_buckets": len(self.channel_buckets)}
+
+
+if __name__ == '__main__':
+    import bisect
+    import functools
+    import random
+
+    # python -m utils.delivery_queue: a wave of 1,000 autoupdater sends (half of them edits) to 500 channels, with 20
+    # command replies arriving during it, against a fake Discord that takes 50 to 150ms per send and fails 2% of them
+    # with a 503 (the edits are retried, the posts aren't). Shows how long replies wait, and that Discord's rate limits
+    # are never exceeded (sends start a few milliseconds after the queue lets them go, so a second can see a couple
+    # more than GLOBAL_LIMIT: that's what the margin is for).
+    class FakeResponse:
+        status = 503
+        reason = "Service Unavailable"
+
+    rng = random.Random(0)
+    sent: Dict[int, List[float]] = collections.defaultdict(list)
+
+    async def fake_send(channel_id: int):
+        sent[channel_id].append(time.monotonic())
+        await asyncio.sleep(rng.uniform(0.05, 0.15))
+        if rng.random() < 0.02:
+            raise discord.HTTPException(FakeResponse(), "Service Unavailable")
+
+    async def main():
+        queue = DeliveryQueue(backoff_base=0.1)
+        start_time = time.monotonic()
+        updates = [asyncio.ensure_future(queue.submit(i % 500, functools.partial(fake_send, i % 500),
+                                                      idempotent=i % 2 == 0))
+                   for i in range(1000)]
+        replies = []
+        for i in range(20):
+            await asyncio.sleep(1)
+            replies.append(asyncio.ensure_future(queue.submit(i, functools.partial(fake_send, i),
+                                                              priority=PRIORITY_INTERACTIVE)))
+        await asyncio.gather(*updates, *replies, return_exceptions=True)
+        print(f"Delivered {len(updates) + len(replies)} messages in {time.monotonic() - start_time:.1f}s")
+        stats = queue.stats()
+        print(f"Command replies waited {stats['latency']['interactive']['p50'] * 1000:.0f}ms (median), "
+              f"{stats['latency']['interactive']['max'] * 1000:.0f}ms (max)")
+        print(f"Updater posts waited {stats['latency']['updater']['p50']:.1f}s (median), "
+              f"{stats['latency']['updater']['max']:.1f}s (max)")
+        print(f"Counts: {stats['counts']}")
+        all_sends = sorted(at for times in sent.values() for at in times)
+        busiest_second = max(bisect.bisect_left(all_sends, at + 1) - i for i, at in enumerate(all_sends))
+        busiest_channel = max(max(bisect.bisect_left(times, at + 5) - i for i, at in enumerate(times))
+                              for times in sent.values())
+        print(f"At most {busiest_second} sends in a second, {busiest_channel} in 5 seconds in a channel (Discord "
+              f"allows 50 and 5)")
+        queue.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,194 @@
+# coding=utf-8
+"""
+Metrics derived from the JHU CSSE running totals (daily changes, rolling averages, growth, doubling time and per capita
+rates), computed once per snapshot instead of on every request.
+
+Every location covering the same days is stacked into one location x date matrix, and each metric is a handful of NumPy
+operations over the whole matrix. Each location then gets a TimeSeries whose columns are its rows of the results.
+"""
+import math
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy
+
+from utils.snapshot_store import register_type
+from utils.timeseries import DateIndex, TimeSeries
+
+WORLD = "world"
+# Growth and doubling time compare each day with the same day one window earlier.
+GROWTH_WINDOW = 7
+AVERAGE_WINDOWS = (7, 14)
+DERIVED_FIELDS = ("new_cases", "new_deaths",
+                  "new_cases_7d", "new_deaths_7d", "new_cases_14d", "new_deaths_14d",
+                  "growth_rate", "doubling_time",
+                  "cases_per_million", "deaths_per_million", "new_cases_7d_per_million", "new_deaths_7d_per_million")
+
+
+def _rolling_mean(values: numpy.ndarray, window: int) -> numpy.ndarray:
+    """
+    Average of every row over a sliding window of days, aligned on the last day of the window. The first window - 1
+    days don't have a full window before them and are NaN.
+    """
+    out = numpy.full(values.shape, numpy.nan)
+    if values.shape[1] < window:
+        return out
+    sums = numpy.cumsum(values, axis=1)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    out[:, window - 1:] = sums[:, window - 1:] / window
+    return out
+
+
+def _lagged_ratio(values: numpy.ndarray, lag: int) -> numpy.ndarray:
+    """
+    Ratio between every day and the day lag days before it, NaN where there's no such day or its value isn't positive.
+    """
+    out = numpy.full(values.shape, numpy.nan)
+    if values.shape[1] > lag:
+        earlier = values[:, :-lag]
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            out[:, lag:] = numpy.where(earlier > 0, values[:, lag:] / earlier, numpy.nan)
+    return out
+
+
+def derive(cases: numpy.ndarray, deaths: numpy.ndarray, population: numpy.ndarray) -> Dict[str, numpy.ndarray]:
+    """
+    Computes every metric of DERIVED_FIELDS for many locations at once.
+
+    :param cases: location x date float64 matrix of running case totals. Must cover at least one day.
+    :param deaths: Same, for deaths.
+    :param population: Population of every location, NaN where it's unknown.
+    :return: Dictionary of metric name -> location x date float64 matrix. Undefined values are NaN: rolling averages
+             before the first full window, growth when the previous week had no new cases, doubling time when the
+             running total isn't growing, per capita rates without a population.
+    """
+    new_cases = numpy.diff(cases, axis=1, prepend=cases[:, :1])
+    new_deaths = numpy.diff(deaths, axis=1, prepend=deaths[:, :1])
+    metrics = {"new_cases": new_cases, "new_deaths": new_deaths}
+    for window in AVERAGE_WINDOWS:
+        metrics[f"new_cases_{window}d"] = _rolling_mean(new_cases, window)
+        metrics[f"new_deaths_{window}d"] = _rolling_mean(new_deaths, window)
+    # week over week change of the average daily new cases: 0.1 means 10% more than the week before
+    metrics["growth_rate"] = _lagged_ratio(metrics[f"new_cases_{GROWTH_WINDOW}d"], GROWTH_WINDOW) - 1
+    # days the running total takes to double at the pace of the last window
+    ratio = _lagged_ratio(cases, GROWTH_WINDOW)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        metrics["doubling_time"] = numpy.where(ratio > 1, GROWTH_WINDOW * math.log(2) / numpy.log(ratio), numpy.nan)
+        per_million = numpy.where(population > 0, 1_000_000 / population, numpy.nan)[:, numpy.newaxis]
+    metrics["cases_per_million"] = cases * per_million
+    metrics["deaths_per_million"] = deaths * per_million
+    metrics["new_cases_7d_per_million"] = metrics["new_cases_7d"] * per_million
+    metrics["new_deaths_7d_per_million"] = metrics["new_deaths_7d"] * per_million
+    return metrics
+
+
+def _stack(series: List[TimeSeries], field: str) -> numpy.ndarray:
+    """
+    Stacks a metric of series covering the same days into a location x date float64 matrix. Series without the metric
+    get a row of NaN.
+    """
+    missing = numpy.full(len(series[0]), numpy.nan)
+    return numpy.stack([item[field] if field in item.columns else missing for item in series]).astype(numpy.float64)
+
+
+def _to_optional(value: float) -> Optional[float]:
+    return None if math.isnan(value) else value
+
+
+@register_type
+class DerivedMetrics:
+    def __init__(self, series: Dict[str, Dict[str, TimeSeries]],
+                 latest: Dict[str, Dict[str, Dict[str, Optional[float]]]]):
+        """
+        The DERIVED_FIELDS of every location. Build one with DerivedMetrics.build.
+
+        :param series: Dictionary of location type -> location name -> TimeSeries with one float64 column per metric.
+        :param latest: Same, but with the value of every metric on the last day (None where it's undefined).
+        """
+        self.series: Dict[str, Dict[str, TimeSeries]] = series
+        self.latest: Dict[str, Dict[str, Dict[str, Optional[float]]]] = latest
+
+    @classmethod
+    def build(cls, locations: Mapping[str, Mapping[str, TimeSeries]],
+              populations: Mapping[str, Mapping[str, Optional[float]]] = None) -> "DerivedMetrics":
+        """
+        :param locations: Dictionary of location type -> location name -> running totals (with cases and deaths).
+        :param populations: Optional: same, but with the population of the locations, for the per capita rates.
+        """
+        populations = populations or {}
+        groups: Dict[Tuple[DateIndex, int, int], List[Tuple[str, str, TimeSeries]]] = {}
+        for location_type, names in locations.items():
+            for name, totals in names.items():
+                if len(totals):
+                    groups.setdefault((totals.index, totals.start, totals.stop), []).append((location_type, name,
+                                                                                              totals))
+        series = {location_type: {} for location_type in locations}
+        latest = {location_type: {} for location_type in locations}
+        for (index, start, stop), group in groups.items():
+            if start or stop != len(index):
+                index = DateIndex.from_keys(index.keys[start:stop])
+            totals = [item for _, _, item in group]
+            population = numpy.array([populations.get(location_type, {}).get(name) or numpy.nan
+                                      for location_type, name, _ in group], dtype=numpy.float64)
+            metrics = derive(_stack(totals, "cases"), _stack(totals, "deaths"), population)
+            last_day = {field: matrix[:, -1].tolist() for field, matrix in metrics.items()}
+            for row, (location_type, name, _) in enumerate(group):
+                series[location_type][name] = TimeSeries(index, {field: matrix[row]
+                                                                 for field, matrix in metrics.items()})
+                latest[location_type][name] = {field: _to_optional(values[row]) for field, values in last_day.items()}
+        return cls(series, latest)
+
+    def get(self, location_type: str, name: Optional[str] = None) -> Optional[TimeSeries]:
+        """
+        :param location_type: "world", "country", "province" or "state".
+        :param name: Name of the location, as given to build. Not needed for the world.
+        :return: The metrics of the location, or None if it has none.
+        """
+        return self.series.get(location_type, {}).get(WORLD if name is None else name)
+
+    def get_latest(self, location_type: str, name: Optional[str] = None) -> Optional[Dict[str, Optional[float]]]:
+        """
+        Like get, but only returns the value of every metric on the last day.
+        """
+        return self.latest.get(location_type, {}).get(WORLD if name is None else name)
+
+
+def series_to_json(series: TimeSeries) -> Dict[str, list]:
+    """
+    Converts derived metrics to JSON-friendly lists (NaN isn't valid JSON, so undefined values become None).
+    """
+    result = {"dates": list(series.keys)}
+    for field in series.fields:
+        result[field] = [_to_optional(value) for value in series[field].tolist()]
+    return result
+
+
+if __name__ == '__main__':
+    import datetime
+    import time
+
+    from utils.timeseries import format_date
+
+    # python -m utils.derived_metrics: times computing every metric for synthetic locations, and compares reading the
+    # latest values with computing them on every request (like the embeds used to)
+    rng = numpy.random.default_rng(0)
+    days, locations = 1000, 400
+    index = DateIndex.from_keys(format_date(datetime.date(2020, 1, 22) + datetime.timedelta(days=i))
+                                for i in range(days))
+    countries = {str(i): TimeSeries(index, {"cases": rng.integers(0, 5000, days).cumsum(),
+                                            "deaths": rng.integers(0, 50, days).cumsum()})
+                 for i in range(locations)}
+    populations = {"country": {name: float(rng.integers(10 ** 5, 10 ** 9)) for name in countries}}
+
+    start = time.perf_counter()
+    metrics = DerivedMetrics.build({"country": countries}, populations)
+    print(f"Building, {locations} locations x {days} days: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    start = time.perf_counter()
+    for name, item in countries.items():
+        item.rolling_average("cases")[-1], item.rolling_average("deaths")[-1]
+    print(f"Averages on request, every location: {(time.perf_counter() - start) * 1000:.2f}ms")
+
+    start = time.perf_counter()
+    for name in countries:
+        metrics.get_latest("country", name)
+    print(f"Every metric from the snapshot, every location: {(time.perf_counter() - start) * 1000:.2f}ms")
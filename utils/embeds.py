@@ -5,6 +5,7 @@ from typing import Any, Optional, List
 
 import discord
 
+from utils.api import BaseAPIException
 from utils.bot_class import MyBot
 from utils.ctx_class import MyContext
 
@@ -43,7 +44,9 @@ async def basic_stats_embed(location: tuple, today: datetime.date, *, ctx: MyCon
                                               "make up such a small amount of all provinces, meaning it's not worth it "
                                               "to try to show it for all of them."))
     for name, value in data_points:
-        if stats[value] == 0:
+        if value not in stats:
+            continue
+        elif stats[value] == 0:
             stats_embed.add_field(name=name, value=_("{0} (could also have no data)", format(stats[value], ',')))
         else:
             stats_embed.add_field(name=name, value=format(stats[value], ','))
@@ -60,23 +63,23 @@ async def advanced_stats_embed(country: str, *, ctx: Optional[MyContext] = None,
         def _(msg, *args, **kwargs):
             return msg.format(*args, **kwargs)
     data_points = ((_("<:infected:775877435320565801> Total Cases"), "cases"),
-                   (_("New Cases"), "todayCases"),
-                   (_("Cases per 1m People"), "casesPerOneMillion"),
+                   (_("New Cases"), "today_cases"),
+                   (_("Cases per 1m People"), "cases_per_million"),
                    ("zero_space", "zero_space"),
                    (_("<:active:775877437056614491> Active Cases"), "active"),
-                   (_("Active Case Change"), "activeCaseChange"),
-                   (_("Active Cases per 1m People"), "activePerOneMillion"),
+                   (_("Active Case Change"), "active_case_change"),
+                   (_("Active Cases per 1m People"), "active_per_million"),
                    ("zero_space", "zero_space"),
                    (_("<:deaths:775877434687488030> Total Deaths"), "deaths"),
-                   (_("New Deaths"), "todayDeaths"),
-                   (_("Deaths per 1m People"), "deathsPerOneMillion"),
+                   (_("New Deaths"), "today_deaths"),
+                   (_("Deaths per 1m People"), "deaths_per_million"),
                    ("zero_space", "zero_space"),
                    (_("<:recovered:775877435089748008> Total Recoveries"), "recovered"),
-                   (_("New Recoveries"), "todayRecovered"),
-                   (_("Recovered per 1m People"), "recoveredPerOneMillion"),
+                   (_("New Recoveries"), "today_recovered"),
+                   (_("Recovered per 1m People"), "recovered_per_million"),
                    ("zero_space", "zero_space"),
                    (_("<:tests:775877436075802676> Tests"), "tests"),
-                   (_("Tests per 1m People"), "testsPerOneMillion"),
+                   (_("Tests per 1m People"), "tests_per_million"),
                    ("zero_space", "zero_space") * 2,
                    (_("Critical Cases"), "critical"),
                    (_("Population"), "population"))
@@ -84,45 +87,59 @@ async def advanced_stats_embed(country: str, *, ctx: Optional[MyContext] = None,
         return None
     elif country[0] == "world":
         country_data = await bot.worldometers_api.get_global_stats()
-        name = "World"
     elif country[0] == "country":
         country_data = await bot.worldometers_api.get_country_stats(country[1])
-        name = country_data["country"]
     elif country[0] == "state":
         country_data = await bot.worldometers_api.get_state_stats(country[1])
-        name = country_data["state"]
     elif country[0] == "continent":
         country_data = await bot.worldometers_api.get_continent_stats(country[1])
-        name = country_data["continent"]
     else:
         return None
+    if country_data is None:
+        return None
+    name = country_data.name
     embed = discord.Embed(title=_("COVID-19 Stats for {name}", name=name),
                           color=discord.Color.dark_red(),
                           timestamp=bot.worldometers_api.last_updated_utc)
     embed.set_footer(text=_("Stats last updated at (UTC)"))
-    if "countryInfo" in country_data and "flag" in country_data["countryInfo"]:
-        embed.set_thumbnail(url=country_data["countryInfo"]["flag"])
+    if country_data.flag is not None:
+        embed.set_thumbnail(url=country_data.flag)
     for dp in data_points:
         if dp[0] == "zero_space":
             add_zero_space(embed, 1)
-        else:
-            try:
-                if country_data[dp[1]] is not None:
-                    embed.add_field(name=_(dp[0]),
-                                    value=format(int(country_data[dp[1]]), ","))
-                else:
-                    embed.add_field(name=_(dp[0]),
-                                    value=_("no data"))
-            except KeyError:
-                bot.logger.warning(f"Key {dp[1]} is missing from {name}!")
-                embed.add_field(name=_(dp[0]),
-                                value=_("no data"))
-    if name == "World":
+            continue
+        value = getattr(country_data, dp[1])
+        embed.add_field(name=_(dp[0]), value=_("no data") if value is None else format(int(value), ","))
+    if country_data.affected_countries is not None:
         embed.add_field(name=_("Affected Countries"),
-                        value=format(int(country_data["affectedCountries"]), ","))
+                        value=format(country_data.affected_countries, ","))
+    derived = await _latest_derived_stats(bot, country[0], country_data.iso2 or country[1])
+    if derived is not None:
+        for name, key in ((_("New Cases (7 day average)"), "new_cases_7d"),
+                          (_("New Deaths (7 day average)"), "new_deaths_7d")):
+            value = derived[key]
+            embed.add_field(name=name, value=_("no data") if value is None else format(round(value), ","))
+        growth_rate, doubling_time = derived["growth_rate"], derived["doubling_time"]
+        embed.add_field(name=_("Weekly Growth"),
+                        value=_("no data") if growth_rate is None else format(growth_rate, "+.1%"))
+        embed.add_field(name=_("Doubling Time"),
+                        value=_("not growing") if doubling_time is None else _("{0} days", round(doubling_time, 1)))
     return embed
 
 
+async def _latest_derived_stats(bot: MyBot, location_type: str, name: Optional[str]) -> Optional[dict]:
+    """
+    Returns the latest derived metrics (see Covid19JHUCSSEStats.get_latest_derived_stats) of a location, or None if
+    there aren't any (JHU doesn't have continents, or isn't loaded yet).
+    """
+    if location_type not in ("world", "country", "state"):
+        return None
+    try:
+        return await bot.jhucsse_api.get_latest_derived_stats(location_type, name)
+    except (RuntimeError, BaseAPIException):
+        return None
+
+
 async def owid_embed(name: str, *, ctx: Optional[MyContext] = None, bot: Optional[MyBot] = None)\
         -> Optional[List[discord.Embed]]:
     if not ctx and not bot:
@@ -209,11 +226,7 @@ async def owid_embed(name: str, *, ctx: Optional[MyContext] = None, bot: Optiona
     )
 
     embeds = []
-    d = {}
-    i = -1
-    while not d.get("total_cases", None):
-        d = data["data"][i]
-        i -= 1
+    d = data.latest_row()
 
     r_value = d.get("reproduction_rate")
     if r_value:
@@ -294,11 +307,11 @@ async def list_embed(ctx: MyContext, letter: str) -> [discord.Embed, None]:
     countries = []
     letter = str(letter).lower()
     for field in _list:
-        country_name = field["country"].lower()
+        country_name = field.country.lower()
         if country_name.startswith(letter):
             countries.append(field)
     if len(countries) != 0:
         for country in countries:
-            embed.add_field(name=country["country"],
-                            value=country["iso2"])
+            embed.add_field(name=country.country,
+                            value=country.iso2)
         return embed
@@ -11,6 +11,8 @@ from typing import Optional
 from matplotlib import pyplot, ticker
 from io import BytesIO
 
+from utils.timeseries import TimeSeries
+
 DISCORD_BG_COLOR = (0.15625, 0.16796875, 0.1875)
 
 BASE_IMAGE_PATH = "/home/dustin/PycharmProjects/covid_bot_v5/temp_data/plots"
@@ -44,7 +46,33 @@ def parse_percents(_input: float) -> float:
     return round(_input, 2)
 
 
-def generate_line_plot(country_data: dict,
+def _date_tick_spacing(days_shown: int) -> int:
+    """
+    Returns how many days to leave between two date labels, so they don't overlap.
+    """
+    if days_shown < 8:
+        return 1
+    elif days_shown < 15:
+        return 2
+    elif days_shown < 29:
+        return 4
+    elif days_shown < 50:
+        return 7
+    elif days_shown < 100:
+        return 14
+    elif days_shown < 150:
+        return 21
+    elif days_shown < 200:
+        return 28
+    elif days_shown < 300:
+        return 56
+    elif days_shown < 400:
+        return 84
+    else:
+        return 112
+
+
+def generate_line_plot(country_data: TimeSeries,
                        country_name: str,
                        start_time: Optional[datetime.date] = None,
                        end_time: Optional[datetime.date] = None,
@@ -52,31 +80,24 @@ def generate_line_plot(country_data: dict,
     """
     Generate a plot detailing COVID-19 cases for a country.
 
-    :param country_data: Data for the country: expects this to be a dict with root keys 'cases', 'recovered', and
-                        'deaths'. Each of those keys should contain a dict with keys formatted 'mm/dd/yy' for the count
-                        for that day.
+    :param country_data: TimeSeries for the country, with any of the 'cases', 'recovered' and 'deaths' metrics.
     :param country_name: The country name. Set as the title, not used for anything else.
-    :param start_time: Optional: filter to only show data points after this date. Note: the system used for calculating
-                       the total number of dates to show isn't very smart and can sometimes make weird values if this is
-                       set.
-    :param end_time: Optional: filter to only show data points before this date. Same note as for start_time applies.
+    :param start_time: Optional: filter to only show data points on or after this date.
+    :param end_time: Optional: filter to only show data points on or before this date.
     :param logarithmic: Optional: defaults to false. If true, a logarithmic graph will be generated instead of a linear
                         one.
-    :return: A ID that can be passed to get_image to get a absolute path to the image.
+    :return: A BytesIO containing the PNG image.
     """
-    start_time = start_time or datetime.date(1970, 1, 1)
-    end_time = end_time or datetime.date(2038, 1, 19)  # https://en.wikipedia.org/wiki/Year_2038_problem
+    country_data = country_data.slice(start_time, end_time)
     f: pyplot.Figure = pyplot.figure(figsize=(10.24, 10.24), dpi=100, facecolor=DISCORD_BG_COLOR,
                                      edgecolor=DISCORD_BG_COLOR, linewidth=5)
+    labels = country_data.keys
     for _key in ['cases', 'recovered', 'deaths']:
         a = []
         b = []
-        if _key in country_data:
-            for key, i in zip(country_data[_key], range(len(country_data[_key]))):
-                date = from_time_to_date(time.strptime(key, "%m/%d/%y"))
-                if start_time < date < end_time:
-                    a.append(key)
-                    b.append(country_data[_key][key] if logarithmic else country_data[_key][key] / 1000)
+        if _key in country_data.fields:
+            a = labels
+            b = country_data[_key] if logarithmic else country_data[_key] / 1000
         if _key == "deaths":
             color = "red"
         elif _key == "cases":
@@ -88,27 +109,7 @@ def generate_line_plot(country_data: dict,
         else:
             color = "black"
         pyplot.plot(a, b, label=_key.capitalize(), color=color)
-    time_between_start_and_end = start_time - end_time
-    if time_between_start_and_end.days < 8:
-        delta = 1
-    elif time_between_start_and_end.days < 15:
-        delta = 2
-    elif time_between_start_and_end.days < 29:
-        delta = 4
-    elif time_between_start_and_end.days < 50:
-        delta = 7
-    elif time_between_start_and_end.days < 100:
-        delta = 14
-    elif time_between_start_and_end.days < 150:
-        delta = 21
-    elif time_between_start_and_end.days < 200:
-        delta = 28
-    elif time_between_start_and_end.days < 300:
-        delta = 56
-    elif time_between_start_and_end.days < 400:
-        delta = 84
-    else:
-        delta = 112
+    delta = _date_tick_spacing(len(country_data))
     ax = f.add_subplot(111)
     # noinspection SpellCheckingInspection
     ax.xaxis.set_major_locator(ticker.MultipleLocator(delta))
@@ -134,6 +135,49 @@ def generate_line_plot(country_data: dict,
     return buf
 
 
+def generate_daily_plot(derived_data: TimeSeries,
+                        country_name: str,
+                        start_time: Optional[datetime.date] = None,
+                        end_time: Optional[datetime.date] = None) -> BytesIO:
+    """
+    Generate a plot of the new cases and deaths of every day, with their 7 day averages.
+
+    :param derived_data: Derived metrics of the location (see Covid19JHUCSSEStats.get_derived_stats).
+    :param country_name: The country name. Set as the title, not used for anything else.
+    :param start_time: Optional: filter to only show data points on or after this date.
+    :param end_time: Optional: filter to only show data points on or before this date.
+    :return: A BytesIO containing the PNG image.
+    """
+    derived_data = derived_data.slice(start_time, end_time)
+    f: pyplot.Figure = pyplot.figure(figsize=(10.24, 10.24), dpi=100, facecolor=DISCORD_BG_COLOR,
+                                     edgecolor=DISCORD_BG_COLOR, linewidth=5)
+    labels = derived_data.keys
+    ax = f.add_subplot(111)
+    deaths_ax = ax.twinx()  # deaths are usually a hundred times less than cases
+    ax.bar(labels, derived_data["new_cases"], color="blue", alpha=0.3, label="New cases")
+    ax.plot(labels, derived_data["new_cases_7d"], color="blue", label="New cases (7 day average)")
+    deaths_ax.plot(labels, derived_data["new_deaths_7d"], color="red", label="New deaths (7 day average)")
+    ax.xaxis.set_major_locator(ticker.MultipleLocator(_date_tick_spacing(len(derived_data))))
+    ax.tick_params(axis="x", labelrotation=90)
+    ax.set_xlabel("Date")
+    ax.set_ylabel("New cases")
+    deaths_ax.set_ylabel("New deaths")
+    handles, names = ax.get_legend_handles_labels()
+    deaths_handles, deaths_names = deaths_ax.get_legend_handles_labels()
+    ax.legend(handles + deaths_handles, names + deaths_names, loc="upper left")
+    ax.set_title(f"Daily COVID-19 Stats in {country_name}")
+    buf = BytesIO()
+    f.savefig(buf,
+              facecolor=DISCORD_BG_COLOR,
+              edgecolor=DISCORD_BG_COLOR,
+              transparent=True,
+              format="png")
+    pyplot.close(f)
+    del f
+    buf.seek(0)
+    return buf
+
+
 def generate_pie_chart(overall_data: dict,
                        title: str,
                        force_include: Optional[str] = None, *,
@@ -0,0 +1,86 @@
+# coding=utf-8
+"""
+Grouping of the JHU CSSE /historical rows (one per country or province) by country, in a single pass over the rows.
+"""
+import collections
+from typing import Dict, Iterable, List, Tuple
+
+from utils.country_registry import CountryRecord
+
+
+def group_by_country(rows: Iterable[dict], countries: Iterable[CountryRecord]) \
+        -> Tuple[Dict[str, Dict[str, dict]], Dict[str, dict], Dict[str, dict]]:
+    """
+    Sorts the rows of disease.sh's /historical endpoint out by country.
+
+    :param rows: The rows, each with "country", "province" (None for the whole country) and "timeline" keys.
+    :param countries: The countries to keep, usually a CountryRegistry. Rows of other countries are dropped.
+    :return: (ISO2 code -> {province or "all" -> row}, lowercased province -> row, country name -> whole country row)
+    """
+    by_country: Dict[str, List[dict]] = collections.defaultdict(list)
+    for row in rows:
+        by_country[row["country"]].append(row)
+    historical_stats = {}
+    provinces = {}
+    country_rows = {}
+    for country in countries:
+        cty_data = {}
+        for row in by_country.get(country.country, ()):
+            if row["province"] is None:
+                cty_data["all"] = row
+                country_rows[row["country"]] = row
+            else:
+                cty_data[row["province"]] = row
+                provinces[row["province"].lower()] = row
+        historical_stats[country.iso2] = cty_data
+    return historical_stats, provinces, country_rows
+
+
+if __name__ == '__main__':
+    import copy
+    import json
+    import sys
+    import time
+
+    from utils.timeseries import TimeSeries
+
+    # python -m utils.grouping historical.json iso_codes.json counties.json, with the responses of
+    # /v3/covid-19/historical?lastdays=all, /v3/covid-19/countries and /v3/covid-19/historical/usacounties/{state}
+    # ?lastdays=all recorded to files: compares the old per-country filter and per-date county sums with this
+    with open(sys.argv[1]) as f:
+        historical = json.load(f)
+    with open(sys.argv[2]) as f:
+        iso_codes = [record for record in map(CountryRecord.from_json, json.load(f)) if record is not None]
+    with open(sys.argv[3]) as f:
+        counties = [county for county in json.load(f) if county is not None and county["county"] is not None]
+
+    def best_of(function, repeat=5):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def old_grouping():
+        historical_stats = {}
+        for country in iso_codes:
+            cty_data = {}
+            for row in filter(lambda x: x["country"] == country.country, historical):
+                cty_data["all" if row["province"] is None else row["province"]] = row
+            historical_stats[country.iso2] = cty_data
+
+    def old_county_sum():
+        total = {field: dict.fromkeys(counties[0]["timeline"][field], 0) for field in ("cases", "deaths")}
+        for county in counties:
+            for field in ("cases", "deaths"):
+                for key, value in county["timeline"][field].items():
+                    total[field][key] += value or 0
+
+    county_series = [TimeSeries.from_timeline(copy.deepcopy(county["timeline"])) for county in counties]
+    for name, old, new in (
+            (f"Grouping {len(historical)} rows by {len(iso_codes)} countries", old_grouping,
+             lambda: group_by_country(historical, iso_codes)),
+            (f"Summing {len(counties)} counties", old_county_sum, lambda: TimeSeries.sum(county_series))):
+        old_time, new_time = best_of(old), best_of(new)
+        print(f"{name}: {old_time * 1000:.2f}ms before, {new_time * 1000:.2f}ms now ({old_time / new_time:.1f}x)")
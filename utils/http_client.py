@@ -0,0 +1,247 @@
+# coding=utf-8
+"""
+A single, long-lived HTTP client shared by every data source, so refreshes reuse pooled keep-alive connections instead
+of redoing DNS, TCP and TLS handshakes every time.
+"""
+import hashlib
+import logging
+from types import SimpleNamespace
+from typing import Optional, Dict, Tuple
+
+import aiohttp
+try:
+    import brotli  # noqa: F401 aiohttp can only decode brotli responses if this is installed
+except (ImportError, ModuleNotFoundError):
+    brotli = False
+else:
+    brotli = True
+
+DEFAULT_CONNECTION_LIMIT = 100
+DEFAULT_CONNECTION_LIMIT_PER_HOST = 16
+DEFAULT_DNS_CACHE_TTL = 300
+DEFAULT_KEEPALIVE_TIMEOUT = 60
+DEFAULT_TIMEOUT = 300
+
+
+class ValidatorCache:
+    def __init__(self):
+        """
+        Remembers the ETag/Last-Modified headers and a hash of the body of the last response for every URL, so
+        unchanged data can be detected with a conditional GET (or, when the server ignores those, by comparing hashes).
+        """
+        self._entries: Dict[str, Tuple[Optional[str], Optional[str], bytes]] = {}
+        self.not_modified: int = 0
+        self.unchanged: int = 0
+        self.changed: int = 0
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        """
+        Returns the If-None-Match/If-Modified-Since headers to send for a URL. Empty if the URL hasn't been seen yet.
+        """
+        headers = {}
+        if url in self._entries:
+            etag, last_modified, _ = self._entries[url]
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def record_not_modified(self, url: str):
+        self.not_modified += 1
+
+    def update(self, url: str, headers, body: bytes) -> bool:
+        """
+        Stores the validators for a fresh response.
+
+        :param url: The URL that was requested.
+        :param headers: The response headers.
+        :param body: The raw response body.
+        :return: True if the body differs from the last one seen for this URL, False if it is byte-identical.
+        """
+        return self.update_digest(url, headers, self.digest(body))
+
+    @staticmethod
+    def digest(body: bytes = b""):
+        """
+        Returns the hash object used to compare bodies. Call .update() on it to feed a streamed body chunk by chunk,
+        then pass it to update_digest.
+        """
+        return hashlib.blake2b(body, digest_size=20)
+
+    def update_digest(self, url: str, headers, digest) -> bool:
+        """
+        Same as update, but takes the hash of a body that was streamed instead of the body itself.
+
+        :param digest: The hash object returned by ValidatorCache.digest, after being fed the whole body.
+        """
+        entry = (headers.get("ETag"), headers.get("Last-Modified"), digest.digest())
+        changed = self._compare(url, entry)
+        self._entries[url] = entry
+        return changed
+
+    def _compare(self, url: str, entry: Tuple[Optional[str], Optional[str], bytes]) -> bool:
+        previous = self._entries.get(url)
+        if previous is not None and previous[2] == entry[2]:
+            self.unchanged += 1
+            return False
+        self.changed += 1
+        return True
+
+    def stage(self) -> "StagedValidators":
+        """
+        Returns a StagedValidators to use for one update, which only stores its validators here once committed.
+        """
+        return StagedValidators(self)
+
+    def forget(self, url: str):
+        self._entries.pop(url, None)
+
+    def stats(self) -> dict:
+        return {"tracked_urls": len(self._entries),
+                "not_modified": self.not_modified,
+                "unchanged": self.unchanged,
+                "changed": self.changed}
+
+
+class StagedValidators:
+    def __init__(self, cache: ValidatorCache):
+        """
+        The validators of the responses an update got, kept aside until the data they describe has been parsed and
+        published. Until then, the cache still has the previous ones: if the update fails halfway through, the next one
+        downloads everything again instead of being told that nothing changed.
+
+        Takes the same calls as a ValidatorCache, so it can be passed to get_data as one.
+        """
+        self.cache: ValidatorCache = cache
+        self.pending: Dict[str, Tuple[Optional[str], Optional[str], bytes]] = {}
+
+    def request_headers(self, url: str) -> Dict[str, str]:
+        return self.cache.request_headers(url)
+
+    def record_not_modified(self, url: str):
+        self.cache.record_not_modified(url)
+
+    def update(self, url: str, headers, body: bytes) -> bool:
+        return self.update_digest(url, headers, ValidatorCache.digest(body))
+
+    def update_digest(self, url: str, headers, digest) -> bool:
+        entry = (headers.get("ETag"), headers.get("Last-Modified"), digest.digest())
+        self.pending[url] = entry
+        return self.cache._compare(url, entry)
+
+    def commit(self):
+        """
+        Stores the validators in the cache. Call this once the data was published.
+        """
+        self.cache._entries.update(self.pending)
+        self.pending.clear()
+
+
+class PooledHTTPClient:
+    def __init__(self, *, limit: int = DEFAULT_CONNECTION_LIMIT,
+                 limit_per_host: int = DEFAULT_CONNECTION_LIMIT_PER_HOST,
+                 dns_cache_ttl: int = DEFAULT_DNS_CACHE_TTL,
+                 keepalive_timeout: float = DEFAULT_KEEPALIVE_TIMEOUT,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 logging_level=logging.INFO):
+        """
+        Wraps one aiohttp.ClientSession with a pooling connector and keeps track of how well the pool is doing.
+
+        The session is created lazily the first time it is used, since aiohttp wants that to happen inside a running
+        event loop.
+
+        :param limit: Maximum number of open connections over all hosts.
+        :param limit_per_host: Maximum number of open connections to a single host.
+        :param dns_cache_ttl: How long resolved DNS entries are cached, in seconds.
+        :param keepalive_timeout: How long idle connections are kept around for reuse, in seconds.
+        :param timeout: Default total timeout for a request, in seconds.
+        """
+        self.logger: logging.Logger = logging.Logger("HTTP Client", level=logging_level)
+        self.logger.setLevel(logging_level)
+        self.limit: int = limit
+        self.limit_per_host: int = limit_per_host
+        self.dns_cache_ttl: int = dns_cache_ttl
+        self.keepalive_timeout: float = keepalive_timeout
+        self.timeout: float = timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self.validators: ValidatorCache = ValidatorCache()
+        self.requests: int = 0
+        self.handshakes: int = 0
+        self.reused_connections: int = 0
+        self.dns_cache_hits: int = 0
+        self.dns_cache_misses: int = 0
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        self.logger.info("Opening pooled AIOHttp session...")
+        self._connector = aiohttp.TCPConnector(limit=self.limit,
+                                               limit_per_host=self.limit_per_host,
+                                               ttl_dns_cache=self.dns_cache_ttl,
+                                               use_dns_cache=True,
+                                               keepalive_timeout=self.keepalive_timeout,
+                                               enable_cleanup_closed=True)
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(self._on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(self._on_dns_cache_miss)
+        headers = {"Accept-Encoding": "gzip, deflate, br" if brotli else "gzip, deflate"}
+        return aiohttp.ClientSession(connector=self._connector,
+                                     timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                     headers=headers,
+                                     trace_configs=[trace_config])
+
+    async def _on_request_start(self, session: aiohttp.ClientSession, ctx: SimpleNamespace, params):
+        self.requests += 1
+
+    async def _on_connection_create_end(self, session: aiohttp.ClientSession, ctx: SimpleNamespace, params):
+        self.handshakes += 1
+
+    async def _on_connection_reuseconn(self, session: aiohttp.ClientSession, ctx: SimpleNamespace, params):
+        self.reused_connections += 1
+
+    async def _on_dns_cache_hit(self, session: aiohttp.ClientSession, ctx: SimpleNamespace, params):
+        self.dns_cache_hits += 1
+
+    async def _on_dns_cache_miss(self, session: aiohttp.ClientSession, ctx: SimpleNamespace, params):
+        self.dns_cache_misses += 1
+
+    @property
+    def open_connections(self) -> int:
+        if self._connector is None or self._connector.closed:
+            return 0
+        # aiohttp doesn't expose these publicly: idle keep-alive connections + connections currently in use
+        idle = sum(len(conns) for conns in getattr(self._connector, "_conns", {}).values())
+        return idle + len(getattr(self._connector, "_acquired", ()))
+
+    @property
+    def reuse_ratio(self) -> float:
+        total = self.handshakes + self.reused_connections
+        return self.reused_connections / total if total else 0.0
+
+    def stats(self) -> dict:
+        """
+        Returns pool statistics: open connections, requests made, handshakes done, connections reused and the
+        resulting reuse ratio, and DNS cache hits/misses.
+        """
+        return {"open_connections": self.open_connections,
+                "requests": self.requests,
+                "handshakes": self.handshakes,
+                "reused_connections": self.reused_connections,
+                "reuse_ratio": round(self.reuse_ratio, 4),
+                "dns_cache_hits": self.dns_cache_hits,
+                "dns_cache_misses": self.dns_cache_misses}
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._connector = None
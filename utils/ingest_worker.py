@@ -0,0 +1,140 @@
+# coding=utf-8
+"""
+Runs the CPU-heavy part of ingesting new data (decoding the JSON, building the columns, summing counties, deriving
+metrics) in a worker process, so the event loop only does the downloading and never stalls on a big parse.
+
+The functions run by the worker must be picklable (module-level functions) and only get plain data: the raw response
+bodies and whatever earlier data they build on. Their results are columnar (TimeSeries, OWIDCountryData...), so sending
+them back is mostly copying NumPy buffers.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import copyreg
+import functools
+import logging
+import multiprocessing
+import time
+from concurrent.futures.process import BrokenProcessPool
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Optional
+
+
+def _mapping_proxy(mapping: dict) -> MappingProxyType:
+    return MappingProxyType(mapping)
+
+
+# snapshots are made of read-only mappings, which pickle doesn't handle by itself
+copyreg.pickle(MappingProxyType, lambda mapping: (_mapping_proxy, (dict(mapping),)))
+
+
+def _timed(func: Callable, *args) -> tuple:
+    start_time = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start_time
+
+
+class IngestWorker:
+    def __init__(self, *, processes: int = 1, logging_level=logging.INFO):
+        """
+        :param processes: How many worker processes to use. With 0, functions run right away in the calling thread
+                          instead (handy for scripts and debugging, but blocks the event loop while they run).
+        """
+        self.logger: logging.Logger = logging.Logger("Ingest Worker", level=logging_level)
+        self.logger.setLevel(logging_level)
+        self.processes: int = processes
+        self.calls: collections.Counter = collections.Counter()
+        self.timings: Dict[str, float] = {}
+        self.restarts: int = 0
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._pool is None:
+            # fork, like the bot's other process pools: main.py isn't safe to import again, which spawn would do
+            self._pool = concurrent.futures.ProcessPoolExecutor(self.processes,
+                                                                mp_context=multiprocessing.get_context("fork"))
+        return self._pool
+
+    async def run(self, func: Callable, *args) -> Any:
+        """
+        Runs func(*args) in the worker and returns its result. Exceptions raised by func are raised here.
+
+        :raises concurrent.futures.process.BrokenProcessPool: if the worker process died. A new one is started on the
+                                                               next call.
+        """
+        name = func.__name__
+        self.calls[name] += 1
+        start_time = time.perf_counter()
+        if not self.processes:
+            result = func(*args)
+            self.timings[name] = time.perf_counter() - start_time
+            return result
+        try:
+            result, duration = await asyncio.get_event_loop().run_in_executor(self._get_pool(),
+                                                                              functools.partial(_timed, func, *args))
+        except BrokenProcessPool:
+            self.logger.error(f"The worker process died while running {name}, starting a new one next time.")
+            self.restarts += 1
+            self._pool = None
+            raise
+        self.timings[name] = duration
+        self.timings[f"{name}_transfer"] = time.perf_counter() - start_time - duration
+        return result
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {"processes": self.processes,
+                "calls": dict(self.calls),
+                "last_durations": dict(self.timings),
+                "restarts": self.restarts}
+
+
+if __name__ == '__main__':
+    import datetime
+    import json
+    import math
+
+    from utils import api
+    from utils.country_registry import CountryRecord
+    from utils.loop_monitor import LoopLagMonitor
+    from utils.timeseries import format_date
+
+    # python -m utils.ingest_worker: parses a synthetic full JHU update (250 countries and 3000 counties with 1000 days
+    # each) in the event loop and in the worker, and compares the event loop lag measured while it runs
+
+    def timeline(days: int, scale: int) -> dict:
+        keys = [format_date(datetime.date(2020, 1, 22) + datetime.timedelta(days=i)) for i in range(days)]
+        return {field: {key: i * scale for i, key in enumerate(keys)} for field in ("cases", "deaths", "recovered")}
+
+    countries = [CountryRecord(f"Country {i}", f"C{i}", f"C{i:02}", 10 ** 6) for i in range(250)]
+    bodies = api.JHUBodies(
+        global_stats=json.dumps(timeline(1000, 1000)).encode(),
+        countries={country.iso2: json.dumps({"country": country.country, "province": None,
+                                             "timeline": timeline(1000, 10)}).encode() for country in countries},
+        provinces=json.dumps([]).encode(),
+        states={f"state {i}": json.dumps([{"county": f"county {j}", "timeline": timeline(1000, 1)}
+                                          for j in range(60)]).encode() for i in range(50)})
+    print(f"{sum(map(len, bodies.countries.values())) + sum(map(len, bodies.states.values())):,} bytes of JSON")
+
+    async def main():
+        monitor = LoopLagMonitor(interval=0.005, warn_lag=math.inf)
+        monitor.start()
+        for worker in (IngestWorker(processes=0), IngestWorker()):
+            await worker.run(len, ())  # start the process
+            await asyncio.sleep(0.1)
+            start_time = time.monotonic()
+            await worker.run(api.parse_jhu_update, api.JHUSnapshot(), bodies, tuple(countries), tuple(bodies.states),
+                             True, {country.iso2: country.population for country in countries})
+            duration = time.monotonic() - start_time
+            await asyncio.sleep(0.1)  # let the monitor notice
+            mode = "in the worker" if worker.processes else "in the event loop"
+            print(f"Parsing {mode}: {duration:.2f}s, "
+                  f"max event loop lag {monitor.max_lag(start_time) * 1000:.0f}ms")
+            worker.shutdown()
+        monitor.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+# coding=utf-8
+"""
+Incremental parsing of big JSON objects: splits a top-level {"key": value, ...} object into its items while it is
+still being downloaded, so only one item (plus whatever hasn't been parsed yet) has to be held in memory at a time.
+"""
+import codecs
+import json
+import re
+from typing import Any, List, Tuple
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JSONObjectSplitter:
+    def __init__(self):
+        """
+        Feed it the raw bytes of a JSON object as they come in, and it returns the (key, value) pairs of the top-level
+        object as soon as each of them is complete.
+
+        Values are parsed with the C JSON decoder. When the buffered text ends in the middle of a value, the decoder
+        fails and parsing is retried only once the buffer has doubled in size, so the total work stays linear in the
+        size of the document no matter how small the chunks are.
+        """
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._buffer: str = ""
+        self._started: bool = False
+        self._retry_at: int = 0
+        self.done: bool = False
+
+    def feed(self, data: bytes) -> List[Tuple[str, Any]]:
+        """
+        Adds a chunk of the document.
+
+        :param data: Raw bytes, split anywhere (even in the middle of a UTF-8 sequence).
+        :return: List of (key, value) pairs completed by this chunk. Often empty.
+        """
+        self._buffer += self._utf8.decode(data)
+        if self.done or len(self._buffer) < self._retry_at:
+            return []
+        return self._drain(final=False)
+
+    def close(self) -> List[Tuple[str, Any]]:
+        """
+        Signals the end of the document.
+
+        :return: List of (key, value) pairs that were still pending.
+        :raises ValueError: if the document isn't a complete JSON object.
+        """
+        self._buffer += self._utf8.decode(b"", final=True)
+        items = [] if self.done else self._drain(final=True)
+        if not self.done:
+            raise ValueError("JSON document ended before the top-level object was closed")
+        return items
+
+    def _skip_whitespace(self, pos: int) -> int:
+        return _WHITESPACE.match(self._buffer, pos).end()
+
+    def _drain(self, *, final: bool) -> List[Tuple[str, Any]]:
+        buffer = self._buffer
+        items = []
+        pos = self._skip_whitespace(0)
+        if not self._started:
+            if pos == len(buffer):
+                return items
+            if buffer[pos] != "{":
+                raise ValueError(f"Expected a JSON object, got {buffer[pos]!r}")
+            self._started = True
+            pos += 1
+        consumed = pos
+        self._retry_at = 0
+        try:
+            while True:
+                pos = self._skip_whitespace(pos)
+                if pos < len(buffer) and buffer[pos] == ",":
+                    pos = self._skip_whitespace(pos + 1)
+                if pos == len(buffer):
+                    break
+                if buffer[pos] == "}":
+                    self.done = True
+                    consumed = pos + 1
+                    break
+                key, pos = self._decoder.raw_decode(buffer, pos)
+                pos = self._skip_whitespace(pos)
+                if pos == len(buffer):
+                    raise json.JSONDecodeError("Unterminated item", buffer, pos)
+                if buffer[pos] != ":":
+                    raise ValueError(f"Expected ':' after key {key!r}, got {buffer[pos]!r}")
+                value, pos = self._decoder.raw_decode(buffer, self._skip_whitespace(pos + 1))
+                items.append((key, value))
+                consumed = pos
+        except json.JSONDecodeError:
+            if final:
+                raise
+            # most likely just cut off in the middle of an item, wait for the buffer to double before trying again
+            self._retry_at = 2 * (len(buffer) - consumed)
+        self._buffer = buffer[consumed:]
+        return items
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    import tracemalloc
+
+    # python -m utils.json_stream owid-covid-data.json: compares peak memory/time of json.loads and the splitter
+    with open(sys.argv[1], "rb") as f:
+        raw = f.read()
+    tracemalloc.start()
+    start = time.perf_counter()
+    whole = json.loads(raw)
+    print(f"json.loads: {time.perf_counter() - start:.3f}s, peak {tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f}MiB")
+    del whole
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    splitter = JSONObjectSplitter()
+    count = 0
+    for i in range(0, len(raw), 2 ** 16):
+        count += len(splitter.feed(raw[i:i + 2 ** 16]))
+    count += len(splitter.close())
+    print(f"JSONObjectSplitter: {count} items in {time.perf_counter() - start:.3f}s, "
+          f"peak {tracemalloc.get_traced_memory()[1] / 2 ** 20:.1f}MiB")
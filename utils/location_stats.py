@@ -0,0 +1,139 @@
+# coding=utf-8
+"""
+Compact records for the Worldometers stats of one location (the world, a continent, a country or a US state), instead
+of keeping the raw disease.sh JSON (with its nested countryInfo and fields nothing reads) for every location.
+"""
+from typing import NamedTuple, Optional
+
+from utils.snapshot_store import register_type
+
+# record field -> disease.sh key, for the fields that are copied over as is
+INT_FIELDS = {"updated": "updated",
+              "cases": "cases",
+              "today_cases": "todayCases",
+              "deaths": "deaths",
+              "today_deaths": "todayDeaths",
+              "recovered": "recovered",
+              "today_recovered": "todayRecovered",
+              "active": "active",
+              "critical": "critical",
+              "tests": "tests",
+              "population": "population",
+              "affected_countries": "affectedCountries"}
+FLOAT_FIELDS = {"cases_per_million": "casesPerOneMillion",
+                "deaths_per_million": "deathsPerOneMillion",
+                "active_per_million": "activePerOneMillion",
+                "recovered_per_million": "recoveredPerOneMillion",
+                "critical_per_million": "criticalPerOneMillion",
+                "tests_per_million": "testsPerOneMillion"}
+
+
+def _int(value) -> Optional[int]:
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(value) -> Optional[float]:
+    """
+    Like _int, but for rates. Whole numbers are kept as ints, so they're shown the way the API sent them.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    elif isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@register_type
+class LocationStats(NamedTuple):
+    """
+    Stats for one location. Every number is None when disease.sh doesn't have it (or doesn't report it for that type of
+    location: only the world has affected_countries, only countries have an ISO2 code and a flag).
+    """
+    name: str
+    iso2: Optional[str] = None
+    flag: Optional[str] = None
+    updated: Optional[int] = None
+    cases: Optional[int] = None
+    today_cases: Optional[int] = None
+    deaths: Optional[int] = None
+    today_deaths: Optional[int] = None
+    recovered: Optional[int] = None
+    today_recovered: Optional[int] = None
+    active: Optional[int] = None
+    active_case_change: Optional[int] = None
+    critical: Optional[int] = None
+    tests: Optional[int] = None
+    population: Optional[int] = None
+    affected_countries: Optional[int] = None
+    cases_per_million: Optional[float] = None
+    deaths_per_million: Optional[float] = None
+    active_per_million: Optional[float] = None
+    recovered_per_million: Optional[float] = None
+    critical_per_million: Optional[float] = None
+    tests_per_million: Optional[float] = None
+
+    @classmethod
+    def from_json(cls, data: dict, name: str) -> "LocationStats":
+        """
+        :param data: Stats of the location, as returned by disease.sh. Missing and null fields become None.
+        :param name: Name of the location.
+        """
+        fields = {field: _int(data.get(key)) for field, key in INT_FIELDS.items()}
+        fields.update((field, _float(data.get(key))) for field, key in FLOAT_FIELDS.items())
+        info = data.get("countryInfo") or {}
+        today = (fields["today_cases"], fields["today_deaths"], fields["today_recovered"])
+        active_case_change = None if None in today else today[0] - (today[1] + today[2])
+        return cls(name=name, iso2=info.get("iso2"), flag=info.get("flag"), active_case_change=active_case_change,
+                   **fields)
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+    import time
+    import tracemalloc
+
+    # python -m utils.location_stats countries.json, with the response of /v3/covid-19/countries?allowNull=true
+    # recorded to a file: compares the memory used by the raw JSON and by the records, and the time to read every field
+    with open(sys.argv[1]) as f:
+        body = f.read()
+
+    tracemalloc.start()
+    raw = json.loads(body)
+    raw_size = tracemalloc.get_traced_memory()[0]
+    records = [LocationStats.from_json(country, country["country"]) for country in json.loads(body)]
+    records_size = tracemalloc.get_traced_memory()[0] - raw_size
+    tracemalloc.stop()
+    print(f"{len(raw)} countries: {raw_size / 2 ** 10:.0f}KiB as JSON, {records_size / 2 ** 10:.0f}KiB as records")
+
+    keys = list(INT_FIELDS.values()) + list(FLOAT_FIELDS.values()) + ["activeCaseChange"]
+    fields = list(INT_FIELDS) + list(FLOAT_FIELDS) + ["active_case_change"]
+
+    def read_raw():
+        for country in raw:
+            for key in keys:
+                try:
+                    if country[key] is not None:
+                        int(country[key])
+                except KeyError:
+                    pass
+
+    def read_records():
+        for record in records:
+            for field in fields:
+                if getattr(record, field) is not None:
+                    int(getattr(record, field))
+
+    for name, function in (("JSON", read_raw), ("records", read_records)):
+        start = time.perf_counter()
+        for _ in range(100):
+            function()
+        print(f"Reading every field from the {name}: {(time.perf_counter() - start) * 10:.3f}ms per pass")
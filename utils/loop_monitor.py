@@ -0,0 +1,71 @@
+# coding=utf-8
+"""
+Measures how late the event loop runs things. Anything hogging the loop (parsing a big response, a long computation...)
+delays every other callback, and shows up here as lag.
+"""
+import asyncio
+import collections
+import logging
+import time
+from typing import Deque, Optional, Tuple
+
+# How often the loop is probed, in seconds.
+PROBE_INTERVAL = 0.25
+# How many probes are kept for the stats (one hour with the default interval).
+PROBE_HISTORY = 4 * 60 * 60
+# Lag above which a warning is logged, in seconds.
+WARN_LAG = 0.5
+
+
+class LoopLagMonitor:
+    def __init__(self, *, interval: float = PROBE_INTERVAL, history: int = PROBE_HISTORY, warn_lag: float = WARN_LAG,
+                 logging_level=logging.INFO):
+        """
+        Sleeps for interval seconds over and over, and records how much later than asked each sleep wakes up.
+
+        :param interval: Time between two probes, in seconds.
+        :param history: How many probes to keep.
+        :param warn_lag: Log a warning whenever the lag goes above this many seconds.
+        """
+        self.logger: logging.Logger = logging.Logger("Loop Lag Monitor", level=logging_level)
+        self.logger.setLevel(logging_level)
+        self.interval: float = interval
+        self.warn_lag: float = warn_lag
+        self.probes: Deque[Tuple[float, float]] = collections.deque(maxlen=history)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        if self._task is None or self._task.done():
+            self._task = (loop or asyncio.get_event_loop()).create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.probes.append((now, lag))
+            if lag > self.warn_lag:
+                self.logger.warning(f"The event loop was blocked for {lag:.3f} seconds.")
+
+    def max_lag(self, since: Optional[float] = None) -> float:
+        """
+        Returns the highest lag measured (since the given time.monotonic() time, if given), in seconds.
+        """
+        return max((lag for at, lag in self.probes if since is None or at >= since), default=0.0)
+
+    def stats(self) -> dict:
+        lags = sorted(lag for _, lag in self.probes)
+        if not lags:
+            return {"probes": 0}
+        return {"probes": len(lags),
+                "current": self.probes[-1][1],
+                "mean": sum(lags) / len(lags),
+                "p99": lags[min(len(lags) - 1, int(len(lags) * 0.99))],
+                "max": lags[-1],
+                "over_warn_lag": sum(lag > self.warn_lag for lag in lags)}
@@ -66,6 +66,7 @@ class MapGetter:
         self.set_up = False
         self._local_init_call = False  # unused if self.save_resources is false
         self.maps = {}
+        self.version = 0  # bumped every time the maps are downloaded
         self.logger.info("Initialized map system.")
 
     def _check_if_set_up(self):
@@ -129,6 +130,7 @@ class MapGetter:
                 self.maps[each_graph] = io.BytesIO(f.read())
             os.unlink(f"{self.base_path}/coronavirus-data-explorer.png")
             self.logger.info("done!")
+        self.version += 1
         if self.save_resources:
             ff.quit()
 
@@ -143,3 +145,11 @@ class MapGetter:
         elif map_name not in self.maps:
             return None
         return copy.deepcopy(self.maps[map_name])  # we know it's already a io.BytesIO object
+
+    def get_map_bytes(self, map_name: str) -> Optional[bytes]:
+        """
+        Like get_map, but returns the image itself, for sending it many times without copying it every time. Returns
+        None if the maps haven't been downloaded yet.
+        """
+        buffer = self.maps.get(map_name)
+        return buffer.getvalue() if buffer is not None else None
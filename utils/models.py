@@ -126,6 +126,11 @@ class AutoupdaterData(Model):
     force_update = fields.BooleanField(default=False)
     do_update_at = fields.DatetimeField(default=datetime.datetime.utcfromtimestamp(-1))
     type = fields.IntEnumField(AutoupdateTypes)
+    # Edit the last posted message instead of posting a new one every time
+    edit_in_place = fields.BooleanField(default=False)
+    message_id = fields.BigIntField(null=True)
+    # Digest of what the last posted message shows, to skip editing it when nothing changed
+    payload_hash = fields.CharField(max_length=64, null=True)
     channel: fields.ReverseRelation[DiscordChannel]
 
     class Meta:
@@ -134,7 +139,7 @@ class AutoupdaterData(Model):
     def __repr__(self):
         return f"<AutoupdaterData country_name={self.country_name} delay={self.delay} " \
                f"last_updated={self.last_updated} force_update={self.force_update} " \
-               f"do_update_at={self.do_update_at} type={self.type}>"
+               f"do_update_at={self.do_update_at} type={self.type} edit_in_place={self.edit_in_place}>"
 
 
 class FutureSimulations(Model):
@@ -528,6 +533,16 @@ async def get_ctx_permissions(ctx: 'MyContext') -> dict:
     return permissions
 
 
+# Columns added to existing tables. generate_schemas only creates the tables that are missing, so until there are proper
+# migrations (see the TODO at the top), databases made by older versions get them here. IF NOT EXISTS makes these no-ops
+# once they've run.
+SCHEMA_UPGRADES = (
+    'ALTER TABLE "autoupdater_data" ADD COLUMN IF NOT EXISTS "edit_in_place" BOOL NOT NULL DEFAULT False',
+    'ALTER TABLE "autoupdater_data" ADD COLUMN IF NOT EXISTS "message_id" BIGINT',
+    'ALTER TABLE "autoupdater_data" ADD COLUMN IF NOT EXISTS "payload_hash" VARCHAR(64)',
+)
+
+
 async def init_db_connection(config):
     tortoise_config = {
         'connections': {
@@ -555,6 +570,10 @@ async def init_db_connection(config):
 
     await Tortoise.generate_schemas()
 
+    connection = Tortoise.get_connection("default")
+    for statement in SCHEMA_UPGRADES:
+        await connection.execute_script(statement)
+
 
 async def get_player(user: typing.Union[discord.User, discord.Member]) -> Player:
     player = await Player.filter(discord_id=user.id).first()
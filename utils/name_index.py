@@ -0,0 +1,137 @@
+# coding=utf-8
+"""
+Resolves the location names users type (country names, ISO codes, continents, provinces, states, and a few common
+aliases) with a single dictionary lookup.
+"""
+import re
+import typing
+import unicodedata
+from typing import Dict, Iterable, Optional, Tuple
+
+if typing.TYPE_CHECKING:
+    from utils.country_registry import CountryRecord
+
+WORLD_NAMES = ("global", "world", "ot")
+
+# alias -> ISO2 code, for the names people commonly use that don't match the data's country names
+COUNTRY_ALIASES = {
+    "us": "US",
+    "usa": "US",
+    "america": "US",
+    "united states": "US",
+    "united states of america": "US",
+    "uk": "GB",
+    "britain": "GB",
+    "great britain": "GB",
+    "united kingdom": "GB",
+    "england": "GB",
+    "south korea": "KR",
+    "korea": "KR",
+    "republic of korea": "KR",
+    "uae": "AE",
+    "united arab emirates": "AE",
+    "czech republic": "CZ",
+    "drc": "CD",
+    "dr congo": "CD",
+    "democratic republic of the congo": "CD",
+    "russian federation": "RU",
+    "viet nam": "VN",
+    "ivory coast": "CI",
+    "cote d ivoire": "CI",
+    "holland": "NL",
+    "the netherlands": "NL",
+    "burma": "MM",
+    "vatican": "VA",
+    "swaziland": "SZ",
+    "macedonia": "MK",
+}
+
+_NOT_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Case-folds a name, strips accents, and turns any run of punctuation/whitespace into a single space, so "Curaçao",
+    "curacao" and "CURACAO " all end up the same.
+    """
+    name = unicodedata.normalize("NFKD", str(name))
+    name = "".join(c for c in name if not unicodedata.combining(c)).casefold()
+    return _NOT_ALPHANUMERIC.sub(" ", name).strip()
+
+
+class NameIndex:
+    def __init__(self, version: int = 0):
+        """
+        Dictionary of normalized alias -> (location type, name to look the location up with).
+
+        Build one with NameIndex.build. Aliases are added in priority order: the first location to claim an alias
+        keeps it (so "georgia" stays the country, not the US state).
+
+        :param version: Data version the index was built from.
+        """
+        self.version: int = version
+        self.names: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.iso2_codes: Dict[str, str] = {}
+
+    @classmethod
+    def build(cls, countries: Iterable["CountryRecord"], *, version: int = 0,
+              **other_types: Iterable[str]) -> "NameIndex":
+        """
+        Builds an index.
+
+        :param countries: The countries, usually a CountryRegistry.
+        :param version: Data version the index is built from.
+        :param other_types: Other location types, in priority order, as type name -> names. The names are returned
+                            lowercased by lookup, so they must be usable that way with the getters.
+        """
+        index = cls(version)
+        for name in WORLD_NAMES:
+            index.names.setdefault(name, ("world", None))
+        countries = list(countries)
+        for country in countries:
+            canonical = str(country.country).lower()
+            for alias in (country.country, country.iso2, country.iso3):  # not the population
+                if alias:
+                    index.add("country", alias, canonical, iso2=country.iso2)
+        by_iso2 = {country.iso2: country for country in countries}
+        for alias, iso2 in COUNTRY_ALIASES.items():
+            if iso2 in by_iso2:
+                index.add("country", alias, str(by_iso2[iso2].country).lower(), iso2=iso2)
+        for location_type, names in other_types.items():
+            for name in names:
+                index.add(location_type, name, str(name).lower())
+        return index
+
+    def add(self, location_type: str, alias: str, name: str, *, iso2: Optional[str] = None):
+        key = normalize_name(alias)
+        if not key or key in self.names:
+            return
+        self.names[key] = (location_type, name)
+        if iso2 is not None:
+            self.iso2_codes[key] = iso2
+
+    def lookup(self, name: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Returns (location type, name) for anything the index knows, or None.
+        """
+        return self.names.get(normalize_name(name))
+
+    def get_iso2_code(self, name: str) -> Optional[str]:
+        """
+        Returns the ISO2 code of a country, given any of its names or codes, or None.
+        """
+        return self.iso2_codes.get(normalize_name(name))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+if __name__ == '__main__':
+    from utils.country_registry import CountryRecord
+
+    # python -m utils.name_index: only names and codes are indexed, not the other fields of the records
+    index = NameIndex.build([CountryRecord("France", "FR", "FRA", 65273511)], province=["ontario"])
+    assert index.lookup("france") == index.lookup("FRA") == index.lookup("fr") == ("country", "france")
+    assert index.lookup("65273511") is None
+    assert not any(name.isdigit() for name in index.names)
+    print(f"{len(index)} names: {sorted(index.names)}")
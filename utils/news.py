@@ -8,6 +8,8 @@ from discord import Embed
 from discord.ext import menus
 import aiohttp
 
+from utils.http_client import PooledHTTPClient
+
 
 def from_time_to_datetime(in_time: time.struct_time) -> datetime.datetime:
     return datetime.datetime(year=in_time.tm_year,
@@ -30,10 +32,11 @@ class NewsAPI:
     Output regex was "$1", ""
     """
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, *, http_pool: Optional[PooledHTTPClient] = None):
         if len(api_key) != 32:
             raise ValueError("NewsAPI key is not 32 characters long!")
         self.api_key = api_key
+        self.http_pool: PooledHTTPClient = http_pool or PooledHTTPClient()
         self.logger = logging.getLogger("news_api")
         self.world_data: Optional[dict] = None
         # self.country_data: Dict[str, Optional[dict]] = {}
@@ -41,35 +44,34 @@ class NewsAPI:
 
     async def update(self, *, session: Optional[aiohttp.ClientSession] = None):
         self.logger.info("Updating News API...")
-        session = session or aiohttp.ClientSession()
-        self.logger.debug("Opening session...")
-        async with session as s:
-            self.logger.debug("Getting global stats...")
-            r = await s.get(f"https://newsapi.org/v2/top-headlines?q=covid-19&apiKey={self.api_key}")
+        s = session or self.http_pool.session
+        self.logger.debug("Getting global stats...")
+        r = await s.get(f"https://newsapi.org/v2/top-headlines?q=covid-19&apiKey={self.api_key}")
+        try:
+            r.raise_for_status()
+        except aiohttp.ClientResponseError as e:
             try:
-                r.raise_for_status()
-            except aiohttp.ClientResponseError as e:
+                with open("news.json", "r") as f:
+                    self.world_data = json.load(f)
+                r.release()  # hand the connection back to the shared pool, we won't read the body
+            except FileNotFoundError:
                 try:
-                    with open("news.json", "r") as f:
-                        self.world_data = json.load(f)
-                except FileNotFoundError:
-                    try:
-                        js = await r.json()
-                    except aiohttp.ClientConnectionError:
-                        js = None
-                    return js, e
-            else:
-                self.world_data = await r.json()
+                    js = await r.json()
+                except aiohttp.ClientConnectionError:
+                    js = None
+                return js, e
+        else:
+            self.world_data = await r.json()
 
-            """
-            for i in self.country_codes:
-                self.logger.debug(f"Getting stats for {i}...")
-                r = await s.get(f"https://newsapi.org/v2/top-headlines?q=covid-19&country={i}&apiKey={self.api_key}")
-                r.raise_for_status()
-                if (await r.json())["status"] != "ok":
-                    raise aiohttp.ClientError("Status was not ok!")
-                self.country_data[i] = await r.json()
-            """
+        """
+        for i in self.country_codes:
+            self.logger.debug(f"Getting stats for {i}...")
+            r = await s.get(f"https://newsapi.org/v2/top-headlines?q=covid-19&country={i}&apiKey={self.api_key}")
+            r.raise_for_status()
+            if (await r.json())["status"] != "ok":
+                raise aiohttp.ClientError("Status was not ok!")
+            self.country_data[i] = await r.json()
+        """
         self._updated = True
         with open("news.json", "w") as f:
             json.dump(self.world_data, f)
@@ -0,0 +1,104 @@
+# coding=utf-8
+"""
+Country leaderboards, computed once per Worldometers snapshot instead of sorting every country on every request.
+"""
+import math
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy
+
+from utils.location_stats import LocationStats
+from utils.snapshot_store import register_type
+
+PER_CAPITA_SUFFIX = "_per_million"
+
+
+def per_capita_type(sort_type: str) -> str:
+    return sort_type + PER_CAPITA_SUFFIX
+
+
+def _number(value) -> float:
+    """
+    Converts a value from the API to a float, with NaN for nulls (and anything else that isn't a number).
+    """
+    if value is None or isinstance(value, bool):
+        return math.nan
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return math.nan
+    return value if math.isfinite(value) else math.nan
+
+
+@register_type
+class CountryRankings:
+    def __init__(self, iso2_codes: Tuple[str, ...], values: Dict[str, numpy.ndarray],
+                 orders: Dict[str, numpy.ndarray]):
+        """
+        Every country ranked by every metric. Build one with CountryRankings.build.
+
+        :param iso2_codes: ISO2 code of every country, in the order of the arrays below.
+        :param values: Dictionary of ranking type -> float64 array of every country's value, NaN where it's unknown.
+        :param orders: Dictionary of ranking type -> int32 array of positions in iso2_codes, highest value first.
+                       Countries without a value for that ranking type are left out.
+        """
+        self.iso2_codes: Tuple[str, ...] = iso2_codes
+        self.values: Dict[str, numpy.ndarray] = values
+        self.orders: Dict[str, numpy.ndarray] = orders
+
+    @classmethod
+    def build(cls, country_stats: Mapping[str, LocationStats], sort_types: Sequence[str],
+              per_capita_types: Sequence[str] = ()) -> "CountryRankings":
+        """
+        :param country_stats: Dictionary of ISO2 code -> Worldometers country stats.
+        :param sort_types: Fields of the country stats to rank by.
+        :param per_capita_types: Keys to also rank by value per million inhabitants (per_capita_type(key)).
+        """
+        iso2_codes = tuple(country_stats)
+        countries = [country_stats[iso2] for iso2 in iso2_codes]
+        values = {}
+        for sort_type in sort_types:
+            values[sort_type] = numpy.fromiter((_number(getattr(country, sort_type)) for country in countries),
+                                               dtype=numpy.float64, count=len(countries))
+        if per_capita_types:
+            population = numpy.fromiter((_number(country.population) for country in countries),
+                                        dtype=numpy.float64, count=len(countries))
+            population[population <= 0] = numpy.nan
+            for sort_type in per_capita_types:
+                totals = values.get(sort_type)
+                if totals is None:
+                    totals = numpy.fromiter((_number(getattr(country, sort_type)) for country in countries),
+                                            dtype=numpy.float64, count=len(countries))
+                values[per_capita_type(sort_type)] = totals / population * 1_000_000
+        orders = {}
+        for ranking_type, column in values.items():
+            known = numpy.flatnonzero(~numpy.isnan(column))
+            # stable sort on the negated values: highest first, ties keep the API's order
+            orders[ranking_type] = known[numpy.argsort(-column[known], kind="stable")].astype(numpy.int32)
+        return cls(iso2_codes, values, orders)
+
+    @property
+    def ranking_types(self) -> Tuple[str, ...]:
+        return tuple(self.orders)
+
+    def __contains__(self, ranking_type: str) -> bool:
+        return ranking_type in self.orders
+
+    def top(self, ranking_type: str, limit: Optional[int] = None, *, reverse: bool = False) \
+            -> List[Tuple[str, float]]:
+        """
+        Returns the leaderboard for a ranking type.
+
+        :param ranking_type: One of ranking_types.
+        :param limit: Maximum number of countries to return. All of them if None.
+        :param reverse: If true, lowest value first.
+        :return: List of (ISO2 code, value) tuples. Countries without a value aren't ranked.
+        :raises KeyError: if the ranking type doesn't exist.
+        """
+        order = self.orders[ranking_type]
+        if reverse:
+            order = order[::-1]
+        if limit is not None:
+            order = order[:limit]
+        column = self.values[ranking_type]
+        return [(self.iso2_codes[i], float(column[i])) for i in order.tolist()]
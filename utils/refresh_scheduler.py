@@ -0,0 +1,232 @@
+# coding=utf-8
+"""
+Runs the periodic refreshes of every data source from a single loop, instead of one independent tasks.loop each.
+
+Every source declares how often it should be refreshed (with some jitter, so sources with the same period don't all
+hit upstream at the same moment), how old its data may get before it counts as stale, and which other sources have to
+be refreshed before it. Failed refreshes are retried with exponential backoff, and only a few refreshes run at once.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Failed refreshes are retried after BACKOFF_BASE seconds, doubling on every consecutive failure up to the period.
+BACKOFF_BASE = 30
+MAX_CONCURRENT_REFRESHES = 2
+
+
+class RefreshSource:
+    def __init__(self, name: str, refresh: Callable[[], Awaitable], *, period: float, jitter: float = 0.1,
+                 max_staleness: Optional[float] = None, depends_on: Iterable[str] = (),
+                 backoff_base: float = BACKOFF_BASE, first_run_in: Optional[float] = None):
+        """
+        A data source, as seen by the RefreshScheduler.
+
+        :param name: Name of the source, used by depends_on and in the metrics.
+        :param refresh: Coroutine function doing the refresh. Failing means raising an exception.
+        :param period: Time between two refreshes, in seconds.
+        :param jitter: How much the period can randomly vary, as a fraction of it (0.1 = up to 10% shorter or longer).
+        :param max_staleness: How old the data may get before the source counts as stale, in seconds. Defaults to three
+                              periods.
+        :param depends_on: Names of sources that must be refreshed before this one.
+        :param backoff_base: Delay before the first retry of a failed refresh, in seconds.
+        :param first_run_in: Delay before the first refresh, in seconds. Defaults to a (jittered) period.
+        """
+        self.name: str = name
+        self.refresh: Callable[[], Awaitable] = refresh
+        self.period: float = period
+        self.jitter: float = jitter
+        self.max_staleness: float = max_staleness if max_staleness is not None else 3 * period
+        self.depends_on: Tuple[str, ...] = tuple(depends_on)
+        self.backoff_base: float = backoff_base
+        self.created_at: float = time.monotonic()
+        self.next_run: float = self.created_at + (self.jittered_period() if first_run_in is None else first_run_in)
+        self.last_success: Optional[float] = None
+        self.last_duration: Optional[float] = None
+        self.last_error: Optional[BaseException] = None
+        self.failures: int = 0
+        self.runs: int = 0
+        self.running: bool = False
+
+    def jittered_period(self) -> float:
+        return self.period * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def backoff(self) -> float:
+        """
+        Delay before retrying after the current streak of failures: doubles on every failure, never more than the
+        period, and jittered like it.
+        """
+        delay = min(self.period, self.backoff_base * 2 ** (self.failures - 1))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def age(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        Seconds since the last successful refresh, or None if there hasn't been one.
+        """
+        if self.last_success is None:
+            return None
+        return (now or time.monotonic()) - self.last_success
+
+    def is_stale(self, now: Optional[float] = None) -> bool:
+        now = now or time.monotonic()
+        return (now - (self.last_success or self.created_at)) > self.max_staleness
+
+    def stats(self, now: Optional[float] = None) -> dict:
+        now = now or time.monotonic()
+        return {"last_success_age": self.age(now),
+                "last_duration": self.last_duration,
+                "next_run_in": max(0.0, self.next_run - now),
+                "stale": self.is_stale(now),
+                "running": self.running,
+                "consecutive_failures": self.failures,
+                "runs": self.runs,
+                "last_error": repr(self.last_error) if self.last_error is not None else None}
+
+
+class RefreshScheduler:
+    def __init__(self, *, max_concurrent: int = MAX_CONCURRENT_REFRESHES, logging_level=logging.INFO,
+                 on_error: Optional[Callable[[str, BaseException], Awaitable]] = None):
+        """
+        Refreshes data sources on their schedule.
+
+        :param max_concurrent: How many refreshes may run at the same time.
+        :param on_error: Optional: coroutine function called with the source name and exception when a refresh fails.
+        """
+        self.logger: logging.Logger = logging.Logger("Refresh Scheduler", level=logging_level)
+        self.logger.setLevel(logging_level)
+        self.sources: Dict[str, RefreshSource] = {}
+        self.max_concurrent: int = max_concurrent
+        self.on_error: Optional[Callable[[str, BaseException], Awaitable]] = on_error
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(max_concurrent)
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running_tasks: Dict[str, asyncio.Task] = {}
+
+    def add_source(self, name: str, refresh: Callable[[], Awaitable], **kwargs) -> RefreshSource:
+        """
+        Adds (or replaces) a source. Takes the same arguments as RefreshSource.
+
+        :raises ValueError: if the source depends on a source that doesn't exist yet.
+        """
+        source = RefreshSource(name, refresh, **kwargs)
+        missing = [dependency for dependency in source.depends_on if dependency not in self.sources]
+        if missing:
+            raise ValueError(f"{name} depends on unknown sources: {', '.join(missing)}")
+        self.sources[name] = source
+        self._wakeup.set()
+        return source
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        if self._task is None or self._task.done():
+            self._task = (loop or asyncio.get_event_loop()).create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running_tasks.values():
+            task.cancel()
+        self._running_tasks.clear()
+
+    async def run_now(self, name: str) -> bool:
+        """
+        Refreshes a source right away, without waiting for its dependencies, and waits until it's done. If it's already
+        being refreshed, waits for that refresh instead.
+
+        :return: True if the refresh succeeded.
+        """
+        source = self.sources[name]
+        if not source.running:
+            source.running = True
+            self._running_tasks[name] = asyncio.ensure_future(self._refresh(source))
+        await asyncio.shield(self._running_tasks[name])
+        return source.failures == 0
+
+    def refresh_soon(self, name: str):
+        """
+        Makes a source due right away (along with its dependencies, if their data is older than one of their periods).
+        """
+        self.sources[name].next_run = time.monotonic()
+        self._wakeup.set()
+
+    def stats(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        return {name: source.stats(now) for name, source in self.sources.items()}
+
+    def stale_sources(self) -> List[str]:
+        now = time.monotonic()
+        return [name for name, source in self.sources.items() if source.is_stale(now)]
+
+    def _dependencies_ready(self, source: RefreshSource, now: float) -> bool:
+        """
+        Checks whether a due source can start. Dependencies that are running, or whose data is older than their period,
+        hold it back; the outdated ones are made due right away so they run first. A dependency that is failing doesn't
+        hold anything back: the source goes ahead with whatever data the dependency still has.
+        """
+        ready = True
+        for dependency in map(self.sources.get, source.depends_on):
+            if dependency.running:
+                ready = False
+            elif dependency.failures == 0:
+                age = dependency.age(now)
+                if age is None or age >= dependency.period:
+                    dependency.next_run = min(dependency.next_run, now)
+                    ready = False
+        return ready
+
+    def _waiting_on_running(self, source: RefreshSource) -> bool:
+        return any(self.sources[dependency].running for dependency in source.depends_on)
+
+    def _due_sources(self, now: float) -> List[RefreshSource]:
+        due = [source for source in self.sources.values() if not source.running and source.next_run <= now]
+        return [source for source in due if self._dependencies_ready(source, now)]
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            for source in self._due_sources(now):
+                source.running = True
+                self._running_tasks[source.name] = asyncio.ensure_future(self._refresh(source))
+            # Sources held back by a running dependency are left out: they can't start before it's done, and
+            # _refresh wakes the loop up when it is.
+            waiting = [source.next_run for source in self.sources.values()
+                       if not source.running and not self._waiting_on_running(source)]
+            timeout = max(0.0, min(waiting) - time.monotonic()) if waiting else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh(self, source: RefreshSource):
+        try:
+            async with self._semaphore:
+                start_time = time.monotonic()
+                source.runs += 1
+                try:
+                    await source.refresh()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    source.failures += 1
+                    source.last_error = e
+                    source.next_run = time.monotonic() + source.backoff()
+                    self.logger.exception(f"Refreshing {source.name} failed ({source.failures} in a row), retrying in "
+                                          f"{source.next_run - time.monotonic():.0f}s.", exc_info=e)
+                    if source.is_stale():
+                        self.logger.warning(f"{source.name} data is stale: older than {source.max_staleness:.0f}s.")
+                    if self.on_error is not None:
+                        await self.on_error(source.name, e)
+                else:
+                    source.failures = 0
+                    source.last_error = None
+                    source.last_success = time.monotonic()
+                    source.next_run = source.last_success + source.jittered_period()
+                finally:
+                    source.last_duration = time.monotonic() - start_time
+        finally:
+            source.running = False
+            self._running_tasks.pop(source.name, None)
+            self._wakeup.set()
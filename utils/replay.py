@@ -0,0 +1,354 @@
+# coding=utf-8
+"""
+Records the responses of the upstream APIs to a fixture directory and serves them back, so refreshes can be benchmarked
+and profiled reproducibly, without a network.
+
+    python -m utils.replay record temp_data/fixtures
+    python -m utils.replay serve temp_data/fixtures --latency 0.05 --bandwidth 2000000 --error-rate 0.01
+    python -m utils.replay bench temp_data/fixtures --cycles 3
+
+Both servers route on the first path segment: /disease.sh/... is (or replays) https://disease.sh/..., and /owid/... is
+https://covid.ourworldindata.org/.... Point the base_url of the API classes (or the bot's disease_sh_url/owid_url
+settings) at ReplayServer.base_url("disease.sh") and ReplayServer.base_url("owid").
+
+Every response is saved as one gzip file named after a hash of its upstream, path and query string: a line of JSON with
+the URL, status and headers, followed by the body.
+"""
+import asyncio
+import collections
+import gzip
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+from typing import Dict, NamedTuple, Optional
+
+import aiohttp
+from aiohttp import web
+
+UPSTREAMS = {"disease.sh": "https://disease.sh",
+             "owid": "https://covid.ourworldindata.org"}
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+CHUNK_SIZE = 2 ** 16
+# Headers that describe the connection or the encoding of the upstream response rather than the data. Bodies are saved
+# decoded, so these would be wrong when served back.
+DROPPED_HEADERS = frozenset(("connection", "keep-alive", "transfer-encoding", "content-encoding", "content-length",
+                             "date", "server", "set-cookie", "alt-svc"))
+
+
+class Fixture(NamedTuple):
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+class FixtureStore:
+    def __init__(self, directory: str):
+        """
+        A directory of recorded responses.
+
+        :param directory: Where the fixtures are. Created when the first one is saved.
+        """
+        self.directory: str = directory
+        self._cache: Dict[str, Optional[Fixture]] = {}
+
+    @staticmethod
+    def key(upstream: str, path: str) -> str:
+        """
+        :param upstream: One of UPSTREAMS.
+        :param path: The path of the request, with its query string.
+        """
+        return hashlib.sha1(f"{upstream}{path}".encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.gz")
+
+    def writer(self, upstream: str, path: str, url: str, status: int, headers: Dict[str, str]) -> "FixtureWriter":
+        os.makedirs(self.directory, exist_ok=True)
+        key = self.key(upstream, path)
+        self._cache.pop(key, None)
+        return FixtureWriter(self.path(key), Fixture(url, status, headers, b""))
+
+    def load(self, upstream: str, path: str) -> Optional[Fixture]:
+        """
+        Returns the recorded response to a request, or None if it wasn't recorded. Fixtures are kept in memory once
+        loaded, so serving them again doesn't decompress them again.
+        """
+        key = self.key(upstream, path)
+        if key not in self._cache:
+            try:
+                with gzip.open(self.path(key), "rb") as f:
+                    metadata, body = f.read().split(b"\n", 1)
+            except FileNotFoundError:
+                self._cache[key] = None
+            else:
+                metadata = json.loads(metadata)
+                self._cache[key] = Fixture(metadata["url"], metadata["status"], metadata["headers"], body)
+        return self._cache[key]
+
+    def __len__(self) -> int:
+        if not os.path.isdir(self.directory):
+            return 0
+        return sum(1 for name in os.listdir(self.directory) if name.endswith(".gz"))
+
+
+class FixtureWriter:
+    def __init__(self, path: str, fixture: Fixture):
+        """
+        Writes one fixture, body chunk by body chunk. The file is written next to the old one and renamed over it once
+        closed, so a recording that fails halfway never leaves a truncated fixture behind.
+        """
+        self.path: str = path
+        fd, self._temp_path = tempfile.mkstemp(prefix=".", dir=os.path.dirname(path) or ".")
+        self._raw_file = os.fdopen(fd, "wb")
+        self._file = gzip.GzipFile(fileobj=self._raw_file, mode="wb")
+        metadata = {"url": fixture.url, "status": fixture.status, "headers": fixture.headers}
+        self._file.write(json.dumps(metadata).encode() + b"\n")
+        self.size: int = 0
+
+    def write(self, chunk: bytes):
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def close(self):
+        self._file.close()
+        self._raw_file.close()
+        os.replace(self._temp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        self._raw_file.close()
+        os.unlink(self._temp_path)
+
+    def __enter__(self) -> "FixtureWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class _FixtureServer:
+    def __init__(self, store: FixtureStore, *, logging_level=logging.INFO):
+        self.logger: logging.Logger = logging.Logger(self.__class__.__name__, level=logging_level)
+        self.logger.setLevel(logging_level)
+        self.store: FixtureStore = store
+        self.stats: collections.Counter = collections.Counter()
+        self.app = web.Application()
+        self.app.router.add_get("/{upstream}/{path:.*}", self._handle)
+        self.runner: Optional[web.AppRunner] = None
+        self.url: Optional[str] = None
+
+    async def start(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> str:
+        """
+        Starts listening.
+
+        :param port: Port to listen on. 0 to pick a free one.
+        :return: URL of the server.
+        """
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]  # the real port, when port is 0
+        self.url = f"http://{host}:{port}"
+        self.logger.info(f"{self.__class__.__name__} listening on {self.url}")
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    def base_url(self, upstream: str) -> str:
+        """
+        Returns the URL to give an API class instead of the upstream's.
+        """
+        return f"{self.url}/{upstream}"
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        upstream = request.match_info["upstream"]
+        if upstream not in UPSTREAMS:
+            raise web.HTTPNotFound(reason=f"Unknown upstream {upstream}")
+        self.stats["requests"] += 1
+        return await self.respond(request, upstream, request.raw_path[len(upstream) + 1:])
+
+    async def respond(self, request: web.Request, upstream: str, path: str) -> web.StreamResponse:
+        raise NotImplementedError()
+
+
+class RecordingProxy(_FixtureServer):
+    def __init__(self, store: FixtureStore, *, logging_level=logging.INFO):
+        """
+        Forwards every request to the real upstream, and saves the response to the fixture store on its way back.
+        Conditional headers aren't forwarded, so every fixture has a full body.
+        """
+        super().__init__(store, logging_level=logging_level)
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def stop(self):
+        await super().stop()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def respond(self, request: web.Request, upstream: str, path: str) -> web.StreamResponse:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None))
+        url = UPSTREAMS[upstream] + path
+        async with self.session.get(url) as upstream_response:
+            headers = {name: value for name, value in upstream_response.headers.items()
+                       if name.lower() not in DROPPED_HEADERS}
+            response = web.StreamResponse(status=upstream_response.status, headers=headers)
+            await response.prepare(request)
+            with self.store.writer(upstream, path, url, upstream_response.status, headers) as writer:
+                async for chunk in upstream_response.content.iter_chunked(CHUNK_SIZE):
+                    writer.write(chunk)
+                    await response.write(chunk)
+        await response.write_eof()
+        self.stats["recorded"] += 1
+        self.stats["bytes"] += writer.size
+        self.logger.info(f"Recorded {url} ({upstream_response.status}, {writer.size / 2 ** 10:.0f}KiB)")
+        return response
+
+
+class ReplayServer(_FixtureServer):
+    def __init__(self, store: FixtureStore, *, latency: float = 0.0, bandwidth: Optional[float] = None,
+                 error_rate: float = 0.0, error_status: int = 503, seed: Optional[int] = None,
+                 logging_level=logging.INFO):
+        """
+        Serves recorded responses back. Requests that weren't recorded get a 404.
+
+        :param latency: Delay before every response starts, in seconds.
+        :param bandwidth: Optional: how fast bodies are sent, in bytes per second. Unlimited if None.
+        :param error_rate: Fraction of the requests (0 to 1) answered with error_status instead of their fixture.
+        :param error_status: Status of the injected errors.
+        :param seed: Optional: seed for the error injection, to fail the same requests on every run.
+        """
+        super().__init__(store, logging_level=logging_level)
+        self.latency: float = latency
+        self.bandwidth: Optional[float] = bandwidth
+        self.error_rate: float = error_rate
+        self.error_status: int = error_status
+        self.random: random.Random = random.Random(seed)
+
+    async def respond(self, request: web.Request, upstream: str, path: str) -> web.StreamResponse:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats["injected_errors"] += 1
+            return web.Response(status=self.error_status, text="Injected error")
+        fixture = self.store.load(upstream, path)
+        if fixture is None:
+            self.stats["missing"] += 1
+            self.logger.warning(f"No fixture for /{upstream}{path}")
+            return web.Response(status=404, text="Not recorded")
+        etag = fixture.headers.get("ETag")
+        if etag is not None and request.headers.get("If-None-Match") == etag:
+            self.stats["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": etag})
+        self.stats["served"] += 1
+        self.stats["bytes"] += len(fixture.body)
+        if self.bandwidth is None:
+            return web.Response(status=fixture.status, headers=fixture.headers, body=fixture.body)
+        response = web.StreamResponse(status=fixture.status, headers=fixture.headers)
+        response.content_length = len(fixture.body)
+        await response.prepare(request)
+        for start in range(0, len(fixture.body), CHUNK_SIZE):
+            chunk = fixture.body[start:start + CHUNK_SIZE]
+            await response.write(chunk)
+            await asyncio.sleep(len(chunk) / self.bandwidth)
+        await response.write_eof()
+        return response
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    from utils import api
+    from utils.country_registry import CountryRegistry
+    from utils.http_client import PooledHTTPClient
+
+    parser = argparse.ArgumentParser(prog="python -m utils.replay")
+    parser.add_argument("mode", choices=("record", "serve", "bench"),
+                        help="record: run refresh cycles against the live APIs through a recording proxy. serve: "
+                             "serve the fixtures until interrupted. bench: run refresh cycles against the fixtures.")
+    parser.add_argument("directory", help="Fixture directory.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=None, help="Defaults to a free port, or 8765 when serving.")
+    parser.add_argument("--cycles", type=int, default=2,
+                        help="Refresh cycles to run. The first JHU refresh is a full one and the later ones are "
+                             "incremental, so record at least 2 cycles to benchmark both.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds before every replayed response.")
+    parser.add_argument("--bandwidth", type=float, default=None, help="Replay speed, in bytes per second.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of replayed requests that fail.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the error injection.")
+    args = parser.parse_args()
+
+    async def run_cycles(server: _FixtureServer, cycles: int):
+        """
+        Runs full refresh cycles of every API class against a server, in the order the bot refreshes them in. Profile
+        them with python -m cProfile -o replay.prof -m utils.replay bench ...
+        """
+        pool = PooledHTTPClient()
+        registry = CountryRegistry()
+        disease_sh_url, owid_url = server.base_url("disease.sh"), server.base_url("owid")
+        apis = {"worldometers": api.Covid19StatsWorldometers(http_pool=pool, country_registry=registry,
+                                                             base_url=disease_sh_url),
+                "vaccine": api.VaccineStats(http_pool=pool, base_url=disease_sh_url),
+                "jhucsse": api.Covid19JHUCSSEStats(http_pool=pool, country_registry=registry, base_url=disease_sh_url),
+                "owid": api.OWIDData(http_pool=pool, country_registry=registry, base_url=owid_url)}
+        updates = {"worldometers": apis["worldometers"].update_covid_19_virus_stats,
+                   "vaccine": apis["vaccine"].update_covid_19_vaccine_stats,
+                   "jhucsse": apis["jhucsse"].update_covid_19_virus_stats,
+                   "owid": apis["owid"].update_covid_19_owid_data}
+        for stats_api in apis.values():
+            stats_api.retries_are_managed = True  # failures are reported here instead of retried
+        for cycle in range(1, cycles + 1):
+            timings = []
+            for name, update in updates.items():
+                start = time.perf_counter()
+                try:
+                    await update()
+                except api.NetworkException as e:
+                    timings.append(f"{name} failed ({e.status or type(e.exc).__name__})")
+                else:
+                    timings.append(f"{name} {time.perf_counter() - start:.2f}s")
+            print(f"Cycle {cycle}: {', '.join(timings)}")
+        print(f"JHU CSSE phases (last cycle): "
+              f"{', '.join(f'{phase} {t:.2f}s' for phase, t in apis['jhucsse'].phase_timings.items())}")
+        print(f"Server: {dict(server.stats)}")
+        print(f"HTTP pool: {pool.stats()}, conditional GETs: {pool.validators.stats()}")
+        await pool.close()
+
+    async def main():
+        store = FixtureStore(args.directory)
+        if args.mode == "record":
+            server = RecordingProxy(store)
+        else:
+            server = ReplayServer(store, latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate,
+                                  seed=args.seed)
+        port = args.port if args.port is not None else (DEFAULT_PORT if args.mode == "serve" else 0)
+        await server.start(args.host, port)
+        try:
+            if args.mode == "serve":
+                print(f"Serving {len(store)} fixtures: set disease_sh_url = \"{server.base_url('disease.sh')}\" and "
+                      f"owid_url = \"{server.base_url('owid')}\" in the bot's config.")
+                await asyncio.Event().wait()
+            else:
+                await run_cycles(server, args.cycles)
+        finally:
+            await server.stop()
+
+    logging.basicConfig(level=logging.WARNING)
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
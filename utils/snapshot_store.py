@@ -0,0 +1,251 @@
+# coding=utf-8
+"""
+Persists stats snapshots to disk, so the bot can serve data from its last run straight away when it boots instead of
+waiting for every source to be downloaded again.
+
+File format (all integers little-endian):
+
+    8 bytes   magic, b"CVSNAP01"
+    8 bytes   length of the header
+    header    UTF-8 JSON: the snapshot with every array replaced by a reference, plus the list of arrays (dtype, shape
+              and offset from the start of the file)
+    arrays    raw array data, every array starting on a ARRAY_ALIGNMENT byte boundary
+
+Loading only parses the header: arrays are memory-mapped, so they cost nothing until they are actually read.
+"""
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import time
+from types import MappingProxyType
+from typing import Any, Dict, List, Optional, Type
+
+import numpy
+
+from utils.timeseries import DateIndex, TimeSeries
+
+MAGIC = b"CVSNAP01"
+ARRAY_ALIGNMENT = 64
+_HEADER_LENGTH = struct.Struct("<Q")
+
+_TYPES: Dict[str, Type] = {}
+
+
+class SnapshotFormatError(Exception):
+    pass
+
+
+def register_type(cls: Type) -> Type:
+    """
+    Lets instances of a class be stored in snapshots. NamedTuples are rebuilt from their fields, anything else has its
+    __dict__ restored without calling __init__. Can be used as a class decorator.
+    """
+    _TYPES[cls.__name__] = cls
+    return cls
+
+
+def _pad(length: int) -> int:
+    return -length % ARRAY_ALIGNMENT
+
+
+class _Encoder:
+    def __init__(self):
+        self.arrays: List[numpy.ndarray] = []
+        self._array_ids: Dict[int, int] = {}
+        self.indexes: List[List[str]] = []
+        self._index_ids: Dict[int, int] = {}
+
+    def array(self, array: numpy.ndarray) -> dict:
+        key = id(array)
+        if key not in self._array_ids:
+            self._array_ids[key] = len(self.arrays)
+            self.arrays.append(numpy.ascontiguousarray(array))
+        return {"$t": "array", "i": self._array_ids[key]}
+
+    def index(self, index: DateIndex) -> int:
+        key = id(index)
+        if key not in self._index_ids:
+            self._index_ids[key] = len(self.indexes)
+            self.indexes.append(list(index.keys))
+        return self._index_ids[key]
+
+    def encode(self, value: Any) -> Any:
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        elif isinstance(value, numpy.ndarray):
+            return self.array(value)
+        elif isinstance(value, numpy.generic):
+            return value.item()
+        elif isinstance(value, TimeSeries):
+            return {"$t": "series", "index": self.index(value.index), "start": value.start, "stop": value.stop,
+                    "columns": {field: self.array(column) for field, column in value.columns.items()}}
+        elif isinstance(value, datetime.datetime):
+            return {"$t": "datetime", "v": value.isoformat()}
+        elif isinstance(value, MappingProxyType):
+            return {"$t": "proxy", "v": self.encode(dict(value))}
+        elif isinstance(value, tuple) and type(value).__name__ in _TYPES:
+            return {"$t": "object", "cls": type(value).__name__, "v": self.encode(value._asdict())}
+        elif isinstance(value, tuple):
+            return {"$t": "tuple", "v": [self.encode(item) for item in value]}
+        elif isinstance(value, list):
+            return [self.encode(item) for item in value]
+        elif isinstance(value, dict):
+            return {str(key): self.encode(item) for key, item in value.items()}
+        elif type(value).__name__ in _TYPES:
+            return {"$t": "object", "cls": type(value).__name__, "v": self.encode(vars(value))}
+        raise TypeError(f"Can't store objects of type {type(value).__name__} in a snapshot")
+
+
+class _Decoder:
+    def __init__(self, buffer, arrays: List[dict], indexes: List[List[str]]):
+        self._buffer = buffer
+        self._array_info = arrays
+        self._arrays: Dict[int, numpy.ndarray] = {}
+        self._indexes = [DateIndex.from_keys(keys) for keys in indexes]
+
+    def array(self, i: int) -> numpy.ndarray:
+        if i not in self._arrays:
+            info = self._array_info[i]
+            count = 1
+            for dimension in info["shape"]:
+                count *= dimension
+            if not count:
+                array = numpy.zeros(0, dtype=numpy.dtype(info["dtype"]))
+            else:
+                array = numpy.frombuffer(self._buffer, dtype=numpy.dtype(info["dtype"]), count=count,
+                                         offset=info["offset"])
+            self._arrays[i] = array.reshape(info["shape"])
+        return self._arrays[i]
+
+    def decode(self, value: Any) -> Any:
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        elif not isinstance(value, dict):
+            return value
+        tag = value.get("$t")
+        if tag is None:
+            return {key: self.decode(item) for key, item in value.items()}
+        elif tag == "array":
+            return self.array(value["i"])
+        elif tag == "series":
+            columns = {field: self.array(column["i"]) for field, column in value["columns"].items()}
+            return TimeSeries(self._indexes[value["index"]], columns, value["start"], value["stop"])
+        elif tag == "datetime":
+            return datetime.datetime.fromisoformat(value["v"])
+        elif tag == "proxy":
+            return MappingProxyType(self.decode(value["v"]))
+        elif tag == "tuple":
+            return tuple(self.decode(item) for item in value["v"])
+        elif tag == "object":
+            cls = _TYPES.get(value["cls"])
+            if cls is None:
+                raise SnapshotFormatError(f"Unknown type {value['cls']} in snapshot")
+            fields = self.decode(value["v"])
+            if issubclass(cls, tuple):
+                return cls(**fields)
+            instance = cls.__new__(cls)
+            instance.__dict__.update(fields)
+            return instance
+        raise SnapshotFormatError(f"Unknown tag {tag!r} in snapshot")
+
+
+def dump(snapshot: Any, f) -> int:
+    """
+    Writes a snapshot to a binary file object.
+
+    :return: Number of bytes written.
+    """
+    encoder = _Encoder()
+    body = encoder.encode(snapshot)
+    arrays = []
+    offset = 0
+    for array in encoder.arrays:
+        arrays.append({"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+        offset += array.nbytes + _pad(array.nbytes)
+    header = {"created": time.time(), "indexes": encoder.indexes, "arrays": arrays, "snapshot": body}
+    header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    data_start = len(MAGIC) + _HEADER_LENGTH.size + len(header)
+    header += b" " * _pad(data_start)  # whitespace at the end of the JSON header is harmless
+    data_start += _pad(data_start)
+    f.write(MAGIC)
+    f.write(_HEADER_LENGTH.pack(len(header)))
+    f.write(header)
+    for array in encoder.arrays:
+        f.write(array.tobytes())
+        f.write(b"\0" * _pad(array.nbytes))
+    return data_start + offset
+
+
+def load(path: str) -> Any:
+    """
+    Reads a snapshot written by dump. Arrays are memory-mapped (read-only) instead of being read.
+
+    :raises SnapshotFormatError: if the file isn't a valid snapshot.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SnapshotFormatError(f"{path} isn't a snapshot file")
+        header_length, = _HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))
+        header = json.loads(f.read(header_length))
+        data_start = len(MAGIC) + _HEADER_LENGTH.size + header_length
+        size = os.fstat(f.fileno()).st_size
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > data_start else b""
+    for array in header["arrays"]:
+        array["offset"] += data_start
+    return _Decoder(buffer, header["arrays"], header["indexes"]).decode(header["snapshot"])
+
+
+class SnapshotStore:
+    def __init__(self, directory: str, *, logging_level=logging.INFO):
+        """
+        A directory of snapshot files, one per source.
+
+        :param directory: Where to keep the files. Created if it doesn't exist.
+        """
+        self.logger: logging.Logger = logging.Logger("Snapshot Store", level=logging_level)
+        self.logger.setLevel(logging_level)
+        self.directory: str = directory
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.snap")
+
+    def save(self, name: str, snapshot: Any):
+        """
+        Writes a snapshot. The file is written next to the old one and then renamed over it, so a crash halfway through
+        never leaves a broken file behind.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        start_time = time.perf_counter()
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                size = dump(snapshot, f)
+            os.replace(temp_path, self.path(name))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.timings.setdefault(name, {})["save"] = time.perf_counter() - start_time
+        self.logger.info(f"Saved {name} snapshot ({size / 2 ** 20:.1f}MiB) in {self.timings[name]['save']:.3f}s.")
+
+    def load(self, name: str) -> Optional[Any]:
+        """
+        Loads a snapshot.
+
+        :return: The snapshot, or None if there isn't one or it can't be read.
+        """
+        start_time = time.perf_counter()
+        try:
+            snapshot = load(self.path(name))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, SnapshotFormatError) as e:
+            self.logger.warning(f"Ignoring unreadable {name} snapshot: {e!r}")
+            return None
+        self.timings.setdefault(name, {})["load"] = time.perf_counter() - start_time
+        self.logger.info(f"Loaded {name} snapshot in {self.timings[name]['load']:.3f}s.")
+        return snapshot
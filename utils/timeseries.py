@@ -0,0 +1,316 @@
+# coding=utf-8
+"""
+Column-oriented storage for the JHU CSSE historical data.
+
+disease.sh returns timelines as {"cases": {"3/14/20": n, ...}, "deaths": {...}, "recovered": {...}}. Rather than keep
+(and re-parse the date strings of) one dictionary per location and metric, every location gets a TimeSeries: a date
+index shared by every location reporting the same days, plus one contiguous int64 array per metric.
+"""
+import bisect
+import datetime
+import functools
+import weakref
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy
+
+FIELDS = ("cases", "deaths", "recovered")
+
+# Only holds the indexes some series still uses: once the last one is gone (like after an update replaced them with
+# series covering one more day), so is the index.
+_INDEXES: "weakref.WeakValueDictionary[Tuple[str, ...], DateIndex]" = weakref.WeakValueDictionary()
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date(key: str) -> datetime.date:
+    """
+    Parses a JHU "m/d/yy" date string. Much faster than time.strptime, and cached on top of that.
+    """
+    month, day, year = key.split("/")
+    return datetime.date(2000 + int(year), int(month), int(day))
+
+
+def format_date(date: datetime.date) -> str:
+    """
+    Formats a date the way JHU does ("m/d/yy").
+    """
+    return f"{date.month}/{date.day}/{str(date.year)[2:4]}"
+
+
+class DateIndex:
+    def __init__(self, keys: Tuple[str, ...]):
+        """
+        The dates of a timeline, oldest first, with O(1) lookup from a date to its position.
+
+        Don't create these directly: use DateIndex.from_keys, which hands out the same instance for every timeline
+        covering the same days.
+
+        :param keys: The date strings, as used by JHU ("m/d/yy").
+        """
+        self.keys: Tuple[str, ...] = keys
+        self.dates: Tuple[datetime.date, ...] = tuple(parse_date(key) for key in keys)
+        self.positions: Dict[datetime.date, int] = {date: i for i, date in enumerate(self.dates)}
+
+    @classmethod
+    def from_keys(cls, keys: Iterable[str]) -> "DateIndex":
+        keys = tuple(keys)
+        index = _INDEXES.get(keys)
+        if index is None:
+            index = _INDEXES[keys] = cls(keys)
+        return index
+
+    def __reduce__(self):
+        # unpickling (for example in or from a utils.ingest_worker process) goes through from_keys too, so indexes
+        # stay shared by every series covering the same days
+        return DateIndex.from_keys, (self.keys,)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __contains__(self, date: datetime.date) -> bool:
+        return date in self.positions
+
+    def position(self, date: datetime.date) -> Optional[int]:
+        return self.positions.get(date)
+
+    def bounds(self, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> Tuple[int, int]:
+        """
+        Returns the [start, stop) positions of the dates between start and end, both included.
+        """
+        lo = 0 if start is None else bisect.bisect_left(self.dates, start)
+        hi = len(self.dates) if end is None else bisect.bisect_right(self.dates, end)
+        return lo, max(lo, hi)
+
+
+class TimeSeries:
+    def __init__(self, index: DateIndex, columns: Dict[str, numpy.ndarray], start: int = 0,
+                 stop: Optional[int] = None):
+        """
+        Historical data for one location: one int64 array per metric, all indexed by the same DateIndex.
+
+        Slicing doesn't copy anything: a slice is a view of the same arrays with different start/stop positions.
+
+        :param index: The (shared) date index.
+        :param columns: Dictionary of metric name -> int64 array with one value per date in the index.
+        :param start: First position of the index this series covers.
+        :param stop: Position after the last one this series covers. Defaults to the end of the index.
+        """
+        self.index: DateIndex = index
+        self.start: int = start
+        self.stop: int = len(index) if stop is None else stop
+        self.columns: Dict[str, numpy.ndarray] = columns
+
+    @classmethod
+    def from_timeline(cls, timeline: dict) -> "TimeSeries":
+        """
+        Builds a TimeSeries out of a disease.sh timeline. Null values (when requesting with allowNull) are stored as 0,
+        which is how the embeds already showed missing data.
+
+        :param timeline: Dictionary of metric name -> {"m/d/yy": value}.
+        """
+        fields = [field for field in FIELDS if field in timeline]
+        if not fields:
+            return cls(DateIndex.from_keys(()), {})
+        index = DateIndex.from_keys(timeline[fields[0]])
+        columns = {}
+        for field in fields:
+            values = timeline[field]
+            if tuple(values) == index.keys:
+                column = numpy.fromiter((value or 0 for value in values.values()), dtype=numpy.int64,
+                                        count=len(values))
+            else:  # metrics covering different days than the first one, align them on its index
+                column = numpy.zeros(len(index), dtype=numpy.int64)
+                for key, value in values.items():
+                    position = index.position(parse_date(key))
+                    if position is not None:
+                        column[position] = value or 0
+            columns[field] = column
+        return cls(index, columns)
+
+    @classmethod
+    def sum(cls, series: List["TimeSeries"]) -> "TimeSeries":
+        """
+        Adds up several series (for example all the counties of a state), metric by metric. Series that don't share
+        the index of the first one are aligned on it first.
+        """
+        if not series:
+            return cls(DateIndex.from_keys(()), {})
+        index = series[0].index
+        aligned, others = [], []
+        for item in series:
+            covers_index = item.index is index and item.start == 0 and item.stop == len(index)
+            (aligned if covers_index else others).append(item)
+        columns = {}
+        for field in series[0].columns:
+            arrays = [item.columns[field] for item in aligned if field in item.columns]
+            # one vectorized reduction over every aligned series instead of one addition per series
+            columns[field] = numpy.stack(arrays).sum(axis=0) if arrays else numpy.zeros(len(index), dtype=numpy.int64)
+        for item in others:
+            start = index.position(item.dates[0]) if len(item) else None
+            if start is not None and index.keys[start:start + len(item)] == item.keys:  # a contiguous run of days
+                for field, total in columns.items():
+                    if field in item.columns:
+                        total[start:start + len(item)] += item[field]
+                continue
+            positions = numpy.array([-1 if position is None else position
+                                     for position in map(index.position, item.dates)], dtype=numpy.int64)
+            known = positions >= 0
+            for field, total in columns.items():
+                if field in item.columns:
+                    numpy.add.at(total, positions[known], item[field][known])
+        return cls(index, columns)
+
+    def merge_tail(self, tail: "TimeSeries") -> Optional[Tuple["TimeSeries", int]]:
+        """
+        Merges the latest few days of a timeline (fetched with lastdays=N) into this one. Days covered by the tail
+        take the tail's values, and days after the end of this series are appended. Nothing is modified: the result
+        is a new series.
+
+        :param tail: The latest days. Must start at the latest on the day after the end of this series, and have the
+                     same metrics.
+        :return: (merged series, number of days both series cover that have different values), or None if the tail
+                 can't be merged (there's a gap between the two, or the metrics don't match).
+        """
+        if not len(tail):
+            return self, 0
+        if not len(self) or set(tail.columns) != set(self.columns):
+            return None
+        first_date = tail.dates[0]
+        if first_date > self.dates[-1] + datetime.timedelta(days=1):
+            return None
+        lo, _ = self.index.bounds(first_date)
+        keep = max(lo, self.start) - self.start
+        overlap = self.slice(first_date)
+        mismatches = 0
+        if len(overlap):
+            positions = [tail.position(date) for date in overlap.dates]
+            if None in positions:  # the tail skips days this series has
+                return None
+            differences = numpy.zeros(len(positions), dtype=bool)
+            for field in self.columns:
+                differences |= overlap[field] != tail[field][positions]
+            mismatches = int(differences.sum())
+        index = DateIndex.from_keys(self.keys[:keep] + tail.keys)
+        columns = {field: numpy.concatenate((self[field][:keep], tail[field])) for field in self.columns}
+        return TimeSeries(index, columns), mismatches
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __contains__(self, date: datetime.date) -> bool:
+        return self.position(date) is not None
+
+    def __getitem__(self, field: str) -> numpy.ndarray:
+        """
+        Returns the values of a metric for every date in the series (a read-only view, not a copy).
+        """
+        view = self.columns[field][self.start:self.stop]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def fields(self) -> Tuple[str, ...]:
+        return tuple(self.columns)
+
+    @property
+    def dates(self) -> Tuple[datetime.date, ...]:
+        return self.index.dates[self.start:self.stop]
+
+    @property
+    def keys(self) -> Tuple[str, ...]:
+        return self.index.keys[self.start:self.stop]
+
+    def position(self, date: datetime.date) -> Optional[int]:
+        """
+        Returns the position of a date in this series, or None if the series doesn't cover it. O(1).
+        """
+        position = self.index.position(date)
+        if position is None or not self.start <= position < self.stop:
+            return None
+        return position - self.start
+
+    def at(self, date: datetime.date) -> Optional[Dict[str, int]]:
+        """
+        Returns every metric for a single day, or None if the series doesn't cover it.
+        """
+        position = self.index.position(date)
+        if position is None or not self.start <= position < self.stop:
+            return None
+        return {field: int(column[position]) for field, column in self.columns.items()}
+
+    def latest(self) -> Optional[Dict[str, int]]:
+        if not len(self):
+            return None
+        return {field: int(column[self.stop - 1]) for field, column in self.columns.items()}
+
+    def slice(self, start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> "TimeSeries":
+        """
+        Returns the part of the series between start and end (both included). Doesn't copy any data.
+        """
+        lo, hi = self.index.bounds(start, end)
+        lo, hi = max(lo, self.start), min(hi, self.stop)
+        return TimeSeries(self.index, self.columns, lo, max(lo, hi))
+
+    def select(self, dates: Iterable[datetime.date]) -> Dict[str, Dict[datetime.date, int]]:
+        """
+        Returns the values of every metric for the given dates, as {metric: {date: value}}. Dates the series doesn't
+        cover are left out.
+        """
+        positions = [(date, self.index.position(date)) for date in dates]
+        positions = [(date, i) for date, i in positions if i is not None and self.start <= i < self.stop]
+        return {field: {date: int(column[i]) for date, i in positions} for field, column in self.columns.items()}
+
+    def daily_deltas(self, field: str) -> numpy.ndarray:
+        """
+        Returns the change of a metric from one day to the next. The first day has no previous day, so its change is 0.
+        """
+        values = self[field]
+        if not len(values):
+            return numpy.zeros(0, dtype=numpy.int64)
+        return numpy.diff(values, prepend=values[0])
+
+    def rolling_average(self, field: str, window: int = 7, *, deltas: bool = True) -> numpy.ndarray:
+        """
+        Returns the average of a metric over a sliding window, aligned on the last day of the window. The first
+        window - 1 days don't have a full window before them and are NaN.
+
+        :param field: The metric.
+        :param window: Size of the window, in days.
+        :param deltas: If true (the default), average the daily changes instead of the running totals.
+        """
+        values = (self.daily_deltas(field) if deltas else self[field]).astype(numpy.float64)
+        out = numpy.full(len(values), numpy.nan)
+        if window <= 0 or len(values) < window:
+            return out
+        sums = numpy.cumsum(values)
+        sums[window:] = sums[window:] - sums[:-window]
+        out[window - 1:] = sums[window - 1:] / window
+        return out
+
+    def to_timeline(self) -> Dict[str, Dict[str, int]]:
+        """
+        Converts the series back into a disease.sh formatted timeline.
+        """
+        return {field: dict(zip(self.keys, self[field].tolist())) for field in self.columns}
+
+
+if __name__ == '__main__':
+    import gc
+
+    # python -m utils.timeseries: three months of daily incremental refreshes of 100 locations, each merging the latest
+    # 3 days into the series of the day before (like parse_jhu_update between full reloads). Every refresh makes a
+    # one-day-longer index; the ones before it must go away with the series that used them.
+    def timeline(days: range, scale: int) -> dict:
+        keys = [format_date(datetime.date(2020, 1, 22) + datetime.timedelta(days=day)) for day in days]
+        return {field: {key: day * scale for key, day in zip(keys, days)} for field in FIELDS}
+
+    locations = [TimeSeries.from_timeline(timeline(range(0, 600), scale)) for scale in range(100)]
+    live = []
+    for day in range(600, 690):
+        locations = [location.merge_tail(TimeSeries.from_timeline(timeline(range(day - 2, day + 1), scale)))[0]
+                     for scale, location in enumerate(locations)]
+        gc.collect()
+        live.append(len(_INDEXES))
+    assert all(len(location) == 690 for location in locations)
+    print(f"Live date indexes after each of {len(live)} refreshes: at most {max(live)}, {live[-1]} at the end")
+    assert max(live) <= 2
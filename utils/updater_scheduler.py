@@ -0,0 +1,212 @@
+# coding=utf-8
+"""
+Runs the autoupdaters when they're due, instead of loading and checking every one of them every minute.
+
+Every updater is kept in a min-heap keyed on the time it's next due. The loop sleeps until the earliest one, pops every
+updater that's due and runs it, so the work done per wakeup only depends on how many updaters are due. Rescheduling or
+cancelling an updater doesn't touch the heap: its old entry is just skipped (and dropped) once it comes up.
+"""
+import asyncio
+import datetime
+import heapq
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+# Updaters that failed are tried again after this many seconds.
+RETRY_DELAY = 60
+MAX_CONCURRENT_UPDATES = 100
+# The heap is rebuilt once it holds this many times more entries than there are scheduled updaters.
+COMPACT_RATIO = 2
+
+
+class UpdaterScheduler:
+    def __init__(self, run: Callable[[Any], Awaitable[Optional[datetime.datetime]]], *,
+                 max_concurrent: int = MAX_CONCURRENT_UPDATES, retry_delay: float = RETRY_DELAY,
+                 logging_level=logging.INFO):
+        """
+        Runs scheduled items when they're due. Times are naive UTC datetimes, like the ones the database returns.
+
+        :param run: Coroutine function called with a due item. Returns when the item is next due, or None to stop
+                    scheduling it. If it raises an exception, the item is tried again after retry_delay seconds.
+        :param max_concurrent: How many items may run at the same time.
+        :param retry_delay: Seconds before trying a failed item again.
+        """
+        self.logger: logging.Logger = logging.Logger("Updater Scheduler", level=logging_level)
+        self.logger.setLevel(logging_level)
+        self.run: Callable[[Any], Awaitable[Optional[datetime.datetime]]] = run
+        self.retry_delay: float = retry_delay
+        self.items: Dict[Hashable, Any] = {}
+        self.due: Dict[Hashable, Tuple[datetime.datetime, int]] = {}
+        self.running: Set[Hashable] = set()
+        self.runs: int = 0
+        self.failures: int = 0
+        self.last_late_by: Optional[float] = None
+        self._heap: List[Tuple[datetime.datetime, int, Hashable]] = []
+        self._counter = itertools.count()
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(max_concurrent)
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._running_tasks: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.items
+
+    def schedule(self, key: Hashable, due: datetime.datetime, item: Any):
+        """
+        Adds an item, or replaces it (and when it's due) if it's already scheduled. If it's running, it's scheduled
+        once it's done (for whichever is first: this time or the one run returns). O(log n).
+
+        :param key: Unique key of the item, like the ID of an updater.
+        :param due: When to run it. Times in the past run right away.
+        :param item: What to pass to run.
+        """
+        entry = (due, next(self._counter))
+        self.items[key] = item
+        self.due[key] = entry
+        if key in self.running:
+            return
+        heapq.heappush(self._heap, entry + (key,))
+        if len(self._heap) > COMPACT_RATIO * len(self.due) + 64:
+            self._compact()
+        if self._heap[0][2] == key:  # earlier than whatever the loop is waiting for
+            self._wakeup.set()
+
+    def cancel(self, key: Hashable) -> Optional[Any]:
+        """
+        Stops scheduling an item. If it's running, it won't be scheduled again once it's done. O(1).
+
+        :return: The item, or None if it wasn't scheduled.
+        """
+        self.due.pop(key, None)
+        self.running.discard(key)
+        return self.items.pop(key, None)
+
+    def next_due(self) -> Optional[datetime.datetime]:
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: datetime.datetime) -> List[Tuple[Hashable, datetime.datetime]]:
+        """
+        Takes every item due at now out of the heap, earliest first. They stay in items (as running) until done.
+
+        :return: List of (key, time it was due).
+        """
+        due = []
+        while self.next_due() is not None and self._heap[0][0] <= now:
+            due_at, _, key = heapq.heappop(self._heap)
+            if key in self.running:  # left in the heap by _compact, _run_item schedules it once done
+                continue
+            del self.due[key]
+            self.running.add(key)
+            due.append((key, due_at))
+        return due
+
+    def _drop_stale(self):
+        while self._heap and self.due.get(self._heap[0][2]) != self._heap[0][:2]:
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        self._heap = [entry + (key,) for key, entry in self.due.items()]
+        heapq.heapify(self._heap)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        if self._task is None or self._task.done():
+            self._task = (loop or asyncio.get_event_loop()).create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in self._running_tasks:
+            task.cancel()
+        self._running_tasks.clear()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = datetime.datetime.utcnow()
+            for key, due_at in self.pop_due(now):
+                self.last_late_by = (now - due_at).total_seconds()
+                task = asyncio.ensure_future(self._run_item(key))
+                self._running_tasks.add(task)
+                task.add_done_callback(self._running_tasks.discard)
+            next_due = self.next_due()
+            timeout = max(0.0, (next_due - datetime.datetime.utcnow()).total_seconds()) if next_due else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run_item(self, key: Hashable):
+        item = self.items[key]
+        next_due = None
+        try:
+            async with self._semaphore:
+                self.runs += 1
+                next_due = await self.run(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures += 1
+            self.logger.exception(f"Running {key} failed, retrying in {self.retry_delay}s.", exc_info=e)
+            next_due = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.retry_delay)
+        finally:
+            if key in self.running:  # not cancelled meanwhile
+                self.running.discard(key)
+                if key in self.due:  # rescheduled while running: keep whichever is first
+                    next_due = min(next_due or self.due[key][0], self.due[key][0])
+                if next_due is None:
+                    self.items.pop(key, None)
+                    self.due.pop(key, None)
+                else:
+                    self.schedule(key, next_due, self.items[key])
+
+    def stats(self) -> dict:
+        next_due = self.next_due()
+        return {"scheduled": len(self.items),
+                "running": len(self.running),
+                "heap_size": len(self._heap),
+                "next_due_in": (next_due - datetime.datetime.utcnow()).total_seconds() if next_due else None,
+                "last_late_by": self.last_late_by,
+                "runs": self.runs,
+                "failures": self.failures}
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    # python -m utils.updater_scheduler: 100,000 updaters with delays between 10 minutes and a day, in the steady state
+    # (next updates spread over the coming day), and the work needed to find the due ones every minute by scanning all
+    # of them (like the minutely task used to) or by popping them off the heap
+    rng = random.Random(0)
+    start_time = datetime.datetime.utcnow()
+    updaters = {}
+    for i in range(100_000):
+        delay = rng.randrange(600, 86400)
+        updaters[i] = (start_time - datetime.timedelta(seconds=rng.randrange(delay)), delay)
+
+    async def run(item):
+        return None
+
+    scheduler = UpdaterScheduler(run)
+    start = time.perf_counter()
+    for key, (last_updated, delay) in updaters.items():
+        scheduler.schedule(key, last_updated + datetime.timedelta(seconds=delay), (last_updated, delay))
+    print(f"Scheduling {len(updaters):,} updaters: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+    now = start_time + datetime.timedelta(minutes=1)
+    start = time.perf_counter()
+    due = [key for key, (last_updated, delay) in updaters.items() if (now - last_updated).total_seconds() >= delay]
+    print(f"Scanning every updater: {(time.perf_counter() - start) * 1000:.1f}ms for the {len(due):,} due")
+
+    start = time.perf_counter()
+    popped = 0
+    for second in range(60):
+        popped += len(scheduler.pop_due(start_time + datetime.timedelta(seconds=second + 1)))
+    print(f"Popping the due updaters every second for a minute: {(time.perf_counter() - start) * 1000:.2f}ms for the "
+          f"{popped:,} due")
@@ -0,0 +1,221 @@
+# coding=utf-8
+"""
+The vaccine candidates, indexed once per refresh: stable IDs, prebuilt pages, and lookups by phase, sponsor, mechanism
+and by the words in candidate and sponsor names.
+"""
+import bisect
+import collections
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy
+
+from utils.name_index import normalize_name
+from utils.snapshot_store import register_type
+
+PAGE_SIZE = 24
+
+
+def candidate_key(data: dict) -> str:
+    """
+    What identifies a candidate from one refresh to the next: its name and sponsors (normalized, in any order). Its
+    details, phase and institutions are updated as the trials go on.
+    """
+    sponsors = sorted(normalize_name(sponsor) for sponsor in data.get("sponsors") or ())
+    return "|".join([normalize_name(data.get("candidate") or "")] + sponsors)
+
+
+@register_type
+class VaccineCandidate(NamedTuple):
+    id: int
+    candidate: str
+    mechanism: str
+    sponsors: Tuple[str, ...]
+    details: str
+    trial_phase: str
+    institutions: Tuple[str, ...]
+
+    @classmethod
+    def from_json(cls, candidate_id: int, data: dict) -> "VaccineCandidate":
+        """
+        :param candidate_id: The ID of the candidate.
+        :param data: The candidate, as returned by disease.sh's /vaccine endpoint.
+        """
+        return cls(candidate_id, data.get("candidate") or "", data.get("mechanism") or "",
+                   tuple(data.get("sponsors") or ()), data.get("details") or "", data.get("trialPhase") or "",
+                   tuple(data.get("institutions") or ()))
+
+
+def _index(candidates: Iterable[Tuple[int, Iterable[str]]]) -> Dict[str, Tuple[int, ...]]:
+    """
+    Makes a dictionary of normalized key -> positions of the candidates with that key, out of (position, keys) pairs.
+    """
+    index = collections.defaultdict(list)
+    for position, keys in candidates:
+        for key in dict.fromkeys(filter(None, map(normalize_name, keys))):
+            index[key].append(position)
+    return {key: tuple(positions) for key, positions in index.items()}
+
+
+@register_type
+class VaccineCatalog:
+    def __init__(self, candidates: Tuple[VaccineCandidate, ...], ids: Dict[str, int], id_positions: numpy.ndarray,
+                 pages: Tuple[Tuple[VaccineCandidate, ...], ...], phases: Dict[str, Tuple[int, ...]],
+                 sponsors: Dict[str, Tuple[int, ...]], mechanisms: Dict[str, Tuple[int, ...]],
+                 tokens: Dict[str, Tuple[int, ...]], sorted_tokens: Tuple[str, ...]):
+        """
+        Every vaccine candidate, sorted by ID. Build one with VaccineCatalog.build.
+
+        :param candidates: The candidates.
+        :param ids: Dictionary of candidate_key -> ID, for every candidate ever seen (so one that disappears for a
+                    while gets its ID back).
+        :param id_positions: int32 array of ID -> position in candidates, -1 for IDs not in the catalog.
+        :param pages: The candidates, split into pages.
+        :param phases: Dictionary of normalized trial phase -> positions of the candidates in that phase.
+        :param sponsors: Same, by sponsor.
+        :param mechanisms: Same, by mechanism.
+        :param tokens: Same, by every word of the candidate's name and sponsors.
+        :param sorted_tokens: The keys of tokens, sorted, to look words up by prefix.
+        """
+        self.candidates: Tuple[VaccineCandidate, ...] = candidates
+        self.ids: Dict[str, int] = ids
+        self.id_positions: numpy.ndarray = id_positions
+        self.pages: Tuple[Tuple[VaccineCandidate, ...], ...] = pages
+        self.phases: Dict[str, Tuple[int, ...]] = phases
+        self.sponsors: Dict[str, Tuple[int, ...]] = sponsors
+        self.mechanisms: Dict[str, Tuple[int, ...]] = mechanisms
+        self.tokens: Dict[str, Tuple[int, ...]] = tokens
+        self.sorted_tokens: Tuple[str, ...] = sorted_tokens
+
+    @classmethod
+    def build(cls, data: Iterable[dict], previous: Optional["VaccineCatalog"] = None,
+              page_size: int = PAGE_SIZE) -> "VaccineCatalog":
+        """
+        :param data: The candidates, as returned by disease.sh's /vaccine endpoint.
+        :param previous: Optional: the catalog of the last refresh. Candidates it has keep their IDs, new ones get the
+                         next free ones.
+        :param page_size: How many candidates per page.
+        """
+        ids = dict(previous.ids) if previous is not None else {}
+        next_id = max(ids.values(), default=0) + 1
+        seen = collections.Counter()
+        candidates = []
+        for item in data:
+            key = candidate_key(item)
+            seen[key] += 1
+            if seen[key] > 1:  # same name and sponsors listed more than once
+                key = f"{key}#{seen[key]}"
+            if key not in ids:
+                ids[key] = next_id
+                next_id += 1
+            candidates.append(VaccineCandidate.from_json(ids[key], item))
+        candidates = tuple(sorted(candidates, key=lambda candidate: candidate.id))
+        id_positions = numpy.full(next_id, -1, dtype=numpy.int32)
+        id_positions[[candidate.id for candidate in candidates]] = numpy.arange(len(candidates), dtype=numpy.int32)
+        pages = tuple(candidates[i:i + page_size] for i in range(0, len(candidates), page_size))
+        tokens = _index((i, [word for name in (candidate.candidate,) + candidate.sponsors
+                             for word in normalize_name(name).split()])
+                        for i, candidate in enumerate(candidates))
+        return cls(candidates, ids, id_positions, pages,
+                   phases=_index((i, [candidate.trial_phase]) for i, candidate in enumerate(candidates)),
+                   sponsors=_index((i, candidate.sponsors) for i, candidate in enumerate(candidates)),
+                   mechanisms=_index((i, [candidate.mechanism]) for i, candidate in enumerate(candidates)),
+                   tokens=tokens, sorted_tokens=tuple(sorted(tokens)))
+
+    def __len__(self) -> int:
+        return len(self.candidates)
+
+    @property
+    def page_count(self) -> int:
+        return len(self.pages)
+
+    def page(self, number: int) -> Optional[Tuple[VaccineCandidate, ...]]:
+        """
+        Returns the candidates on a page (the first one is 1), or None if there's no such page.
+        """
+        if not 0 < number <= len(self.pages):
+            return None
+        return self.pages[number - 1]
+
+    def get(self, candidate_id: int) -> Optional[VaccineCandidate]:
+        if not 0 <= candidate_id < len(self.id_positions):
+            return None
+        position = int(self.id_positions[candidate_id])
+        return self.candidates[position] if position >= 0 else None
+
+    def _lookup(self, index: Dict[str, Tuple[int, ...]], key: str) -> List[VaccineCandidate]:
+        return [self.candidates[i] for i in index.get(normalize_name(key), ())]
+
+    def by_phase(self, phase: str) -> List[VaccineCandidate]:
+        return self._lookup(self.phases, phase)
+
+    def by_sponsor(self, sponsor: str) -> List[VaccineCandidate]:
+        return self._lookup(self.sponsors, sponsor)
+
+    def by_mechanism(self, mechanism: str) -> List[VaccineCandidate]:
+        return self._lookup(self.mechanisms, mechanism)
+
+    def _token_positions(self, word: str) -> set:
+        """
+        Positions of the candidates with a word starting with the given one in their name or sponsors.
+        """
+        positions = set()
+        start = bisect.bisect_left(self.sorted_tokens, word)
+        for token in self.sorted_tokens[start:]:
+            if not token.startswith(word):
+                break
+            positions.update(self.tokens[token])
+        return positions
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[VaccineCandidate]:
+        """
+        Finds the candidates whose name or sponsors have every word of the query (or words starting with them, so
+        "pfiz" finds Pfizer). Case and accents don't matter.
+
+        :return: The matching candidates, by ID.
+        """
+        words = normalize_name(query).split()
+        if not words:
+            return []
+        positions = self._token_positions(words[0])
+        for word in words[1:]:
+            positions &= self._token_positions(word)
+        return [self.candidates[i] for i in sorted(positions)[:limit]]
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    # python -m utils.vaccine_catalog: builds a catalog out of synthetic candidates, and compares looking up a page and
+    # a candidate with rebuilding the ID dictionary on every page view (like the vaccine command used to)
+    rng = random.Random(0)
+    words = ["vaccine", "mrna", "adenovirus", "protein", "subunit", "inactivated", "vector", "dna", "peptide", "rna"]
+    data = [{"candidate": f"{rng.choice(words).title()} {i}", "mechanism": rng.choice(words),
+             "sponsors": [f"Sponsor {rng.randrange(100)}" for _ in range(rng.randint(1, 3))],
+             "details": "Lorem ipsum " * 50, "trialPhase": f"Phase {rng.randint(1, 3)}",
+             "institutions": [f"Institution {rng.randrange(200)}"]} for i in range(2000)]
+
+    start = time.perf_counter()
+    catalog = VaccineCatalog.build(data)
+    print(f"Building, {len(data)} candidates: {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    rng.shuffle(data)
+    reordered = VaccineCatalog.build(data, previous=catalog)
+    assert all(reordered.get(candidate.id) == candidate for candidate in catalog.candidates)
+    print("IDs survive the upstream order changing")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        ids = {item["details"]: i for i, item in enumerate(data)}
+        [ids[item["details"]] for item in data[24:48]]
+    print(f"Page view rebuilding the IDs: {(time.perf_counter() - start):.3f}ms")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        catalog.page(2), catalog.get(1234)
+    print(f"Page view and details from the catalog: {(time.perf_counter() - start):.4f}ms")
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        catalog.search("mrna spons")
+    print(f"Search: {(time.perf_counter() - start):.3f}ms ({len(catalog.search('mrna spons'))} results)")